@@ -1,11 +1,14 @@
 from __future__ import annotations
-import requests
 from langchain_openai import AzureChatOpenAI
 from langchain.agents import initialize_agent, AgentType
 from langchain.tools import StructuredTool
-from langchain.memory import ConversationBufferMemory
 from pydantic import BaseModel
+from typing import List, Literal, Optional
 from dotenv import load_dotenv
+from mes_client import AsyncMESClient, MESClient
+from mes_memory import ConversationMemory
+from mes_format import format_bulk, format_routings, format_sfc, format_sfcs, format_summary
+from urllib.parse import urlencode
 import os
 import json
 from pydantic import TypeAdapter
@@ -22,30 +25,19 @@ llm = AzureChatOpenAI(
     temperature=0
 )
 
-BASE_URL = "http://mock-mes.italynorth.azurecontainer.io:80"
+# === CLIENT MES (MES_BASE_URL, timeout, retry e pool: vedi mes_client.py) ===
+mes = MESClient()
+mes_async = AsyncMESClient(mes)   # stesse chiamate da coroutine, per eseguire i tool in parallelo
+BASE_URL = mes.base_url
 
 # =======================
 # UTILITY FUNCTIONS
 # =======================
 def safe_post(url, payload=None):
-    try:
-        resp = requests.post(url, json=payload, timeout=5)
-        resp.raise_for_status()
-        return resp.text
-    except requests.exceptions.HTTPError as e:
-        return f"HTTPError {resp.status_code}: {resp.text}"
-    except Exception as e:
-        return f"Errore POST {url}: {str(e)}"
+    return mes.post(url, payload)
 
 def safe_get(url):
-    try:
-        resp = requests.get(url, timeout=5)
-        resp.raise_for_status()
-        return resp.text
-    except requests.exceptions.HTTPError as e:
-        return f"HTTPError {resp.status_code}: {resp.text}"
-    except Exception as e:
-        return f"Errore GET {url}: {str(e)}"
+    return mes.get(url)
 
 # =======================
 # MODELLI INPUT STRUCTURED
@@ -58,6 +50,17 @@ class SFCAndRoutingInput(BaseModel):
     sfc_id: str
     routing_id: str
 
+class SFCFilterInput(BaseModel):
+    sfc_state: Optional[str] = None
+    routing: Optional[str] = None
+
+class SFCBatchInput(BaseModel):
+    action: Literal["advance", "complete", "force_advance", "rollback", "rollback_single"]
+    sfc_ids: Optional[List[str]] = None
+    routing: Optional[str] = None
+    sfc_state: Optional[str] = None
+    step: Optional[int] = None
+
 # =======================
 # MES TOOLS
 # =======================
@@ -138,9 +141,12 @@ def complete_operation_tool_func(input: str):
     return safe_post(f"{BASE_URL}/sfc/{sfc_id}/complete")
 
 def get_sfc_tool_func(input: str):
-    """Restituisce lo stato completo dello SFC. Input: ID SFC"""
+    """
+    Restituisce lo stato dello SFC in una riga: routing, stato, step in work e stati
+    delle operazioni in ordine (done*3 = 3 operazioni consecutive done). Input: ID SFC
+    """
     sfc_id = input.strip()
-    return safe_get(f"{BASE_URL}/sfc/{sfc_id}")
+    return format_sfc(safe_get(f"{BASE_URL}/sfc/{sfc_id}?view=compact"))
 
 def get_routing_state_tool_func(input: str):
     """Restituisce lo stato del routing associato a uno SFC. Input: ID SFC"""
@@ -148,35 +154,58 @@ def get_routing_state_tool_func(input: str):
     return safe_get(f"{BASE_URL}/sfc/{sfc_id}/routing_state")
 
 def get_all_sfcs_tool_func(input: str = ""):
-    """Restituisce tutti gli SFC presenti nel sistema."""
-    return safe_get(f"{BASE_URL}/sfcs")
+    """Restituisce il numero di SFC per stato e per routing e i primi SFC del sistema (una riga ciascuno)."""
+    summary = format_summary(safe_get(f"{BASE_URL}/sfcs/summary"))
+    return summary + "\n" + format_sfcs(safe_get(f"{BASE_URL}/sfcs?view=compact&limit={mes.settings.list_limit}"))
+
+def find_sfcs_tool_func(input: SFCFilterInput):
+    """
+    Cerca gli SFC filtrando lato server per stato ("New", "In Work", "Done") e/o routing.
+    Input JSON: {"sfc_state":"In Work","routing":"ROUTING1"} (entrambi opzionali)
+    """
+    query = {k: v for k, v in (("sfc_state", input.sfc_state), ("routing", input.routing)) if v}
+    query.update(view="compact", limit=mes.settings.list_limit)
+    return format_sfcs(safe_get(f"{BASE_URL}/sfcs?{urlencode(query)}"))
+
+def transition_sfcs_tool_func(input: SFCBatchInput):
+    """
+    Applica la stessa transizione a molti SFC con una sola chiamata (eseguita lato server),
+    al posto di una chiamata per SFC. action: advance, complete, force_advance, rollback, rollback_single;
+    step solo per force_advance e rollback. SFC: lista sfc_ids oppure tutti quelli selezionati da routing e/o sfc_state.
+    Input JSON: {"action":"advance","routing":"ROUTING1","sfc_state":"In Work"} oppure {"action":"force_advance","sfc_ids":["SFCMOCK1","SFCMOCK2"],"step":3}
+    """
+    return format_bulk(mes.bulk(input.action, input.sfc_ids, input.routing, input.sfc_state, input.step), input.action)
 
 def get_all_routings_tool_func(input: str = ""):
-    """Restituisce tutti i routing presenti nel sistema."""
-    return safe_get(f"{BASE_URL}/routings")
+    """Restituisce tutti i routing presenti nel sistema con il numero di operazioni."""
+    return format_routings(safe_get(f"{BASE_URL}/routings?view=compact"))
 
 # =======================
 # CREAZIONE TOOLS STRUCTURED
 # =======================
 efTools = [
-    StructuredTool.from_function(create_sfc_tool_func, name="create_sfc", description=create_sfc_tool_func.__doc__),
-    StructuredTool.from_function(create_routing_tool_func, name="create_routing", description=create_routing_tool_func.__doc__),
-    StructuredTool.from_function(assign_routing_tool_func, name="assign_routing", description=assign_routing_tool_func.__doc__),
-    StructuredTool.from_function(advance_operation_tool_func, name="advance_operation", description=advance_operation_tool_func.__doc__),
-    StructuredTool.from_function(rollback_wrapper, name="rollback", description=rollback_tool_func.__doc__),
-    StructuredTool.from_function(rollback_single_tool_func, name="rollback_single", description=rollback_single_tool_func.__doc__),
-    StructuredTool.from_function(force_advance_tool_wrapper, name="force_advance", description=force_advance_tool_func.__doc__),
-    StructuredTool.from_function(complete_operation_tool_func, name="complete_operation", description=complete_operation_tool_func.__doc__),
-    StructuredTool.from_function(get_sfc_tool_func, name="get_sfc", description=get_sfc_tool_func.__doc__),
-    StructuredTool.from_function(get_routing_state_tool_func, name="get_routing_state", description=get_routing_state_tool_func.__doc__),
-    StructuredTool.from_function(get_all_sfcs_tool_func, name="get_all_sfcs", description=get_all_sfcs_tool_func.__doc__),
-    StructuredTool.from_function(get_all_routings_tool_func, name="get_all_routings", description=get_all_routings_tool_func.__doc__),
+    StructuredTool.from_function(create_sfc_tool_func, coroutine=mes_async.tool(create_sfc_tool_func), name="create_sfc", description=create_sfc_tool_func.__doc__),
+    StructuredTool.from_function(create_routing_tool_func, coroutine=mes_async.tool(create_routing_tool_func), name="create_routing", description=create_routing_tool_func.__doc__),
+    StructuredTool.from_function(assign_routing_tool_func, coroutine=mes_async.tool(assign_routing_tool_func), name="assign_routing", description=assign_routing_tool_func.__doc__),
+    StructuredTool.from_function(advance_operation_tool_func, coroutine=mes_async.tool(advance_operation_tool_func), name="advance_operation", description=advance_operation_tool_func.__doc__),
+    StructuredTool.from_function(rollback_wrapper, coroutine=mes_async.tool(rollback_wrapper), name="rollback", description=rollback_tool_func.__doc__),
+    StructuredTool.from_function(rollback_single_tool_func, coroutine=mes_async.tool(rollback_single_tool_func), name="rollback_single", description=rollback_single_tool_func.__doc__),
+    StructuredTool.from_function(force_advance_tool_wrapper, coroutine=mes_async.tool(force_advance_tool_wrapper), name="force_advance", description=force_advance_tool_func.__doc__),
+    StructuredTool.from_function(complete_operation_tool_func, coroutine=mes_async.tool(complete_operation_tool_func), name="complete_operation", description=complete_operation_tool_func.__doc__),
+    StructuredTool.from_function(get_sfc_tool_func, coroutine=mes_async.tool(get_sfc_tool_func), name="get_sfc", description=get_sfc_tool_func.__doc__),
+    StructuredTool.from_function(get_routing_state_tool_func, coroutine=mes_async.tool(get_routing_state_tool_func), name="get_routing_state", description=get_routing_state_tool_func.__doc__),
+    StructuredTool.from_function(get_all_sfcs_tool_func, coroutine=mes_async.tool(get_all_sfcs_tool_func), name="get_all_sfcs", description=get_all_sfcs_tool_func.__doc__),
+    StructuredTool.from_function(find_sfcs_tool_func, coroutine=mes_async.tool(find_sfcs_tool_func), name="find_sfcs", description=find_sfcs_tool_func.__doc__),
+    StructuredTool.from_function(transition_sfcs_tool_func, coroutine=mes_async.tool(transition_sfcs_tool_func), name="transition_sfcs", description=transition_sfcs_tool_func.__doc__),
+    StructuredTool.from_function(get_all_routings_tool_func, coroutine=mes_async.tool(get_all_routings_tool_func), name="get_all_routings", description=get_all_routings_tool_func.__doc__),
 ]
 
 # =======================
 # MEMORIA CONVERSAZIONE
 # =======================
-memory = ConversationBufferMemory(memory_key="chat_history", return_messages=True)
+# Ultimi turni per intero più riassunto progressivo dei precedenti (MES_MEMORY_*, vedi mes_memory.py):
+# il prompt resta limitato anche in sessioni lunghe
+memory = ConversationMemory.from_env(llm)
 
 # =======================
 # CREAZIONE AGENTE
@@ -185,33 +214,27 @@ agent = initialize_agent(
     tools=efTools,
     llm=llm,
     agent=AgentType.OPENAI_FUNCTIONS,
-    memory=memory,
     verbose=True
 )
 
 # =======================
 # CHAT INTERATTIVA
 # =======================
-print("Benvenuto nel tuo agente MES. Digita 'exit' per uscire.\n")
-chat_history = []
-
-while True:
-    user_input = input("Tu: ")
-    if user_input.lower() in ["exit", "quit"]:
-        print("Chiusura agente...")
-        break
-
-    chat_history.append({"role": "user", "content": user_input})
-
-    try:
-        # Passiamo l'intero storico concatenato come testo
-        conversation_text = "\n".join(
-            [f"{'Utente' if msg['role']=='user' else 'Agente'}: {msg['content']}" for msg in chat_history]
-        )
-
-        response = agent.run(conversation_text)
-        chat_history.append({"role": "assistant", "content": response})
-        print(f"Agente: {response}\n")
-
-    except Exception as e:
-        print(f"Errore durante l'elaborazione: {str(e)}\n")
+# Solo se eseguito come script: importandolo (es. bench/agent_eval.py) si ottengono i tool senza chat
+if __name__ == "__main__":
+    print("Benvenuto nel tuo agente MES. Digita 'exit' per uscire.\n")
+
+    while True:
+        user_input = input("Tu: ")
+        if user_input.lower() in ["exit", "quit"]:
+            print("Chiusura agente...")
+            break
+
+        try:
+            # Riassunto e ultimi turni, non l'intero storico
+            response = agent.run(memory.prompt(user_input))
+            memory.add_turn(user_input, response)
+            print(f"Agente: {response}\n")
+
+        except Exception as e:
+            print(f"Errore durante l'elaborazione: {str(e)}\n")
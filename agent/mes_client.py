@@ -0,0 +1,229 @@
+"""Client HTTP del mock MES condiviso dagli agenti LangChain.
+
+Una sola sessione requests con pool di connessioni keep-alive, timeout e retry con
+backoff configurabili da variabili d'ambiente (lette dopo load_dotenv):
+
+- MES_BASE_URL: indirizzo del server (default: il container su Azure)
+- MES_TIMEOUT / MES_CONNECT_TIMEOUT: secondi di attesa della risposta e della connessione
+- MES_RETRIES: tentativi ripetuti sugli errori transitori
+- MES_BACKOFF: fattore del backoff esponenziale tra i tentativi (0,3 → 0,3 s, 0,6 s, 1,2 s...)
+- MES_POOL_SIZE: connessioni tenute aperte verso il server (e chiamate async concorrenti)
+- MES_LIST_LIMIT: SFC al massimo negli elenchi restituiti dai tool (il resto si filtra)
+- MES_CACHE_SIZE: letture con ETag tenute in cache (0 = nessuna cache)
+
+Le GET si ripetono su errori di connessione/lettura e su 429, 502, 503, 504; le POST
+(advance, rollback... non sono idempotenti) solo se la connessione non è stata
+stabilita, quando il server non ha ancora ricevuto la richiesta.
+Le GET con ETag (es. /sfc/<id>) restano in cache: la lettura successiva dello stesso
+URL invia If-None-Match e, se lo SFC non è cambiato (304), riusa il testo in cache.
+bulk() applica una transizione a molti SFC con gli endpoint /bulk del server: una
+chiamata di tool e poche richieste HTTP al posto di una per SFC.
+AsyncMESClient esegue le stesse chiamate da coroutine, così i tool degli agenti
+possono girare in parallelo (ad esempio con asyncio.gather o AgentExecutor.ainvoke).
+"""
+import asyncio
+from collections import OrderedDict, deque
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+DEFAULT_BASE_URL = "http://mock-mes.italynorth.azurecontainer.io:80"
+RETRY_STATUSES = (429, 502, 503, 504)
+# SFC al massimo per richiesta bulk (MAX_BULK_ITEMS del server)
+BULK_LIMIT = 10000
+
+
+class ClientSettings:
+    """Configurazione del client (default sovrascrivibili con MES_*)"""
+
+    def __init__(self, base_url=DEFAULT_BASE_URL, timeout=5.0, connect_timeout=3.0,
+                 retries=3, backoff=0.3, pool_size=10, list_limit=50, cache_size=256):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = float(timeout)
+        self.connect_timeout = float(connect_timeout)
+        self.retries = int(retries)
+        self.backoff = float(backoff)
+        self.pool_size = int(pool_size)
+        self.list_limit = int(list_limit)
+        self.cache_size = int(cache_size)
+
+    @classmethod
+    def from_env(cls, environ=None):
+        env = os.environ if environ is None else environ
+        return cls(
+            base_url=env.get("MES_BASE_URL", DEFAULT_BASE_URL),
+            timeout=env.get("MES_TIMEOUT", 5.0),
+            connect_timeout=env.get("MES_CONNECT_TIMEOUT", 3.0),
+            retries=env.get("MES_RETRIES", 3),
+            backoff=env.get("MES_BACKOFF", 0.3),
+            pool_size=env.get("MES_POOL_SIZE", 10),
+            list_limit=env.get("MES_LIST_LIMIT", 50),
+            cache_size=env.get("MES_CACHE_SIZE", 256),
+        )
+
+
+class MESClient:
+    """Chiamate al MES su una sessione keep-alive.
+    post e get restituiscono sempre una stringa (il body, oppure il messaggio di errore),
+    come si aspettano i tool degli agenti.
+    """
+
+    def __init__(self, settings=None):
+        self.settings = settings or ClientSettings.from_env()
+        retry = Retry(
+            total=self.settings.retries,
+            backoff_factor=self.settings.backoff,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=frozenset({"GET", "HEAD"}),
+            raise_on_status=False,
+            respect_retry_after_header=True,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.settings.pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        # URL -> (ETag, testo) delle ultime GET, in ordine di uso (LRU)
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self.cache_hits = 0
+
+    @property
+    def base_url(self):
+        return self.settings.base_url
+
+    def url(self, path):
+        """URL completo: accetta anche URL assoluti"""
+        return path if "://" in path else f"{self.settings.base_url}/{path.lstrip('/')}"
+
+    def request(self, method, path, payload=None, headers=None):
+        """Risposta requests (solleva le eccezioni di rete dopo i retry)"""
+        timeout = (self.settings.connect_timeout, self.settings.timeout)
+        return self.session.request(method, self.url(path), json=payload, headers=headers, timeout=timeout)
+
+    def _cached(self, url):
+        with self._cache_lock:
+            entry = self._cache.get(url)
+            if entry is not None:
+                self._cache.move_to_end(url)
+            return entry
+
+    def _store(self, url, etag, text):
+        with self._cache_lock:
+            self._cache[url] = (etag, text)
+            self._cache.move_to_end(url)
+            if len(self._cache) > self.settings.cache_size:
+                self._cache.popitem(last=False)
+
+    def _call(self, method, path, payload=None):
+        url = self.url(path)
+        cached = self._cached(url) if method == "GET" and self.settings.cache_size else None
+        headers = {"If-None-Match": cached[0]} if cached is not None else None
+        try:
+            resp = self.request(method, url, payload, headers)
+        except Exception as e:
+            return f"Errore {method} {url}: {str(e)}"
+        if resp.status_code == 304 and cached is not None:
+            self.cache_hits += 1
+            return cached[1]
+        if resp.status_code >= 400:
+            return f"HTTPError {resp.status_code}: {resp.text}"
+        etag = resp.headers.get("ETag")
+        if method == "GET" and etag and self.settings.cache_size:
+            self._store(url, etag, resp.text)
+        return resp.text
+
+    def post(self, path, payload=None):
+        return self._call("POST", path, payload)
+
+    def get(self, path):
+        return self._call("GET", path)
+
+    def bulk(self, action, sfc_ids=None, routing=None, sfc_state=None, step=None):
+        """Transizione su molti SFC con POST /bulk/<action> (eseguita lato server): sfc_ids
+        oppure gli SFC selezionati da routing e/o sfc_state. Le liste oltre BULK_LIMIT sono
+        divise in più richieste, le selezioni proseguono con next_cursor.
+        Restituisce il JSON dei risultati uniti (vista compatta) o il messaggio di errore.
+        Se una richiesta successiva fallisce, le precedenti sono già applicate dal server:
+        il JSON riporta i loro risultati, l'errore in "error" e gli SFC senza esito in "unconfirmed".
+        """
+        base = {"view": "compact"}
+        if step is not None:
+            base["step"] = step
+        if sfc_ids is not None:
+            pending = deque(dict(base, sfc_ids=sfc_ids[i:i + BULK_LIMIT]) for i in range(0, len(sfc_ids), BULK_LIMIT))
+        else:
+            pending = deque([dict(base, **{k: v for k, v in (("routing", routing), ("sfc_state", sfc_state)) if v})])
+        merged = {"results": [], "ok": 0, "failed": 0}
+        sent = False
+        while pending:
+            payload = pending.popleft()
+            text = self.post(f"/bulk/{action}", payload)
+            try:
+                data = json.loads(text)
+            except ValueError:
+                if not sent:
+                    return text
+                merged["error"] = text
+                if sfc_ids is not None:
+                    merged["unconfirmed"] = payload["sfc_ids"] + [i for p in pending for i in p["sfc_ids"]]
+                break
+            sent = True
+            merged["results"].extend(data["results"])
+            merged["ok"] += data["ok"]
+            merged["failed"] += data["failed"]
+            if data.get("next_cursor") is not None:
+                pending.append(dict(payload, cursor=data["next_cursor"]))
+        return json.dumps(merged)
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class AsyncMESClient:
+    """Versione per coroutine: le chiamate del MESClient girano in un pool di thread
+    grande quanto il pool di connessioni, quindi fino a pool_size richieste alla volta
+    senza aprire connessioni in più.
+    """
+
+    def __init__(self, client=None):
+        self.client = client or MESClient()
+        self._executor = ThreadPoolExecutor(self.client.settings.pool_size, thread_name_prefix="mes-client")
+
+    @property
+    def base_url(self):
+        return self.client.base_url
+
+    async def call(self, func, *args, **kwargs):
+        """Esegue func (una chiamata o un tool sincrono) senza bloccare il loop"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(func, *args, **kwargs))
+
+    async def post(self, path, payload=None):
+        return await self.call(self.client.post, path, payload)
+
+    async def get(self, path):
+        return await self.call(self.client.get, path)
+
+    def tool(self, func):
+        """Coroutine per il parametro coroutine= di Tool/StructuredTool a partire dal tool sincrono"""
+        async def run(*args, **kwargs):
+            return await self.call(func, *args, **kwargs)
+        run.__name__ = func.__name__
+        run.__doc__ = func.__doc__
+        return run
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        self.client.close()
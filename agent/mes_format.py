@@ -0,0 +1,98 @@
+"""Formattazione compatta delle risposte del MES per il contesto dell'LLM.
+
+I tool degli agenti leggono le viste compatte del server (?view=compact, /sfcs/summary)
+e le riducono a una riga per SFC, ad esempio:
+
+    SFCMOCK1 ROUTING3 In Work step 4: bypassed*3,in work,blank*5
+
+"done*3" indica 3 operazioni consecutive in stato done; lo step è l'indice (da 1)
+dell'operazione in work, lo stesso usato da rollback e force_advance.
+Le risposte che non sono JSON (errori HTTP o di rete) passano invariate.
+"""
+from collections import Counter
+import json
+
+
+def _parse(text):
+    try:
+        return json.loads(text)
+    except ValueError:
+        return None
+
+def sfc_line(sfc_id, view):
+    """Una riga per SFC dalla sua vista compatta"""
+    if view.get("routing") is None:
+        return f"{sfc_id} {view.get('sfc_state', 'New')} (senza routing)"
+    line = f"{sfc_id} {view['routing']} {view['sfc_state']}"
+    if view.get("step") is not None:
+        line += f" step {view['step']}"
+    return f"{line}: {view['ops']}"
+
+def format_sfc(text):
+    """GET /sfc/<id>?view=compact -> una riga"""
+    data = _parse(text)
+    if not isinstance(data, dict) or "sfc_id" not in data:
+        return text
+    return sfc_line(data["sfc_id"], data)
+
+def format_sfcs(text):
+    """GET /sfcs?view=compact (anche paginato) -> una riga per SFC"""
+    data = _parse(text)
+    if not isinstance(data, dict):
+        return text
+    paged = "next_cursor" in data
+    sfcs = data["sfcs"] if paged else data
+    lines = [sfc_line(sfc_id, view) for sfc_id, view in sfcs.items()]
+    if not lines:
+        lines.append("Nessuno SFC")
+    if paged and data["next_cursor"] is not None:
+        lines.append(f"... elenco troncato a {len(sfcs)} SFC: filtrare per stato o routing")
+    return "\n".join(lines)
+
+def format_summary(text):
+    """GET /sfcs/summary -> totale, SFC per stato e per routing"""
+    data = _parse(text)
+    if not isinstance(data, dict) or "by_state" not in data:
+        return text
+    states = ", ".join(f"{state} {n}" for state, n in data["by_state"].items() if n)
+    scope = f"SFC del routing {data['routing']}" if "routing" in data else "SFC totali"
+    line = f"{scope}: {data['total']}" + (f" ({states})" if states else "")
+    if data.get("by_routing"):
+        line += "\nPer routing: " + ", ".join(f"{r} {n}" for r, n in data["by_routing"].items())
+    return line
+
+def format_routings(text):
+    """GET /routings?view=compact -> numero di operazioni per routing"""
+    data = _parse(text)
+    if not isinstance(data, dict):
+        return text
+    if not data:
+        return "Nessun routing"
+    return "Operazioni per routing: " + ", ".join(f"{r} {n}" for r, n in data.items())
+
+def format_bulk(text, action, limit=5):
+    """POST /bulk/<azione> (vista compatta) -> esito, SFC per stato dopo la transizione,
+    errori raggruppati per messaggio (al massimo limit SFC elencati per errore) ed errore
+    della richiesta che ha interrotto l'operazione
+    """
+    data = _parse(text)
+    if not isinstance(data, dict) or "results" not in data:
+        return text
+    if not data["results"]:
+        return f"{action}: nessuno SFC selezionato"
+    line = f"{action}: {data['ok']} SFC ok, {data['failed']} falliti"
+    states = Counter(r["sfc_state"] for r in data["results"] if r["status"] == 200)
+    if states:
+        line += " (ora " + ", ".join(f"{state} {n}" for state, n in sorted(states.items())) + ")"
+    errors = {}
+    for r in data["results"]:
+        if r["status"] != 200:
+            errors.setdefault(r.get("error", f"status {r['status']}"), []).append(r["sfc_id"])
+    for error, sfc_ids in errors.items():
+        more = f" e altri {len(sfc_ids) - limit}" if len(sfc_ids) > limit else ""
+        line += f"\n{error}: {', '.join(map(str, sfc_ids[:limit]))}{more}"
+    if "error" in data:
+        line += f"\nInterrotto: {data['error']}"
+        if data.get("unconfirmed"):
+            line += f" ({len(data['unconfirmed'])} SFC senza esito)"
+    return line
@@ -0,0 +1,130 @@
+"""Memoria della conversazione degli agenti, di dimensione limitata.
+
+Prima ogni turno rimandava all'LLM tutto lo storico, due volte (il testo concatenato
+della chat e la ConversationBufferMemory): prompt e latenza crescevano senza limite.
+Ora il prompt contiene:
+- un riassunto progressivo dei turni più vecchi, lungo al massimo summary_chars
+- gli ultimi window turni per intero (ciascun messaggio troncato a turn_chars)
+Quando i turni in finestra superano window + summarize_every, i più vecchi vengono fusi
+nel riassunto con una sola chiamata a summarize(riassunto, turni): il costo del
+riassunto si distribuisce su summarize_every turni.
+
+Configurazione da variabili d'ambiente (lette dopo load_dotenv):
+MES_MEMORY_WINDOW, MES_MEMORY_SUMMARIZE_EVERY, MES_MEMORY_SUMMARY_CHARS,
+MES_MEMORY_TURN_CHARS, MES_MEMORY_SUMMARIZER (llm: riassunto dell'LLM,
+truncate: coda dei turni più recenti, senza chiamate all'LLM).
+"""
+import os
+
+SUMMARY_PROMPT = """Aggiorna il riassunto di una conversazione tra un operatore e un agente MES.
+Conserva ID di SFC e routing, step, operazioni eseguite ed esiti, richieste ancora aperte.
+Al massimo {limit} caratteri, in italiano, senza preamboli.
+
+Riassunto attuale:
+{summary}
+
+Nuovi scambi:
+{turns}
+
+Riassunto aggiornato:"""
+
+
+class MemorySettings:
+    """Dimensioni della memoria (default sovrascrivibili con MES_MEMORY_*)"""
+
+    def __init__(self, window=6, summarize_every=4, summary_chars=1500, turn_chars=2000, summarizer="llm"):
+        if summarizer not in ("llm", "truncate"):
+            raise ValueError(f"Invalid summarizer: {summarizer}")
+        self.window = max(1, int(window))
+        self.summarize_every = max(1, int(summarize_every))
+        self.summary_chars = int(summary_chars)
+        self.turn_chars = int(turn_chars)
+        self.summarizer = summarizer
+
+    @classmethod
+    def from_env(cls, environ=None):
+        env = os.environ if environ is None else environ
+        return cls(
+            window=env.get("MES_MEMORY_WINDOW", 6),
+            summarize_every=env.get("MES_MEMORY_SUMMARIZE_EVERY", 4),
+            summary_chars=env.get("MES_MEMORY_SUMMARY_CHARS", 1500),
+            turn_chars=env.get("MES_MEMORY_TURN_CHARS", 2000),
+            summarizer=env.get("MES_MEMORY_SUMMARIZER", "llm"),
+        )
+
+
+def clip(text, limit):
+    return text if len(text) <= limit else text[:limit] + " [...]"
+
+def format_turns(turns):
+    """Turni nel formato usato dagli agenti: "Utente: ..." / "Agente: ..." """
+    return "\n".join(f"Utente: {user}\nAgente: {agent}" for user, agent in turns)
+
+def truncate_summarizer(limit):
+    """summarize senza LLM: accoda i turni al riassunto e ne tiene gli ultimi limit caratteri"""
+    def summarize(summary, turns):
+        text = (summary + "\n" if summary else "") + format_turns(turns)
+        return text[-limit:]
+    return summarize
+
+def llm_summarizer(llm, limit):
+    """summarize che chiede all'LLM (un chat model LangChain) di aggiornare il riassunto"""
+    def summarize(summary, turns):
+        prompt = SUMMARY_PROMPT.format(limit=limit, summary=summary or "(vuoto)", turns=format_turns(turns))
+        result = llm.invoke(prompt)
+        return getattr(result, "content", result).strip()
+    return summarize
+
+
+class ConversationMemory:
+    """Finestra degli ultimi turni più riassunto progressivo dei precedenti"""
+
+    def __init__(self, summarize=None, settings=None):
+        self.settings = settings or MemorySettings.from_env()
+        self._fallback = truncate_summarizer(self.settings.summary_chars)
+        self.summarize = summarize or self._fallback
+        self.summary = ""
+        self.turns = []             # (utente, agente) ancora in finestra
+        self.summarized_turns = 0
+        self.summary_calls = 0
+
+    @classmethod
+    def from_env(cls, llm=None):
+        """Memoria configurata da MES_MEMORY_*: riassume con l'LLM se richiesto e disponibile"""
+        settings = MemorySettings.from_env()
+        summarize = None
+        if llm is not None and settings.summarizer == "llm":
+            summarize = llm_summarizer(llm, settings.summary_chars)
+        return cls(summarize, settings)
+
+    def prompt(self, user_input):
+        """Testo da passare all'agente: riassunto, ultimi turni e messaggio corrente"""
+        parts = []
+        if self.summary:
+            parts.append(f"Riassunto della conversazione precedente:\n{self.summary}\n")
+        parts.extend(f"Utente: {user}\nAgente: {agent}" for user, agent in self.turns)
+        parts.append(f"Utente: {user_input}")
+        return "\n".join(parts)
+
+    def add_turn(self, user_input, response):
+        limit = self.settings.turn_chars
+        self.turns.append((clip(user_input, limit), clip(response, limit)))
+        if len(self.turns) >= self.settings.window + self.settings.summarize_every:
+            self._compact()
+
+    def _compact(self):
+        """Fonde nel riassunto i turni usciti dalla finestra"""
+        cut = len(self.turns) - self.settings.window
+        old, self.turns = self.turns[:cut], self.turns[cut:]
+        try:
+            summary = self.summarize(self.summary, old)
+        except Exception:
+            # Se il riassunto fallisce (es. errore dell'LLM) la memoria resta comunque limitata
+            summary = self._fallback(self.summary, old)
+        self.summary = clip(summary, self.settings.summary_chars)
+        self.summarized_turns += len(old)
+        self.summary_calls += 1
+
+    def clear(self):
+        self.summary = ""
+        self.turns = []
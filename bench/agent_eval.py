@@ -0,0 +1,348 @@
+"""Valutazione offline dei tool degli agenti: chiamate, latenza e correttezza su task multi-step.
+
+Esegue gli efTools di agent/mes-agent.py (Tool, input testuale) e di
+agent/mes-agent-structuredTool.py (StructuredTool) contro l'app Flask in-process,
+senza Azure né container:
+- i moduli degli agenti sono importati senza avviare la chat; le loro sessioni
+  requests passano dal test client Flask (AppAdapter), quindi il codice dei tool
+  e di mes_client (retry, cache ETag) è quello reale
+- l'LLM è sostituito da un piano scritto per ogni task: un generatore che sceglie
+  il prossimo tool in base all'osservazione precedente, come farebbe l'agente
+  (un passo LLM per chiamata di tool più la risposta finale)
+- a ogni ripetizione lo stato è rigenerato con seed fisso; alla fine di ogni task lo
+  stato del server è confrontato con quello atteso
+
+Per task e variante riporta chiamate di tool, passi LLM, richieste HTTP, tempo e
+correttezza; per tool le latenze (media, p50, p95). Con --llm-ms stima il tempo
+end-to-end aggiungendo la latenza di un passo LLM.
+
+    python bench/agent_eval.py
+    python bench/agent_eval.py --repeat 20 --llm-ms 800 --save /tmp/agent_eval.json
+"""
+import argparse
+import importlib.util
+import json
+import os
+import re
+import statistics
+import sys
+import threading
+import time
+from urllib.parse import urlsplit
+
+from clients import ROOT, LocalClient, load_module
+
+import requests
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+
+AGENT_DIR = os.path.join(ROOT, "agent")
+VARIANTS = {
+    "tool": "mes-agent.py",
+    "structured": "mes-agent-structuredTool.py",
+}
+# Indirizzo fittizio su cui è montato l'adapter verso l'app in-process
+EVAL_URL = "http://mes-eval"
+SEED = 42
+STEP = re.compile(r" step (\d+)")
+SFC_LINE = re.compile(r"^(SFCMOCK\d+) \S+ In Work step (\d+)", re.M)
+
+
+class AppAdapter(BaseAdapter):
+    """Transport di requests verso il test client Flask: conta le richieste e il tempo nell'app"""
+
+    def __init__(self, app):
+        super().__init__()
+        self.app = app
+        self.requests = 0
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        url = urlsplit(request.url)
+        path = url.path + (f"?{url.query}" if url.query else "")
+        started = time.perf_counter()
+        resp = self.app.test_client().open(path, method=request.method, data=request.body,
+                                           headers=dict(request.headers))
+        body = resp.get_data()
+        with self._lock:
+            self.requests += 1
+            self.seconds += time.perf_counter() - started
+
+        response = requests.Response()
+        response.status_code = resp.status_code
+        response.reason = resp.status.split(" ", 1)[-1]
+        response.headers = CaseInsensitiveDict(resp.headers.items())
+        response.encoding = resp.mimetype_params.get("charset", "utf-8")
+        response._content = body
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+def load_agent(variant, adapter):
+    """{nome: tool} di un agente, con la sessione del client montata sull'adapter"""
+    os.environ["MES_BASE_URL"] = EVAL_URL
+    os.environ.setdefault("AZURE_OPENAI_API_KEY", "offline")   # l'LLM è costruito ma non chiamato
+    if AGENT_DIR not in sys.path:
+        sys.path.insert(0, AGENT_DIR)
+    name = VARIANTS[variant][:-3].replace("-", "_")
+    spec = importlib.util.spec_from_file_location(name, os.path.join(AGENT_DIR, VARIANTS[variant]))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    module.mes.session.mount(EVAL_URL, adapter)
+    return {tool.name: tool for tool in module.efTools}
+
+
+def tool_input(variant, tool, payload):
+    """Input del tool come lo produrrebbe l'LLM: testo (ID o JSON) per Tool,
+    argomenti per StructuredTool (oggetto se il parametro non è una stringa)
+    """
+    text = payload if isinstance(payload, str) else json.dumps(payload) if payload else ""
+    if variant == "tool":
+        return text
+    (arg, schema), = tool.args.items()
+    return {arg: text if schema.get("type") == "string" else payload}
+
+
+# ---------------------------
+# Task: piano dell'LLM scritto (generatore che riceve le osservazioni) e verifica
+# ---------------------------
+def compact(client, sfc_id):
+    return client.request("GET", f"/sfc/{sfc_id}?view=compact")[1]
+
+def sfc_state(observation):
+    """sfc_state dalla risposta JSON di una transizione"""
+    try:
+        return json.loads(observation).get("sfc_state")
+    except ValueError:
+        return None
+
+
+def rollback_then_force(ctx):
+    yield "get_sfc", "SFCMOCK3"
+    yield "rollback", {"sfc_id": "SFCMOCK3", "step": 2}
+    yield "force_advance", {"sfc_id": "SFCMOCK3", "step": 5}
+    return (yield "get_sfc", "SFCMOCK3")
+
+def check_rollback_then_force(client, ctx, answer):
+    view = compact(client, "SFCMOCK3")
+    return view["step"] == 5 and view["ops"].startswith("done,bypassed*3,in work")
+
+
+def advance_until_done(ctx):
+    observation = yield "get_sfc", "SFCMOCK5"
+    for _ in range(20):
+        observation = yield "advance_operation", "SFCMOCK5"
+        if sfc_state(observation) == "Done":
+            break
+    return observation
+
+def check_advance_until_done(client, ctx, answer):
+    return compact(client, "SFCMOCK5")["sfc_state"] == "Done"
+
+
+def new_sfc(ctx):
+    ctx["routing"] = json.loads((yield "create_routing", {"operations": 4}))["routing_id"]
+    ctx["sfc"] = json.loads((yield "create_sfc", ""))["sfc_id"]
+    yield "assign_routing", {"sfc_id": ctx["sfc"], "routing_id": ctx["routing"]}
+    yield "advance_operation", ctx["sfc"]
+    yield "advance_operation", ctx["sfc"]
+    return (yield "get_sfc", ctx["sfc"])
+
+def check_new_sfc(client, ctx, answer):
+    view = compact(client, ctx["sfc"])
+    return view["routing"] == ctx["routing"] and view["step"] == 3 and view["ops"] == "done*2,in work,blank"
+
+
+def count_in_work(ctx):
+    observation = yield "find_sfcs", {"sfc_state": "In Work", "routing": "ROUTING1"}
+    # Elenco troncato a MES_LIST_LIMIT: il conteggio è solo un minimo
+    at_least = "almeno " if "elenco troncato" in observation else ""
+    return f"Sul routing ROUTING1 ci sono {at_least}{len(SFC_LINE.findall(observation))} SFC in lavorazione"
+
+def check_count_in_work(client, ctx, answer):
+    expected = client.request("GET", "/routings/ROUTING1/summary")[1]["by_state"].get("In Work", 0)
+    count = int(re.search(r"(\d+) SFC in lavorazione", answer).group(1))
+    return count <= expected if "almeno" in answer else count == expected
+
+
+def step_back_single(ctx):
+    observation = yield "get_sfc", "SFCMOCK7"
+    step = int(STEP.search(observation).group(1))
+    for target in (step, step - 1):
+        yield "rollback_single", {"sfc_id": "SFCMOCK7", "step": target}
+    return (yield "get_sfc", "SFCMOCK7")
+
+def setup_step_back_single(client, ctx):
+    client.request("POST", "/sfc/SFCMOCK7/force_advance", {"step": 4})
+
+def check_step_back_single(client, ctx, answer):
+    view = compact(client, "SFCMOCK7")
+    return view["step"] == 2 and view["ops"].startswith("bypassed,in work,blank")
+
+
+def advance_routing(ctx):
+    observation = yield "find_sfcs", {"sfc_state": "In Work", "routing": "ROUTING2"}
+    ctx["steps"] = {sfc_id: int(step) for sfc_id, step in SFC_LINE.findall(observation)}
+    for sfc_id in ctx["steps"]:
+        yield "advance_operation", sfc_id
+    return f"Avanzati {len(ctx['steps'])} SFC"
+
+def check_advance_routing(client, ctx, answer):
+    for sfc_id, step in ctx["steps"].items():
+        view = compact(client, sfc_id)
+        if view["step"] != step + 1 and view["sfc_state"] != "Done":
+            return False
+    return bool(ctx["steps"])
+
+
+def advance_routing_bulk(ctx):
+    return (yield "transition_sfcs", {"action": "advance", "routing": "ROUTING2", "sfc_state": "In Work"})
+
+def setup_advance_routing_bulk(client, ctx):
+    sfcs = client.request("GET", "/sfcs?view=compact&routing=ROUTING2&sfc_state=In%20Work")[1]
+    ctx["steps"] = {sfc_id: view["step"] for sfc_id, view in sfcs.items()}
+
+
+# (nome, richiesta dell'operatore, piano, verifica, preparazione non misurata)
+TASKS = [
+    ("rollback_force", "Riporta SFCMOCK3 allo step 2 e poi forzalo allo step 5",
+     rollback_then_force, check_rollback_then_force, None),
+    ("advance_until_done", "Completa tutte le operazioni di SFCMOCK5",
+     advance_until_done, check_advance_until_done, None),
+    ("new_sfc", "Crea un routing da 4 operazioni e uno SFC, assegnalo e avanzalo di due operazioni",
+     new_sfc, check_new_sfc, None),
+    ("count_in_work", "Quanti SFC sono in lavorazione sul routing ROUTING1?",
+     count_in_work, check_count_in_work, None),
+    ("step_back_single", "Riporta indietro SFCMOCK7 di due operazioni, una alla volta",
+     step_back_single, check_step_back_single, setup_step_back_single),
+    ("advance_routing", "Avanza tutti gli SFC in lavorazione sul routing ROUTING2",
+     advance_routing, check_advance_routing, None),
+    ("advance_routing_bulk", "Avanza tutti gli SFC in lavorazione sul routing ROUTING2 (transition_sfcs)",
+     advance_routing_bulk, check_advance_routing, setup_advance_routing_bulk),
+]
+
+
+def run_plan(variant, tools, plan, ctx, tool_times):
+    """Esegue il piano come il loop dell'agente: (risposta finale, chiamate di tool).
+    Gli errori dei tool diventano l'osservazione, come con handle_tool_error.
+    """
+    steps = plan(ctx)
+    calls = 0
+    try:
+        name, payload = next(steps)
+        while True:
+            tool = tools[name]
+            started = time.perf_counter()
+            try:
+                observation = tool.invoke(tool_input(variant, tool, payload))
+            except Exception as e:
+                observation = f"Errore {name}: {e}"
+            tool_times.setdefault(name, []).append((time.perf_counter() - started) * 1000)
+            calls += 1
+            name, payload = steps.send(observation)
+    except StopIteration as stop:
+        return stop.value, calls
+
+
+def fresh_state(module, sfcs):
+    """Stato nuovo con dataset fisso nell'app mock-mes (SFCMOCK1..n, ROUTING1..3, 6-10 operazioni)"""
+    from mes_api import MESApi
+    from mes_core import MESState
+    from mes_feed import ChangeFeed
+    from mes_generator import ShopFloorProfile, generate
+    from mes_simulation import Simulation
+
+    state = MESState()
+    generate(state, ShopFloorProfile(seed=SEED, sfcs=sfcs, routings=3, operations="6-10"))
+    module.state = state
+    module.api = MESApi(state, ChangeFeed(state), Simulation(state))
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def evaluate(variant, module, adapter, repeat, sfcs):
+    """Risultati per task e latenze per tool di una variante"""
+    tools = load_agent(variant, adapter)
+    client = LocalClient(module.app)
+    tool_times = {}
+    tasks = {name: {"calls": [], "llm_steps": [], "http": [], "ms": [], "ok": 0} for name, *_ in TASKS}
+    for _ in range(repeat):
+        fresh_state(module, sfcs)
+        for name, _, plan, check, setup in TASKS:
+            ctx = {}
+            if setup is not None:
+                setup(client, ctx)
+            http_before = adapter.requests
+            started = time.perf_counter()
+            answer, calls = run_plan(variant, tools, plan, ctx, tool_times)
+            elapsed = (time.perf_counter() - started) * 1000
+            row = tasks[name]
+            row["calls"].append(calls)
+            row["llm_steps"].append(calls + 1)
+            row["http"].append(adapter.requests - http_before)
+            row["ms"].append(elapsed)
+            row["ok"] += bool(check(client, ctx, answer))
+    for row in tasks.values():
+        for key in ("calls", "llm_steps", "http", "ms"):
+            row[key] = statistics.median(row[key])
+        row["ms"] = round(row["ms"], 2)
+    per_tool = {
+        name: {"calls": len(times), "mean_ms": round(statistics.fmean(times), 3),
+               "p50_ms": round(percentile(times, 50), 3), "p95_ms": round(percentile(times, 95), 3)}
+        for name, times in sorted(tool_times.items())
+    }
+    return {"tasks": tasks, "tools": per_tool}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--variants", default=",".join(VARIANTS), help="tool, structured")
+    parser.add_argument("--repeat", type=int, default=5, help="ripetizioni di ogni task (stato rigenerato)")
+    parser.add_argument("--sfcs", type=int, default=20, help="SFC nel dataset")
+    parser.add_argument("--llm-ms", type=float, default=0, help="latenza stimata di un passo LLM per il tempo end-to-end")
+    parser.add_argument("--save", help="salva i risultati in JSON")
+    args = parser.parse_args()
+
+    module = load_module()
+    adapter = AppAdapter(module.app)
+    results = {}
+    for variant in args.variants.split(","):
+        result = evaluate(variant, module, adapter, args.repeat, args.sfcs)
+        results[variant] = result
+        print(f"\n== {variant} ({VARIANTS[variant]}), {args.repeat} ripetizioni")
+        print(f"{'task':<22} {'tool':>5} {'LLM':>5} {'HTTP':>5} {'ms':>9}"
+              + (f" {'e2e ms':>9}" if args.llm_ms else "") + f" {'ok':>7}")
+        for name, row in result["tasks"].items():
+            line = f"{name:<22} {row['calls']:>5} {row['llm_steps']:>5} {row['http']:>5} {row['ms']:>9.2f}"
+            if args.llm_ms:
+                line += f" {row['ms'] + row['llm_steps'] * args.llm_ms:>9.0f}"
+            print(f"{line} {row['ok']:>3}/{args.repeat}")
+        print(f"\n{'tool':<20} {'chiamate':>9} {'media':>8} {'p50':>8} {'p95':>8}  (ms)")
+        for name, row in result["tools"].items():
+            print(f"{name:<20} {row['calls']:>9} {row['mean_ms']:>8.3f} {row['p50_ms']:>8.3f} {row['p95_ms']:>8.3f}")
+
+    failed = sum(args.repeat - row["ok"] for result in results.values() for row in result["tasks"].values())
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"meta": {"repeat": args.repeat, "sfcs": args.sfcs, "seed": SEED, "llm_ms": args.llm_ms,
+                                "date": time.strftime("%Y-%m-%d %H:%M:%S")},
+                       "prompts": {name: prompt for name, prompt, *_ in TASKS},
+                       "results": results}, f, indent=2)
+            f.write("\n")
+        print(f"\nrisultati salvati in {args.save}")
+    if failed:
+        print(f"\nFALLITO: {failed} esecuzioni con stato finale errato")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
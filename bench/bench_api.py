@@ -0,0 +1,305 @@
+"""Benchmark dell'API REST del mock MES con cicli di vita SFC realistici.
+
+Ogni thread ripete il ciclo create -> assign_routing -> advance xN ->
+rollback/force_advance -> GET, intervallato da letture di SFC esistenti e
+dagli elenchi (/sfcs paginato e filtrato, /routings/<id>/sfcs e, per dataset
+piccoli, /sfcs completo). Per ogni dimensione del dataset e livello di
+concorrenza riporta throughput e latenze p50/p95/p99 per endpoint.
+
+    python bench/bench_api.py                                # in-process, 1k/10k/100k SFC, 1/4/16 thread
+    python bench/bench_api.py --sizes 1000,1000000 --concurrency 1,8 --duration 10
+    python bench/bench_api.py --http                         # server locale avviato per ogni dimensione
+    python bench/bench_api.py --http --server gunicorn       # idem con gunicorn.conf.py
+    python bench/bench_api.py --http --server async          # idem con il server asyncio (mes_async.py)
+    python bench/bench_api.py --url http://localhost:80      # server già in esecuzione (dataset suo)
+    python bench/bench_api.py --save bench/baseline.json
+    python bench/bench_api.py --compare bench/baseline.json  # esce con 1 se ci sono regressioni
+
+I dataset sono generati con mes_generator (seed fisso), quindi i risultati di
+esecuzioni diverse sono confrontabili.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import threading
+import time
+from collections import defaultdict
+
+from clients import SERVERS, HTTPClient, LocalClient, load_module, local_server
+
+SEED = 42
+ROUTINGS = 50
+# Profilo dei dataset: SFC a metà lavorazione e completati, routing da 5 a 15 operazioni
+PROFILE = {"operations": "5-15", "state_mix": "in_work=0.7,done=0.3", "progress": "uniform"}
+
+
+def percentile(values, q):
+    """Percentile per rango più vicino su una lista ordinata"""
+    if not values:
+        return None
+    k = max(0, min(len(values) - 1, round(q / 100 * len(values) + 0.5) - 1))
+    return values[k]
+
+
+# ---------------------------
+# Carico
+# ---------------------------
+class Worker:
+    """Un utente virtuale: esegue cicli di vita SFC e registra le latenze per endpoint"""
+
+    def __init__(self, client, rng, routing_ids, existing, args):
+        self.client = client
+        self.rng = rng
+        self.routing_ids = routing_ids
+        self.existing = existing
+        self.args = args
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def call(self, label, method, path, payload=None):
+        start = time.perf_counter()
+        status, body = self.client.send(method, path, payload)
+        self.latencies[label].append(time.perf_counter() - start)
+        if status >= 400:
+            self.errors[label] += 1
+            return None
+        return body
+
+    def lifecycle(self):
+        rng = self.rng
+        body = self.call("POST /sfc", "POST", "/sfc")
+        sfc_id = json.loads(body)["sfc_id"]
+        body = self.call("POST /sfc/<id>/assign_routing", "POST", f"/sfc/{sfc_id}/assign_routing",
+                         {"routing_id": rng.choice(self.routing_ids)})
+        n = len(json.loads(body)["operations"])
+        current = 1
+        for _ in range(rng.randint(1, max(1, n - 1))):
+            self.call("POST /sfc/<id>/advance", "POST", f"/sfc/{sfc_id}/advance")
+            current = min(current + 1, n)
+        if rng.random() < 0.5:
+            self.call("POST /sfc/<id>/rollback", "POST", f"/sfc/{sfc_id}/rollback",
+                      {"step": rng.randint(1, current)})
+        else:
+            self.call("POST /sfc/<id>/force_advance", "POST", f"/sfc/{sfc_id}/force_advance",
+                      {"step": rng.randint(current, n)})
+        self.call("GET /sfc/<id>", "GET", f"/sfc/{sfc_id}")
+        self.call("GET /sfc/<id>", "GET", f"/sfc/{self.existing()}")
+
+    def listings(self, size):
+        rng = self.rng
+        cursor = rng.randrange(size) if size else 0
+        self.call("GET /sfcs?limit=100", "GET", f"/sfcs?limit=100&cursor={cursor}")
+        self.call("GET /sfcs?state&fields&limit", "GET", "/sfcs?state=Done&fields=sfc_state&limit=100")
+        self.call("GET /routings/<id>/sfcs?limit", "GET",
+                  f"/routings/{rng.choice(self.routing_ids)}/sfcs?fields=sfc_state&limit=100")
+        if size is not None and size <= self.args.full_list_max:
+            self.call("GET /sfcs (full)", "GET", "/sfcs")
+
+    def run(self, deadline, size):
+        done = 0
+        while time.perf_counter() < deadline:
+            self.lifecycle()
+            done += 1
+            if done % self.args.list_every == 0:
+                self.listings(size)
+
+
+def run_level(make_client, size, concurrency, args):
+    """Esegue il carico con concurrency thread per args.duration secondi"""
+    setup = make_client()
+    _, routings = setup.request("GET", "/routings?limit=1000")
+    routing_ids = list(routings["routings"])
+    if size:
+        existing_ids = None
+    else:
+        _, page = setup.request("GET", "/sfcs?fields=sfc_state&limit=1000")
+        existing_ids = list(page["sfcs"])
+
+    workers = []
+    for i in range(concurrency):
+        rng = random.Random(SEED * 1000 + i)
+        if existing_ids is None:
+            existing = lambda rng=rng: f"SFCMOCK{rng.randint(1, size)}"
+        else:
+            existing = lambda rng=rng: rng.choice(existing_ids)
+        workers.append(Worker(make_client(), rng, routing_ids, existing, args))
+
+    barrier = threading.Barrier(concurrency + 1)
+    failures = []
+
+    def target(worker):
+        barrier.wait()
+        try:
+            worker.run(deadline, size)
+        except Exception as e:
+            failures.append(repr(e))
+
+    threads = [threading.Thread(target=target, args=(w,)) for w in workers]
+    for t in threads:
+        t.start()
+    deadline = time.perf_counter() + args.duration
+    barrier.wait()
+    start = time.perf_counter()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    if failures:
+        raise RuntimeError(f"worker falliti: {failures[:3]}")
+
+    merged = defaultdict(list)
+    errors = defaultdict(int)
+    for w in workers:
+        for label, values in w.latencies.items():
+            merged[label].extend(values)
+        for label, count in w.errors.items():
+            errors[label] += count
+    endpoints = {}
+    for label in sorted(merged):
+        values = sorted(merged[label])
+        endpoints[label] = {
+            "count": len(values),
+            "rps": round(len(values) / elapsed, 1),
+            "errors": errors[label],
+            "p50_ms": round(percentile(values, 50) * 1000, 3),
+            "p95_ms": round(percentile(values, 95) * 1000, 3),
+            "p99_ms": round(percentile(values, 99) * 1000, 3),
+        }
+    total = sum(e["count"] for e in endpoints.values())
+    return {
+        "size": size,
+        "concurrency": concurrency,
+        "seconds": round(elapsed, 2),
+        "requests": total,
+        "throughput": round(total / elapsed, 1),
+        "endpoints": endpoints,
+    }
+
+
+# ---------------------------
+# Dataset e server
+# ---------------------------
+def profile_env(size):
+    return {
+        "MES_SEED": str(SEED), "MES_SFCS": str(size), "MES_ROUTINGS": str(ROUTINGS),
+        "MES_OPERATIONS": PROFILE["operations"], "MES_STATE_MIX": PROFILE["state_mix"],
+        "MES_PROGRESS": PROFILE["progress"],
+    }
+
+def inprocess_targets(sizes):
+    """Per ogni dimensione: stato nuovo generato nel modulo mock-mes, client sul test client"""
+    module = load_module()
+    from mes_core import MESState
+    from mes_generator import ShopFloorProfile, generate
+
+    for size in sizes:
+        module.state = MESState()
+        generate(module.state, ShopFloorProfile(seed=SEED, sfcs=size, routings=ROUTINGS, **PROFILE))
+        yield size, lambda: LocalClient(module.app)
+
+def http_targets(sizes, server):
+    """Per ogni dimensione avvia un server locale con il dataset generato e lo ferma alla fine"""
+    for size in sizes:
+        with local_server(server, profile_env(size)) as url:
+            yield size, lambda: HTTPClient(url)
+
+
+# ---------------------------
+# Report e confronto
+# ---------------------------
+def print_level(result):
+    size = result["size"] if result["size"] is not None else "?"
+    print(f"\n== {size} SFC, {result['concurrency']} thread: "
+          f"{result['requests']} richieste, {result['throughput']:.0f} req/s")
+    print(f"{'endpoint':36} {'n':>7} {'req/s':>8} {'err':>5} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for label, e in result["endpoints"].items():
+        print(f"{label:36} {e['count']:>7} {e['rps']:>8.1f} {e['errors']:>5} "
+              f"{e['p50_ms']:>8.2f} {e['p95_ms']:>8.2f} {e['p99_ms']:>8.2f}")
+
+def compare(results, baseline, tolerance):
+    """Regressioni rispetto alla baseline: p95 più alto o throughput più basso oltre la tolleranza"""
+    base = {(r["size"], r["concurrency"]): r for r in baseline["results"]}
+    regressions = []
+    for r in results:
+        b = base.get((r["size"], r["concurrency"]))
+        if b is None:
+            continue
+        where = f"{r['size']} SFC x {r['concurrency']} thread"
+        if r["throughput"] < b["throughput"] * (1 - tolerance):
+            regressions.append(f"{where}: throughput {b['throughput']} -> {r['throughput']} req/s")
+        for label, e in r["endpoints"].items():
+            be = b["endpoints"].get(label)
+            if be and e["p95_ms"] > be["p95_ms"] * (1 + tolerance):
+                regressions.append(f"{where}: {label} p95 {be['p95_ms']} -> {e['p95_ms']} ms")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1000,10000,100000", help="dimensioni dei dataset (SFC)")
+    parser.add_argument("--concurrency", default="1,4,16", help="livelli di concorrenza (thread)")
+    parser.add_argument("--duration", type=float, default=5.0, help="secondi per livello")
+    parser.add_argument("--list-every", type=int, default=10, help="elenchi ogni N cicli di vita")
+    parser.add_argument("--full-list-max", type=int, default=10000,
+                        help="GET /sfcs completo solo fino a questa dimensione")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--http", action="store_true", help="avvia un server locale per ogni dimensione")
+    mode.add_argument("--url", help="server già in esecuzione (usa il suo dataset)")
+    parser.add_argument("--server", choices=tuple(SERVERS), default="flask")
+    parser.add_argument("--save", help="salva i risultati in JSON (baseline)")
+    parser.add_argument("--compare", help="baseline JSON con cui confrontare i risultati")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="peggioramento ammesso (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",")]
+    levels = [int(c) for c in args.concurrency.split(",")]
+    if args.url:
+        targets = [(None, lambda: HTTPClient(args.url))]
+        mode_name = "url"
+    elif args.http:
+        targets = http_targets(sizes, args.server)
+        mode_name = f"http-{args.server}"
+    else:
+        targets = inprocess_targets(sizes)
+        mode_name = "inprocess"
+
+    results = []
+    for size, make_client in targets:
+        for concurrency in levels:
+            result = run_level(make_client, size, concurrency, args)
+            print_level(result)
+            results.append(result)
+
+    report = {
+        "meta": {
+            "mode": mode_name,
+            "duration": args.duration,
+            "seed": SEED,
+            "profile": PROFILE,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+        },
+        "results": results,
+    }
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+        print(f"\nrisultati salvati in {args.save}")
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print(f"\nREGRESSIONI rispetto a {args.compare}:")
+            for r in regressions:
+                print(" -", r)
+            sys.exit(1)
+        print(f"\nnessuna regressione rispetto a {args.compare}")
+
+
+if __name__ == "__main__":
+    main()
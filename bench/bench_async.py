@@ -0,0 +1,241 @@
+"""Confronto tra server su un core: richieste al secondo e connessioni tenute aperte.
+
+Per ogni server (default gunicorn e async) avvia un'istanza vincolata a un solo core
+con lo stesso dataset e misura:
+- req/s e latenze con N connessioni keep-alive concorrenti (GET /sfc/<id> e advance)
+- connessioni tenute: apre K stream SSE su /events, conta quelli stabiliti, crea uno
+  SFC e conta quanti stream ricevono l'evento; riporta la latenza della richiesta
+  fatta con gli stream aperti e la memoria del server (da /metrics)
+
+    python bench/bench_async.py
+    python bench/bench_async.py --servers flask,gunicorn,async --concurrency 1,64 --streams 100,1000,10000
+    python bench/bench_async.py --server-cpu 0 --client-cpu 1 --save /tmp/async.json
+
+Il generatore di carico è un client asyncio in questo processo: su una macchina con
+un solo core server e client se lo contendono e i req/s vanno letti come confronto
+relativo tra i server, non come valori assoluti.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import resource
+import time
+
+from clients import SERVERS, local_server
+
+DATASET = {"MES_SEED": "42", "MES_SFCS": "10000", "MES_ROUTINGS": "50", "MES_OPERATIONS": "5-15",
+           "MES_STATE_MIX": "in_work=1", "MES_PROGRESS": "uniform"}
+SFCS = 10000
+
+_CONTENT_LENGTH = re.compile(rb"\r\ncontent-length: *(\d+)", re.I)
+_CLOSE = re.compile(rb"\r\nconnection: *close", re.I)
+_RSS = re.compile(r"^process_resident_memory_bytes (\d+)", re.M)
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class Connection:
+    """Connessione HTTP/1.1 keep-alive minimale (risposte con Content-Length)"""
+
+    def __init__(self, host, port):
+        self.host, self.port = host, port
+        self.reader = self.writer = None
+
+    async def call(self, method, path, body=b""):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        head = f"{method} {path} HTTP/1.1\r\nHost: {self.host}\r\nContent-Length: {len(body)}\r\n"
+        if body:
+            head += "Content-Type: application/json\r\n"
+        self.writer.write(head.encode() + b"\r\n" + body)
+        response = await self.reader.readuntil(b"\r\n\r\n")
+        m = _CONTENT_LENGTH.search(response)
+        data = await self.reader.readexactly(int(m.group(1))) if m else b""
+        if _CLOSE.search(response):
+            self.close()
+        return int(response[9:12]), data
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.reader = self.writer = None
+
+
+# ---------------------------
+# Throughput
+# ---------------------------
+async def throughput(host, port, concurrency, duration, write_ratio):
+    """concurrency client keep-alive per duration secondi: (req/s, p50 ms, p99 ms, errori)"""
+    latencies, errors = [], 0
+    deadline = time.perf_counter() + duration
+
+    async def worker(seed):
+        nonlocal errors
+        rng = random.Random(seed)
+        conn = Connection(host, port)
+        try:
+            while time.perf_counter() < deadline:
+                sfc = f"SFCMOCK{rng.randint(1, SFCS)}"
+                started = time.perf_counter()
+                try:
+                    if rng.random() < write_ratio:
+                        status, _ = await conn.call("POST", f"/sfc/{sfc}/advance")
+                    else:
+                        status, _ = await conn.call("GET", f"/sfc/{sfc}")
+                except (OSError, asyncio.IncompleteReadError):
+                    conn.close()
+                    errors += 1
+                    continue
+                latencies.append(time.perf_counter() - started)
+                errors += status >= 500
+        finally:
+            conn.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "errors": errors,
+    }
+
+
+# ---------------------------
+# Connessioni tenute (stream SSE)
+# ---------------------------
+async def open_stream(host, port, timeout):
+    """Stream SSE aperto (reader, writer) o None se il server non lo stabilisce entro timeout"""
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    except (OSError, asyncio.TimeoutError):
+        return None
+    try:
+        writer.write(f"GET /events?types=sfc_created HTTP/1.1\r\nHost: {host}\r\n\r\n".encode())
+        await asyncio.wait_for(reader.readuntil(b"retry: 3000\n\n"), timeout)
+        return reader, writer
+    except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+        writer.close()
+        return None
+
+async def held_connections(host, port, count, timeout):
+    """Apre count stream SSE e verifica che ricevano un evento"""
+    gate = asyncio.Semaphore(200)           # connessioni in apertura contemporaneamente
+
+    async def opener():
+        async with gate:
+            return await open_stream(host, port, timeout)
+
+    started = time.perf_counter()
+    streams = [s for s in await asyncio.gather(*(opener() for _ in range(count))) if s is not None]
+    open_seconds = time.perf_counter() - started
+
+    probe = Connection(host, port)
+    started = time.perf_counter()
+    try:
+        await asyncio.wait_for(probe.call("POST", "/sfc"), timeout)
+        probe_ms = round((time.perf_counter() - started) * 1000, 2)
+    except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+        probe_ms = None
+
+    async def receives(reader):
+        try:
+            await asyncio.wait_for(reader.readuntil(b"event: sfc_created"), timeout)
+            return True
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            return False
+
+    delivered = sum(await asyncio.gather(*(receives(reader) for reader, _ in streams))) if probe_ms else 0
+    rss = None
+    try:
+        _, metrics = await asyncio.wait_for(probe.call("GET", "/metrics"), timeout)
+        m = _RSS.search(metrics.decode())
+        rss = int(m.group(1)) if m else None
+    except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+        pass
+    probe.close()
+    for _, writer in streams:
+        writer.close()
+    await asyncio.sleep(0.5)                # lascia chiudere le sottoscrizioni al server
+    return {
+        "streams": count,
+        "established": len(streams),
+        "open_s": round(open_seconds, 2),
+        "delivered": delivered,
+        "request_ms": probe_ms,
+        "rss_mb": round(rss / 2**20, 1) if rss else None,
+    }
+
+
+def raise_fd_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    return resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--servers", default="gunicorn,async", help=f"server da confrontare ({', '.join(SERVERS)})")
+    parser.add_argument("--concurrency", default="1,16,256", help="connessioni concorrenti per il throughput")
+    parser.add_argument("--duration", type=float, default=5.0, help="secondi per livello di concorrenza")
+    parser.add_argument("--write-ratio", type=float, default=0.2, help="quota di advance (il resto è GET /sfc)")
+    parser.add_argument("--streams", default="100,1000,5000", help="stream SSE tenuti aperti")
+    parser.add_argument("--timeout", type=float, default=5.0, help="attesa massima per stream ed eventi")
+    parser.add_argument("--server-cpu", type=int, default=0, help="core a cui vincolare il server")
+    parser.add_argument("--client-cpu", type=int, help="core a cui vincolare il client (default: nessun vincolo)")
+    parser.add_argument("--save", help="salva i risultati in JSON")
+    args = parser.parse_args()
+
+    fd_limit = raise_fd_limit()
+    if args.client_cpu is not None:
+        os.sched_setaffinity(0, {args.client_cpu})
+    levels = [int(c) for c in args.concurrency.split(",")]
+    stream_levels = [int(s) for s in args.streams.split(",") if s]
+    too_many = [s for s in stream_levels if 2 * s + 100 > fd_limit]
+    if too_many:
+        print(f"attenzione: limite di file descriptor {fd_limit}, troppo basso per {too_many} stream")
+
+    report = {"meta": {"dataset": DATASET, "duration": args.duration, "write_ratio": args.write_ratio,
+                       "server_cpu": args.server_cpu, "cpus": os.cpu_count(),
+                       "date": time.strftime("%Y-%m-%d %H:%M:%S")}, "servers": {}}
+    for server in args.servers.split(","):
+        with local_server(server, DATASET, cpus={args.server_cpu}) as url:
+            host, port = url.rsplit("//", 1)[1].split(":")
+            port = int(port)
+            print(f"\n== {server} (core {args.server_cpu})")
+            print(f"{'conn':>6} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'err':>5}")
+            rates = []
+            for concurrency in levels:
+                r = asyncio.run(throughput(host, port, concurrency, args.duration, args.write_ratio))
+                print(f"{r['concurrency']:>6} {r['rps']:>9.1f} {r['p50_ms']:>8.2f} {r['p99_ms']:>8.2f} {r['errors']:>5}")
+                rates.append(r)
+            print(f"{'stream':>6} {'aperti':>7} {'in s':>6} {'evento':>7} {'req ms':>8} {'RSS MB':>7}")
+            held = []
+            for count in stream_levels:
+                h = asyncio.run(held_connections(host, port, count, args.timeout))
+                print(f"{h['streams']:>6} {h['established']:>7} {h['open_s']:>6.2f} {h['delivered']:>7} "
+                      f"{h['request_ms'] if h['request_ms'] is not None else 'timeout':>8} {h['rss_mb'] or '-':>7}")
+                held.append(h)
+            report["servers"][server] = {"throughput": rates, "held": held}
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+        print(f"\nrisultati salvati in {args.save}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""Token e latenza dei tool degli agenti: risposte complete contro viste compatte.
+
+Avvia un server locale con un dataset grande e, per ogni lettura che fanno i tool,
+confronta la risposta grezza (quello che i tool passavano all'LLM) con l'output
+compatto attuale (?view=compact, /sfcs/summary, formattato da agent/mes_format.py):
+byte, token e tempo del tool (richiesta HTTP + formattazione, mediana su --repeat).
+
+    python bench/bench_compact.py
+    python bench/bench_compact.py --sfcs 1000000 --server async --save /tmp/compact.json
+
+I token si contano con tiktoken (o200k_base, il tokenizer di GPT-4o) se installato,
+altrimenti con una stima basata sulla pre-tokenizzazione di quel tokenizer
+(parole, gruppi di 3 cifre, punteggiatura): la stessa per entrambe le rappresentazioni.
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import sys
+import time
+
+from clients import SERVERS, local_server
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "agent"))
+from mes_client import ClientSettings, MESClient
+from mes_format import format_routings, format_sfc, format_sfcs, format_summary
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# Contesto di GPT-4o
+CONTEXT_TOKENS = 128000
+
+_PIECES = re.compile(r"'(?:[sdmt]|ll|ve|re)| ?[^\W\d_]+| ?\d{1,3}| ?[^\s\w]+|\s+")
+
+
+def token_counter():
+    """(nome, funzione testo -> token)"""
+    if tiktoken is not None:
+        encoding = tiktoken.get_encoding("o200k_base")
+        return "tiktoken o200k_base", lambda text: len(encoding.encode(text, disallowed_special=()))
+    return "stima", lambda text: sum(1 for _ in _PIECES.finditer(text))
+
+
+def scenarios(client, sample_sfc, limit):
+    """(nome, tool prima, tool dopo): funzioni senza argomenti che restituiscono il testo per l'LLM"""
+    get = client.get
+    return [
+        ("get_all_sfcs", lambda: get("/sfcs"),
+         lambda: format_summary(get("/sfcs/summary")) + "\n" + format_sfcs(get(f"/sfcs?view=compact&limit={limit}"))),
+        ("tutti gli SFC, compatti", lambda: get("/sfcs"),
+         lambda: format_sfcs(get("/sfcs?view=compact"))),
+        ("SFC in work (find_sfcs)", lambda: get("/sfcs?sfc_state=In%20Work"),
+         lambda: format_sfcs(get(f"/sfcs?view=compact&sfc_state=In%20Work&limit={limit}"))),
+        ("SFC di un routing (find_sfcs)", lambda: get("/routings/ROUTING1/sfcs"),
+         lambda: format_sfcs(get(f"/sfcs?view=compact&routing=ROUTING1&limit={limit}"))),
+        ("get_sfc", lambda: get(f"/sfc/{sample_sfc}"),
+         lambda: format_sfc(get(f"/sfc/{sample_sfc}?view=compact"))),
+        ("get_all_routings", lambda: get("/routings"),
+         lambda: format_routings(get("/routings?view=compact"))),
+    ]
+
+
+def measure(tool, repeat):
+    """(testo, mediana dei tempi in ms)"""
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        text = tool()
+        times.append((time.perf_counter() - started) * 1000)
+    return text, statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sfcs", type=int, default=100000, help="SFC nel dataset")
+    parser.add_argument("--routings", type=int, default=50)
+    parser.add_argument("--server", default="flask", choices=sorted(SERVERS))
+    parser.add_argument("--limit", type=int, default=50, help="SFC per elenco negli output compatti (MES_LIST_LIMIT)")
+    parser.add_argument("--repeat", type=int, default=5, help="ripetizioni per la mediana dei tempi")
+    parser.add_argument("--save", help="salva i risultati in JSON")
+    args = parser.parse_args()
+
+    dataset = {"MES_SEED": "42", "MES_SFCS": str(args.sfcs), "MES_ROUTINGS": str(args.routings),
+               "MES_OPERATIONS": "5-15", "MES_STATE_MIX": "in_work=0.7,done=0.2,unassigned=0.1",
+               "MES_PROGRESS": "uniform", "MES_BYPASS_RATE": "0.05"}
+    tokenizer, count_tokens = token_counter()
+    results = []
+    with local_server(args.server, dataset) as url:
+        client = MESClient(ClientSettings(base_url=url, timeout=600, retries=0))
+        print(f"{args.sfcs} SFC, server {args.server}, token: {tokenizer}\n")
+        print(f"{'tool':<30} {'':>6} {'byte':>12} {'token':>12} {'ms':>9} {'in 128k':>8}")
+        for name, before, after in scenarios(client, "SFCMOCK7", args.limit):
+            row = {"tool": name}
+            for label, tool in (("prima", before), ("dopo", after)):
+                text, ms = measure(tool, args.repeat)
+                tokens = count_tokens(text)
+                row[label] = {"bytes": len(text.encode()), "tokens": tokens, "ms": round(ms, 2)}
+                print(f"{name if label == 'prima' else '':<30} {label:>6} {len(text.encode()):>12,} {tokens:>12,} "
+                      f"{ms:>9.2f} {'sì' if tokens <= CONTEXT_TOKENS else 'no':>8}")
+            row["token_ratio"] = round(row["prima"]["tokens"] / max(1, row["dopo"]["tokens"]), 1)
+            row["time_ratio"] = round(row["prima"]["ms"] / max(1e-3, row["dopo"]["ms"]), 1)
+            print(f"{'':<30} {'':>6} {'':>12} {row['token_ratio']:>11}x {row['time_ratio']:>8}x")
+            results.append(row)
+        client.close()
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"meta": {"dataset": dataset, "server": args.server, "tokenizer": tokenizer,
+                                "limit": args.limit, "date": time.strftime("%Y-%m-%d %H:%M:%S")},
+                       "results": results}, f, indent=2)
+            f.write("\n")
+        print(f"\nrisultati salvati in {args.save}")
+
+
+if __name__ == "__main__":
+    main()
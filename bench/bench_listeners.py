@@ -0,0 +1,128 @@
+"""Scalabilità delle transizioni concorrenti con e senza i listener di MESState.
+
+Ogni thread avanza (e riporta indietro con rollback) SFC solo suoi, quindi le transizioni
+non si contendono i lock degli SFC: quello che resta è il costo dei listener (feed SSE,
+analytics, storico, log degli eventi) e dei lock che prendono. Per 1, 2, 4... thread
+riporta transizioni al secondo, speedup rispetto a un thread e costo dei listener.
+
+    python bench/bench_listeners.py
+    python bench/bench_listeners.py --threads 1,2,4,8,16 --seconds 5 --save /tmp/listeners.json
+
+Con il GIL (CPython standard) i thread non eseguono bytecode in parallelo: lo speedup resta
+vicino a 1 e la misura mostra solo che i listener non aggiungono attese. La scalabilità
+vera si vede con un interprete free-threaded (python3.13t), dove i lock globali dei
+listener limiterebbero lo speedup.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from clients import ROOT
+
+sys.path.insert(0, ROOT)
+from mes_analytics import Analytics  # noqa: E402
+from mes_core import MESState  # noqa: E402
+from mes_feed import ChangeFeed  # noqa: E402
+from mes_history import History  # noqa: E402
+from mes_persistence import EventLog  # noqa: E402
+
+OPERATIONS = 10
+
+
+def build(sfcs, listeners, data_dir):
+    """MESState con sfcs SFC assegnati e, se richiesti, tutti i listener del server"""
+    state = MESState()
+    routing = state.create_routing(OPERATIONS)["routing_id"]
+    ids = [state.create_sfc() for _ in range(sfcs)]
+    log = None
+    if listeners:
+        ChangeFeed(state)
+        Analytics(state)
+        History(state)
+        log = EventLog(os.path.join(data_dir, "events.0.log"), state)
+        state.add_listener(log)
+    for sfc_id in ids:
+        state.assign_routing(sfc_id, routing)
+    return state, ids, log
+
+
+def run(state, ids, threads, seconds):
+    """Transizioni al secondo con threads thread, ciascuno sulla propria parte di ids"""
+    per_thread = len(ids) // threads
+    counts = [0] * threads
+    stop = threading.Event()
+    barrier = threading.Barrier(threads + 1)
+
+    def worker(i):
+        mine = ids[i * per_thread:(i + 1) * per_thread]
+        done = 0
+        barrier.wait()
+        while not stop.is_set():
+            for sfc_id in mine:
+                if state.advance(sfc_id)[1] != 200:
+                    state.rollback(sfc_id, 1)
+                done += 1
+        counts[i] = done
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for t in workers:
+        t.start()
+    barrier.wait()
+    started = time.perf_counter()
+    time.sleep(seconds)
+    stop.set()
+    for t in workers:
+        t.join()
+    return sum(counts) / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", default="1,2,4,8", help="numeri di thread, separati da virgola")
+    parser.add_argument("--sfcs", type=int, default=8000, help="SFC in totale (divisi tra i thread)")
+    parser.add_argument("--seconds", type=float, default=3.0, help="durata di ogni misura")
+    parser.add_argument("--save", help="salva i risultati in JSON")
+    args = parser.parse_args()
+
+    thread_counts = [int(n) for n in args.threads.split(",")]
+    gil = getattr(sys, "_is_gil_enabled", lambda: True)()
+    print(f"Python {sys.version.split()[0]}, GIL {'attivo' if gil else 'disattivo'}, {os.cpu_count()} CPU\n")
+    print(f"{'listener':10} {'thread':>7} {'transizioni/s':>14} {'speedup':>8} {'costo listener':>15}")
+    results = []
+    with tempfile.TemporaryDirectory() as data_dir:
+        base = {}
+        for listeners in (False, True):
+            state, ids, log = build(args.sfcs, listeners, data_dir)
+            name = "tutti" if listeners else "nessuno"
+            single = None
+            for threads in thread_counts:
+                rate = run(state, ids, threads, args.seconds)
+                single = single or rate
+                row = {"listeners": name, "threads": threads, "rate": round(rate),
+                       "speedup": round(rate / single, 2)}
+                if listeners:
+                    row["listener_cost"] = round(1 - rate / base[threads], 3)
+                else:
+                    base[threads] = rate
+                results.append(row)
+                cost = f"{row['listener_cost']:.0%}" if listeners else ""
+                print(f"{name:10} {threads:>7} {rate:>14,.0f} {row['speedup']:>7.2f}x {cost:>15}")
+            if log is not None:
+                log.close()
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"meta": {"python": sys.version.split()[0], "gil": gil, "cpus": os.cpu_count(),
+                                "sfcs": args.sfcs, "seconds": args.seconds,
+                                "date": time.strftime("%Y-%m-%d %H:%M:%S")},
+                       "results": results}, f, indent=2)
+            f.write("\n")
+        print(f"\nrisultati salvati in {args.save}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""Dimensione del prompt dell'agente in una sessione lunga: storico completo contro memoria limitata.
+
+Simula offline una sessione di --turns turni con un LLM finto (nessuna chiamata ad Azure).
+I messaggi dell'operatore e le risposte dell'agente sono generati con seed fisso, con
+ID di SFC e righe di esito come quelle reali. Per ogni turno misura i token del prompt:
+- storico: come prima, tutto lo storico concatenato più la ConversationBufferMemory
+  (gli stessi messaggi una seconda volta)
+- memoria: ConversationMemory di agent/mes_memory.py (finestra + riassunto progressivo);
+  le chiamate di riassunto all'LLM finto sono contate nei token totali
+
+    python bench/bench_memory.py
+    python bench/bench_memory.py --turns 1000 --window 4 --summary-chars 1000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+
+from bench_compact import token_counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "agent"))
+from mes_memory import ConversationMemory, MemorySettings, llm_summarizer
+
+REQUESTS = [
+    "Avanza lo SFC {sfc} all'operazione successiva",
+    "Qual è lo stato dello SFC {sfc}?",
+    "Riporta {sfc} allo step {step} e poi forzalo allo step {step2}",
+    "Quanti SFC sono in lavorazione sul routing ROUTING{routing}?",
+    "Assegna il routing ROUTING{routing} allo SFC {sfc}",
+    "Completa l'operazione corrente di {sfc} e dimmi lo stato",
+]
+
+
+class StubLLM:
+    """LLM finto: conta chiamate e token dei prompt; per i riassunti restituisce
+    la coda dei nuovi scambi lunga quanto richiesto (come farebbe un riassunto fedele al limite)
+    """
+
+    class Message:
+        def __init__(self, content):
+            self.content = content
+
+    def __init__(self, count_tokens, limit):
+        self.count_tokens = count_tokens
+        self.limit = limit
+        self.calls = 0
+        self.tokens = 0
+
+    def invoke(self, prompt):
+        self.calls += 1
+        self.tokens += self.count_tokens(prompt)
+        turns = prompt.split("Nuovi scambi:\n", 1)[-1].rsplit("\n\nRiassunto aggiornato:", 1)[0]
+        return self.Message(turns[-self.limit:])
+
+
+def conversation(turns, seed):
+    """(messaggio dell'operatore, risposta dell'agente) per ogni turno"""
+    rng = random.Random(seed)
+    for _ in range(turns):
+        sfc = f"SFCMOCK{rng.randint(1, 100000)}"
+        step = rng.randint(1, 6)
+        request = rng.choice(REQUESTS).format(sfc=sfc, step=step, step2=step + rng.randint(1, 5),
+                                              routing=rng.randint(1, 50))
+        ops = ",".join(rng.sample(["done*3", "in work", "blank*4", "bypassed", "done"], 3))
+        lines = [f"{sfc} ROUTING{rng.randint(1, 50)} In Work step {step}: {ops}" for _ in range(rng.randint(1, 4))]
+        response = "Operazione eseguita. Stato aggiornato:\n" + "\n".join(lines)
+        yield request, response
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", type=int, default=500)
+    parser.add_argument("--window", type=int, default=6, help="turni tenuti per intero (MES_MEMORY_WINDOW)")
+    parser.add_argument("--summarize-every", type=int, default=4, help="MES_MEMORY_SUMMARIZE_EVERY")
+    parser.add_argument("--summary-chars", type=int, default=1500, help="MES_MEMORY_SUMMARY_CHARS")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--save", help="salva i risultati in JSON")
+    args = parser.parse_args()
+
+    tokenizer, count_tokens = token_counter()
+    settings = MemorySettings(window=args.window, summarize_every=args.summarize_every,
+                              summary_chars=args.summary_chars)
+    llm = StubLLM(count_tokens, args.summary_chars)
+    memory = ConversationMemory(llm_summarizer(llm, args.summary_chars), settings)
+
+    history = []
+    checkpoints = {1, 10, 50, 100, 200, 300, 500, 1000, args.turns}
+    rows, totals = [], {"storico": 0, "memoria": 0}
+    peak_after_window = 0
+    print(f"{args.turns} turni, finestra {args.window}, riassunto {args.summary_chars} caratteri, token: {tokenizer}\n")
+    print(f"{'turno':>6} {'storico':>12} {'memoria':>9} {'riassunti':>10}")
+    for turn, (request, response) in enumerate(conversation(args.turns, args.seed), 1):
+        # Prima: testo concatenato di tutto lo storico + ConversationBufferMemory
+        history.append(f"Utente: {request}")
+        full_text = "\n".join(history)
+        old_tokens = 2 * count_tokens(full_text) - count_tokens(history[-1])
+        history.append(f"Agente: {response}")
+
+        prompt = memory.prompt(request)
+        memory.add_turn(request, response)
+        new_tokens = count_tokens(prompt)
+
+        totals["storico"] += old_tokens
+        totals["memoria"] += new_tokens
+        if turn > args.window + args.summarize_every:
+            peak_after_window = max(peak_after_window, new_tokens)
+        if turn in checkpoints:
+            rows.append({"turn": turn, "history_tokens": old_tokens, "memory_tokens": new_tokens,
+                         "summary_calls": memory.summary_calls})
+            print(f"{turn:>6} {old_tokens:>12,} {new_tokens:>9,} {memory.summary_calls:>10}")
+
+    totals["memoria"] += llm.tokens
+    print(f"\nprompt con la memoria dopo il riempimento della finestra: al massimo {peak_after_window:,} token")
+    print(f"token inviati in tutta la sessione: storico {totals['storico']:,}, "
+          f"memoria {totals['memoria']:,} (di cui riassunti {llm.tokens:,} in {llm.calls} chiamate)")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"meta": {"turns": args.turns, "window": args.window, "summarize_every": args.summarize_every,
+                                "summary_chars": args.summary_chars, "tokenizer": tokenizer},
+                       "checkpoints": rows, "totals": totals, "peak_memory_tokens": peak_after_window}, f, indent=2)
+            f.write("\n")
+        print(f"risultati salvati in {args.save}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""Scalabilità con lo sharding: req/s con 1, 2, 4... shard dietro il router (mes_shard.py).
+
+Per ogni numero di shard avvia gli shard (server asyncio, uno per core se disponibili),
+i router e alcuni processi client che generano carico keep-alive come bench_async
+(GET /sfc/<id> e advance). Riporta req/s, latenze e l'efficienza rispetto a un solo shard
+(req/s con N shard / (N * req/s con uno)).
+
+    python bench/bench_shard.py
+    python bench/bench_shard.py --shards 1,2,4,8 --routers 2 --clients 4 --concurrency 256
+    python bench/bench_shard.py --direct            # client che calcolano lo shard da soli, senza router
+
+Con --direct i client usano HashRing per andare allo shard proprietario: misura la scalabilità
+degli shard senza il costo del router. Shard, router e client condividono la macchina: con
+meno core che processi i req/s non possono crescere con il numero di shard.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from multiprocessing import Pool
+
+from bench_async import DATASET, SFCS, Connection, percentile, raise_fd_limit
+from clients import ROOT, free_port
+
+sys.path.insert(0, ROOT)
+from mes_shard import HashRing, start_shards, stop_processes, wait_ready  # noqa: E402
+
+
+def client_load(task):
+    """Un processo client: concurrency connessioni per duration secondi; (richieste, latenze, errori)"""
+    urls, direct, concurrency, duration, write_ratio, seed = task
+    ring = HashRing(len(urls)) if direct else None
+    addresses = [url.rsplit("//", 1)[1].split(":") for url in urls]
+    latencies, errors = [], 0
+
+    async def worker(worker_seed):
+        nonlocal errors
+        rng = random.Random(worker_seed)
+        conns = [Connection(host, int(port)) for host, port in addresses]
+        deadline = time.perf_counter() + duration
+        try:
+            while time.perf_counter() < deadline:
+                sfc = f"SFCMOCK{rng.randint(1, SFCS)}"
+                conn = conns[ring.owner(sfc) if direct else 0]
+                started = time.perf_counter()
+                try:
+                    if rng.random() < write_ratio:
+                        status, _ = await conn.call("POST", f"/sfc/{sfc}/advance")
+                    else:
+                        status, _ = await conn.call("GET", f"/sfc/{sfc}")
+                except (OSError, asyncio.IncompleteReadError):
+                    conn.close()
+                    errors += 1
+                    continue
+                latencies.append(time.perf_counter() - started)
+                errors += status >= 500
+        finally:
+            for conn in conns:
+                conn.close()
+
+    async def run():
+        await asyncio.gather(*(worker(seed * 1000 + i) for i in range(concurrency)))
+
+    asyncio.run(run())
+    return latencies, errors
+
+
+def start_routers(shard_urls, count, port):
+    procs = []
+    for i in range(count):
+        procs.append(subprocess.Popen(
+            [sys.executable, os.path.join(ROOT, "mes_shard.py"), "--shard-urls", ",".join(shard_urls),
+             "--routers", str(count), "--router-index", str(i)],
+            cwd=ROOT, env=dict(os.environ, PORT=str(port)), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+    url = f"http://127.0.0.1:{port}"
+    try:
+        for proc in procs:
+            wait_ready(url, proc)
+    except BaseException:
+        stop_processes(procs)
+        raise
+    return url, procs
+
+
+def measure(urls, direct, clients, concurrency, duration, write_ratio):
+    tasks = [(urls, direct, max(1, concurrency // clients), duration, write_ratio, i) for i in range(clients)]
+    started = time.perf_counter()
+    with Pool(clients) as pool:
+        parts = pool.map(client_load, tasks)
+    elapsed = time.perf_counter() - started
+    latencies = [lat for part, _ in parts for lat in part]
+    return {
+        "requests": len(latencies),
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "errors": sum(errors for _, errors in parts),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--shards", default="1,2,4", help="numeri di shard da misurare")
+    parser.add_argument("--routers", type=int, default=1, help="processi router (stessa porta)")
+    parser.add_argument("--clients", type=int, default=2, help="processi client")
+    parser.add_argument("--concurrency", type=int, default=64, help="connessioni concorrenti in totale")
+    parser.add_argument("--duration", type=float, default=5.0, help="secondi per misura")
+    parser.add_argument("--write-ratio", type=float, default=0.2, help="quota di advance (il resto è GET /sfc)")
+    parser.add_argument("--direct", action="store_true", help="client direttamente sugli shard, senza router")
+    parser.add_argument("--save", help="salva i risultati in JSON")
+    args = parser.parse_args()
+
+    raise_fd_limit()
+    cpus = sorted(os.sched_getaffinity(0))
+    report = {"meta": {"dataset": DATASET, "routers": 0 if args.direct else args.routers, "clients": args.clients,
+                       "concurrency": args.concurrency, "duration": args.duration,
+                       "write_ratio": args.write_ratio, "cpus": len(cpus),
+                       "date": time.strftime("%Y-%m-%d %H:%M:%S")}, "runs": []}
+    os.environ.update(DATASET)
+    os.environ.pop("MES_DATA_DIR", None)
+    mode = "client -> shard" if args.direct else f"{args.routers} router"
+    print(f"{len(cpus)} core, {mode}, {args.clients} client, {args.concurrency} connessioni")
+    print(f"{'shard':>6} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'err':>5} {'efficienza':>11}")
+    single = None
+    for count in [int(n) for n in args.shards.split(",")]:
+        shard_urls, procs = start_shards(count, free_port(), cpus=cpus)
+        try:
+            if args.direct:
+                targets = shard_urls
+            else:
+                router_url, routers = start_routers(shard_urls, args.routers, free_port())
+                procs += routers
+                targets = [router_url]
+            r = measure(targets, args.direct, args.clients, args.concurrency, args.duration, args.write_ratio)
+        finally:
+            stop_processes(procs)
+        single = single or r["rps"] / count
+        r["shards"] = count
+        r["efficiency"] = round(r["rps"] / (count * single), 2)
+        print(f"{count:>6} {r['rps']:>9.1f} {r['p50_ms']:>8.2f} {r['p99_ms']:>8.2f} {r['errors']:>5} "
+              f"{r['efficiency']:>11.2f}")
+        report["runs"].append(r)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+        print(f"\nrisultati salvati in {args.save}")
+
+
+if __name__ == "__main__":
+    main()
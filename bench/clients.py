@@ -0,0 +1,125 @@
+"""Client usati dagli script di bench: app Flask in-process oppure server HTTP."""
+from contextlib import contextmanager
+import http.client
+import importlib
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from urllib.parse import urlparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class LocalClient:
+    """Client sull'app Flask in-process (un test client per thread)"""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, payload=None):
+        status, body = self.send(method, path, payload)
+        return status, json.loads(body)
+
+    def send(self, method, path, payload=None):
+        """Come request, ma restituisce il body grezzo (bytes)"""
+        resp = self.client.open(path, method=method, json=payload)
+        return resp.status_code, resp.get_data()
+
+
+class HTTPClient:
+    """Client HTTP keep-alive verso un server in esecuzione; si riconnette se il server chiude"""
+
+    def __init__(self, url):
+        parsed = urlparse(url)
+        self.host, self.port = parsed.hostname, parsed.port or 80
+        self.conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+
+    def request(self, method, path, payload=None):
+        status, body = self.send(method, path, payload)
+        return status, json.loads(body)
+
+    def send(self, method, path, payload=None, headers=None):
+        status, _, data = self.exchange(method, path, payload, headers)
+        return status, data
+
+    def exchange(self, method, path, payload=None, headers=None):
+        """Come send, ma restituisce anche gli header della risposta: (status, header, body)"""
+        body = json.dumps(payload) if payload is not None else None
+        headers = dict(headers or {})
+        if body:
+            headers["Content-Type"] = "application/json"
+        for attempt in range(2):
+            try:
+                self.conn.request(method, path, body=body, headers=headers)
+                resp = self.conn.getresponse()
+                data = resp.read()
+            except (http.client.RemoteDisconnected, ConnectionError):
+                self.conn.close()
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+                if attempt:
+                    raise
+                continue
+            if resp.getheader("Connection") == "close":
+                self.conn.close()
+            return resp.status, resp.headers, data
+
+
+def load_module():
+    """Modulo mock-mes importato senza avviare il server"""
+    sys.path.insert(0, ROOT)
+    return importlib.import_module("mock-mes")
+
+
+def load_app():
+    return load_module().app
+
+
+# ---------------------------
+# Server locali
+# ---------------------------
+# Comando di avvio per tipo di server (cwd = ROOT, porta da PORT)
+SERVERS = {
+    "flask": [sys.executable, "mock-mes.py"],
+    "gunicorn": ["gunicorn", "-c", "gunicorn.conf.py", "mock-mes:app"],
+    "async": [sys.executable, "mes_async.py"],
+}
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def wait_ready(url, proc, timeout=300):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"il server è terminato con codice {proc.returncode}")
+        try:
+            if HTTPClient(url).send("GET", "/routings?limit=1")[0] == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("il server non risponde")
+
+@contextmanager
+def local_server(server, env=None, cpus=None):
+    """Avvia un server locale (flask, gunicorn o async) su una porta libera e ne restituisce l'URL.
+    env: variabili d'ambiente aggiuntive (es. profilo dei dati); cpus: core a cui vincolarlo (Linux)
+    """
+    port = free_port()
+    env = dict(os.environ, PORT=str(port), **(env or {}))
+    env.pop("MES_DATA_DIR", None)
+    preexec = (lambda: os.sched_setaffinity(0, cpus)) if cpus is not None else None
+    proc = subprocess.Popen(SERVERS[server], cwd=ROOT, env=env, preexec_fn=preexec,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    try:
+        wait_ready(url, proc)
+        yield url
+    finally:
+        proc.terminate()
+        proc.wait()
@@ -0,0 +1,345 @@
+"""Conformità tra i server del mock MES: stesse richieste, stesse risposte.
+
+Avvia i server indicati (default: app Flask e server asyncio) con lo stesso dataset
+generato, esegue su ciascuno la stessa sequenza di richieste (casi fissi per ogni
+endpoint, inclusi errori, paginazione, NDJSON, ETag/304, bulk e feed SSE, più una
+sequenza casuale di transizioni) e confronta status, Content-Type, ETag e body.
+L'epoch degli ETag e i timestamp degli eventi dipendono dal processo e vengono normalizzati.
+
+    python bench/conformance.py
+    python bench/conformance.py --servers flask,gunicorn,async --random 5000
+
+Esce con codice 1 alla prima differenza, mostrando la richiesta e le due risposte.
+Non sono confrontati gli errori generati dal framework (route inesistenti, metodo
+non ammesso, body non JSON su /routing): Flask risponde con pagine HTML.
+"""
+import argparse
+import http.client
+import random
+import re
+import sys
+import time
+
+from clients import SERVERS, HTTPClient, local_server
+
+DATASET = {
+    "MES_SEED": "7", "MES_SFCS": "300", "MES_ROUTINGS": "8", "MES_OPERATIONS": "1-12",
+    "MES_STATE_MIX": "unassigned=0.2,in_work=0.5,done=0.3", "MES_PROGRESS": "uniform",
+    "MES_BYPASS_RATE": "0.1",
+}
+
+_ETAG = re.compile(r'^"[0-9a-f]+-(\d+(?:-[\w.]+)?)"$')
+_TIME = re.compile(rb'"time":[0-9.]+')
+
+
+def fixed_cases():
+    """(metodo, path, payload, header); "{etag}" negli header = ultimo ETag ricevuto"""
+    cases = [
+        # Prima di ogni transizione: i tempi di ciclo sono vuoti, quindi la risposta è deterministica
+        ("GET", "/analytics", None, None),
+        ("GET", "/analytics/routings/ROUTING2", None, None),
+        ("GET", "/analytics/routings/NOPE", None, None),
+        ("GET", "/routings", None, None),
+        ("GET", "/routings?limit=3", None, None),
+        ("GET", "/routings?limit=3&cursor=3", None, None),
+        ("GET", "/routings?cursor=6", None, None),
+        ("GET", "/routings?limit=0", None, None),
+        ("GET", "/routings?cursor=abc", None, None),
+        ("GET", "/routings?format=ndjson", None, None),
+        ("GET", "/routings?format=ndjson&limit=2&cursor=1", None, None),
+        ("GET", "/sfcs", None, None),
+        ("GET", "/sfcs?limit=25", None, None),
+        ("GET", "/sfcs?limit=25&cursor=290", None, None),
+        ("GET", "/sfcs?state=Done&fields=routing", None, None),
+        ("GET", "/sfcs?sfc_state=New&limit=5", None, None),
+        ("GET", "/sfcs?routing=ROUTING2&fields=sfc_state,routing&limit=4&cursor=10", None, None),
+        ("GET", "/sfcs?fields=nope", None, None),
+        ("GET", "/sfcs?fields=", None, None),
+        ("GET", "/sfcs?limit=x", None, None),
+        ("GET", "/sfcs?format=ndjson&limit=7&state=In%20Work", None, None),
+        ("GET", "/sfcs?format=ndjson&fields=sfc_state", None, None),
+        ("GET", "/sfcs?limit=2&limit=5&state=Done&state=New", None, None),
+        ("GET", "/routings/ROUTING3/sfcs", None, None),
+        ("GET", "/routings/ROUTING3/sfcs?limit=2&fields=operations", None, None),
+        ("GET", "/routings/NOPE/sfcs", None, None),
+        ("GET", "/routings/ROUTING3/sfcs?format=ndjson", None, None),
+        ("GET", "/sfcs?view=compact&limit=10", None, None),
+        ("GET", "/sfcs?view=compact&state=Done&format=ndjson&limit=3", None, None),
+        ("GET", "/sfcs?fields=step,ops,routing&limit=5&cursor=40", None, None),
+        ("GET", "/sfcs?view=nope", None, None),
+        ("GET", "/routings/ROUTING3/sfcs?view=compact", None, None),
+        ("GET", "/routings?view=compact", None, None),
+        ("GET", "/routings?view=compact&limit=2&cursor=2", None, None),
+        ("GET", "/routings?view=compact&format=ndjson&limit=2", None, None),
+        ("GET", "/sfcs/summary", None, None),
+        ("GET", "/sfcs/summary?routing=ROUTING2", None, None),
+        ("GET", "/sfcs/summary?routing=NOPE", None, None),
+        ("GET", "/routings/ROUTING4/summary", None, None),
+        ("GET", "/sfc/SFCMOCK1?view=compact", None, None),
+        ("GET", "/sfc/SFCMOCK1/routing_state?view=compact", None, None),
+        ("GET", "/sfc/SFCMOCK1?view=compact", None, {"If-None-Match": "{etag}"}),
+        ("GET", "/sfc/SFCMOCK1", None, {"If-None-Match": "{etag}"}),
+        ("GET", "/sfc/NOPE?view=compact", None, None),
+        ("GET", "/sfc/SFCMOCK1?view=bad", None, None),
+        ("GET", "/sfc/SFCMOCK1", None, None),
+        ("GET", "/sfc/SFCMOCK1", None, {"If-None-Match": "{etag}"}),
+        ("GET", "/sfc/SFCMOCK1/routing_state", None, {"If-None-Match": 'W/"x", {etag}'}),
+        ("GET", "/sfc/SFCMOCK1", None, {"If-None-Match": '"stale-0"'}),
+        ("GET", "/sfc/NOPE", None, None),
+        ("GET", "/sfc/NOPE/routing_state", None, {"If-None-Match": '"x"'}),
+        ("GET", "/sfc/SFC%4DOCK2", None, None),
+        ("POST", "/routing", {"operations": 4}, None),
+        ("POST", "/routing", {"operations": 1}, None),
+        ("POST", "/sfc", None, None),
+        ("POST", "/sfc", {"ignored": True}, None),
+        ("POST", "/sfc", {"sfc_id": "SFCMOCK304"}, None),
+        ("POST", "/sfc", {"sfc_id": "SFCMOCK304"}, None),
+        ("POST", "/sfc", {"sfc_id": "SFCMOCK0"}, None),
+        ("POST", "/sfc", {"sfc_id": 7}, None),
+        ("POST", "/routing", {"operations": 2, "routing_id": "ROUTING13"}, None),
+        ("POST", "/routing", {"operations": 2, "routing_id": "ROUTING13"}, None),
+        ("POST", "/routing", {"routing_id": "R1"}, None),
+        ("GET", "/sfc/SFCMOCK301", None, None),
+        ("POST", "/sfc/SFCMOCK301/advance", None, None),
+        ("POST", "/sfc/SFCMOCK301/assign_routing", {"routing_id": "NOPE"}, None),
+        ("POST", "/sfc/SFCMOCK301/assign_routing", None, None),
+        ("POST", "/sfc/NOPE/assign_routing", {"routing_id": "ROUTING9"}, None),
+        ("POST", "/sfc/SFCMOCK301/assign_routing", {"routing_id": "ROUTING9"}, None),
+        ("GET", "/sfc/SFCMOCK301", None, None),
+        ("GET", "/sfc/SFCMOCK301", None, {"If-None-Match": "{etag}"}),
+        ("POST", "/sfc/SFCMOCK301/advance", None, None),
+        ("GET", "/sfc/SFCMOCK301", None, {"If-None-Match": "{etag}"}),
+        ("POST", "/sfc/SFCMOCK301/complete", {}, None),
+        ("POST", "/sfc/SFCMOCK301/rollback", {"step": 0}, None),
+        ("POST", "/sfc/SFCMOCK301/rollback", {"step": 3}, None),
+        ("POST", "/sfc/SFCMOCK301/rollback", {"step": "x"}, None),
+        ("POST", "/sfc/SFCMOCK301/rollback", None, None),
+        ("POST", "/sfc/SFCMOCK301/force_advance", {"step": 3}, None),
+        ("POST", "/sfc/SFCMOCK301/force_advance", {"step": 99}, None),
+        ("POST", "/sfc/SFCMOCK301/rollback_single", None, None),
+        ("POST", "/sfc/SFCMOCK301/rollback_single", None, None),
+        ("POST", "/sfc/SFCMOCK301/rollback_single", None, None),
+        ("POST", "/sfc/SFCMOCK301/force_advance", {"step": 4}, None),
+        ("POST", "/sfc/SFCMOCK301/advance", None, None),
+        ("POST", "/sfc/SFCMOCK301/advance", None, None),
+        ("GET", "/sfc/SFCMOCK301/routing_state", None, None),
+        ("GET", "/sfc/SFCMOCK301/history", None, None),
+        ("GET", "/sfc/SFCMOCK301/history?limit=3&since=0", None, None),
+        ("GET", "/sfc/SFCMOCK301/history?until=0", None, None),
+        ("GET", "/sfc/NOPE/history", None, None),
+        ("GET", "/history?limit=5", None, None),
+        ("GET", "/history?limit=5&cursor=5", None, None),
+        ("GET", "/history?since=x", None, None),
+        ("GET", "/history?limit=10001", None, None),
+        ("POST", "/sfc/NOPE/advance", None, None),
+        ("POST", "/sfc/NOPE/rollback_single", None, None),
+        ("POST", "/bulk/sfc", {"count": 3, "routing_id": "ROUTING10"}, None),
+        ("POST", "/bulk/sfc", {"count": 2}, None),
+        ("POST", "/bulk/sfc", {"count": 0}, None),
+        ("POST", "/bulk/sfc", {"count": "x"}, None),
+        ("POST", "/bulk/sfc", {"count": 1, "routing_id": "NOPE"}, None),
+        ("POST", "/bulk/sfc", {"sfc_ids": ["SFCMOCK900", "SFCMOCK1", "NOPE"], "routing_id": "ROUTING2"}, None),
+        ("POST", "/bulk/sfc", {"sfc_ids": []}, None),
+        ("POST", "/bulk/assign_routing", {"routing_id": "ROUTING1", "sfc_ids": ["SFCMOCK305", "NOPE"]}, None),
+        ("POST", "/bulk/assign_routing", {"routing_id": "ROUTING1"}, None),
+        ("POST", "/bulk/advance", {"sfc_ids": ["SFCMOCK302", "SFCMOCK303", "NOPE"]}, None),
+        ("POST", "/bulk/complete", {"sfc_ids": ["SFCMOCK302"]}, None),
+        ("POST", "/bulk/force_advance", {"sfc_ids": ["SFCMOCK302", "SFCMOCK304"], "step": 2}, None),
+        ("POST", "/bulk/rollback", {"items": [{"sfc_id": "SFCMOCK302", "step": 0}, {"sfc_id": "SFCMOCK303"}]}, None),
+        ("POST", "/bulk/rollback_single", {"sfc_ids": ["SFCMOCK304"]}, None),
+        ("POST", "/bulk/rollback", {"items": "x"}, None),
+        ("POST", "/bulk/rollback", {"items": [1]}, None),
+        ("POST", "/bulk/advance", {"sfc_ids": "SFCMOCK1"}, None),
+        ("POST", "/bulk/advance", None, None),
+        ("POST", "/bulk/nope", {"sfc_ids": ["SFCMOCK1"]}, None),
+        ("POST", "/bulk/advance", {"sfc_ids": ["SFCMOCK1"] * 10001}, None),
+        ("POST", "/bulk/advance", {"sfc_ids": [["x"], {"a": 1}, 7, "SFCMOCK303"]}, None),
+        ("POST", "/bulk/rollback", {"items": [{"sfc_id": ["x"]}, {"step": 1}]}, None),
+        ("POST", "/bulk/assign_routing", {"routing_id": "ROUTING1", "sfc_ids": [["x"], "SFCMOCK305"]}, None),
+        ("POST", "/bulk/assign_routing", {"routing_id": ["ROUTING1"], "sfc_ids": ["SFCMOCK305"]}, None),
+        ("POST", "/bulk/sfc", {"count": 1, "routing_id": ["ROUTING1"]}, None),
+        ("POST", "/bulk/sfc", {"sfc_ids": [["x"]]}, None),
+        ("POST", "/bulk/advance", {"routing": "ROUTING2", "sfc_state": "In Work", "limit": 3, "view": "compact"}, None),
+        ("POST", "/bulk/force_advance", {"routing": "ROUTING3", "step": 2, "limit": 2, "cursor": 5}, None),
+        ("POST", "/bulk/advance", {"sfc_state": "Done", "view": "compact"}, None),
+        ("POST", "/bulk/advance", {"routing": "NOPE"}, None),
+        ("POST", "/bulk/advance", {"routing": ["ROUTING1"]}, None),
+        ("POST", "/bulk/advance", {"sfc_state": "Bogus"}, None),
+        ("POST", "/bulk/advance", {"routing": "ROUTING1", "sfc_state": ["Done"]}, None),
+        ("POST", "/bulk/advance", {"sfc_state": "In Work", "limit": 0}, None),
+        ("POST", "/bulk/advance", {"sfc_state": "In Work", "limit": 10001}, None),
+        ("POST", "/bulk/advance", {"sfc_state": "In Work", "cursor": "x"}, None),
+        ("GET", "/events?policy=nope", None, None),
+        ("GET", "/events?queue=0", None, None),
+        ("GET", "/events?queue=x", None, None),
+        ("GET", "/events?types=nope", None, None),
+        ("GET", "/events?types=,", None, None),
+        ("GET", "/events?last_event_id=x", None, None),
+        ("GET", "/simulation", None, None),
+        ("POST", "/simulation/start", {"speed": 0}, None),
+        ("POST", "/simulation/start", {"cycle_time": "nope"}, None),
+        ("POST", "/simulation/start", {"rollback_rate": 0.7, "bypass_rate": 0.7}, None),
+        ("POST", "/simulation/start", {"arrival_rate": -1, "other": 1}, None),
+        ("POST", "/simulation/speed", {"speed": "x"}, None),
+        ("POST", "/simulation/stop", None, None),
+        ("GET", "/admin/faults", None, None),
+        ("POST", "/admin/faults", {"rules": [{"latency": "nope"}]}, None),
+        ("POST", "/admin/faults", {"rules": [{"error_rate": 0.7, "timeout_rate": 0.7}]}, None),
+        ("POST", "/admin/faults", {"rules": [{"bandwidth": 0, "other": 1}]}, None),
+        ("POST", "/admin/faults", {"seed": "x"}, None),
+        ("POST", "/admin/faults", {"seed": 7, "rules": [
+            {"endpoint": "POST /sfc/<sfc_id>/*", "error_rate": 0.5, "error_status": [500, 503]},
+            {"endpoint": "GET /sfcs/summary", "latency": "const:1", "bandwidth": 4096}]}, None),
+        ("POST", "/sfc/SFCMOCK10/advance", None, None),
+        ("POST", "/sfc/SFCMOCK11/advance", None, None),
+        ("POST", "/sfc/SFCMOCK12/advance", None, None),
+        ("POST", "/sfc/SFCMOCK13/rollback", {"step": 1}, None),
+        ("GET", "/sfcs/summary", None, None),
+        ("GET", "/admin/faults", None, None),
+        ("POST", "/admin/faults", {"rules": []}, None),
+        ("GET", "/sfcs?routing=ROUTING10", None, None),
+        ("GET", "/routings", None, None),
+    ]
+    return cases
+
+def random_cases(count, seed):
+    """Transizioni casuali su SFC esistenti e non, intervallate da letture"""
+    rng = random.Random(seed)
+    sfcs = [f"SFCMOCK{i}" for i in range(1, 311)] + ["NOPE"]
+    routings = [f"ROUTING{i}" for i in range(1, 11)] + ["NOPE"]
+    steps = [0, 1, 2, 3, 5, 8, 13, -1, "x", None]
+    cases = []
+    for _ in range(count):
+        sfc = rng.choice(sfcs)
+        op = rng.choice(("assign", "advance", "complete", "rollback", "force_advance", "rollback_single", "get", "get"))
+        if op == "assign":
+            cases.append(("POST", f"/sfc/{sfc}/assign_routing", {"routing_id": rng.choice(routings)}, None))
+        elif op in ("rollback", "force_advance"):
+            cases.append(("POST", f"/sfc/{sfc}/{op}", {"step": rng.choice(steps)}, None))
+        elif op == "get":
+            cases.append(("GET", rng.choice((f"/sfc/{sfc}", f"/sfc/{sfc}/routing_state")), None, None))
+        else:
+            cases.append(("POST", f"/sfc/{sfc}/{op}", None, None))
+    cases += [("GET", "/sfcs", None, None), ("GET", "/sfcs?format=ndjson&state=Done", None, None)]
+    return cases
+
+
+# ---------------------------
+# Esecuzione e confronto
+# ---------------------------
+def normalize(status, headers, body):
+    etag = headers.get("ETag")
+    if etag is not None:
+        m = _ETAG.match(etag)
+        etag = f"<epoch>-{m.group(1)}" if m else etag
+    return status, headers.get("Content-Type"), etag, _TIME.sub(b'"time":0', body)
+
+def run_cases(url, cases):
+    client = HTTPClient(url)
+    results = []
+    etag = None
+    for method, path, payload, headers in cases:
+        if headers:
+            headers = {k: v.replace("{etag}", etag or '""') for k, v in headers.items()}
+        status, response_headers, body = client.exchange(method, path, payload, headers)
+        etag = response_headers.get("ETag", etag)
+        results.append(normalize(status, response_headers, body))
+    return results
+
+def read_events(url, path, limit, trigger=None, idle=1.0):
+    """Apre uno stream SSE e ne legge fino a limit eventi (esclusi retry e keep-alive),
+    fermandosi quando non arriva nulla per idle secondi. trigger: richieste da eseguire
+    a stream aperto, per ricevere eventi dal vivo
+    """
+    client = HTTPClient(url)
+    conn = http.client.HTTPConnection(client.host, client.port, timeout=idle)
+    conn.request("GET", path)
+    resp = conn.getresponse()
+    head = (resp.status, resp.getheader("Content-Type"), resp.getheader("Cache-Control"))
+    if trigger:
+        run_cases(url, trigger)
+    events, buffer = [], b""
+    while len(events) < limit:
+        try:
+            data = resp.read1(65536)
+        except TimeoutError:
+            break
+        if not data:
+            break
+        buffer += data
+        *blocks, buffer = buffer.split(b"\n\n")
+        events += [b for b in blocks if b and not b.startswith((b"retry:", b":"))]
+    conn.close()
+    return head, [_TIME.sub(b'"time":0', e) for e in events[:limit]]
+
+def run_events(url):
+    """Feed SSE: eventi dal vivo, ripresa con Last-Event-ID dagli eventi dei casi precedenti, filtri e tipi"""
+    live = [("POST", "/sfc/SFCMOCK1/force_advance", {"step": 0}, None), ("POST", "/sfc/SFCMOCK2/advance", None, None),
+            ("POST", "/sfc/SFCMOCK1/advance", None, None)]
+    return [
+        read_events(url, "/events?sfc_id=SFCMOCK1", 10, trigger=live),
+        read_events(url, "/events?last_event_id=0&sfc_id=SFCMOCK301", 20),
+        read_events(url, "/events?last_event_id=0&types=sfc_created,sfc_state_changed&routing=ROUTING10", 6),
+        read_events(url, "/events?last_event_id=0&state=Done&queue=3&policy=drop_newest", 3),
+    ]
+
+def first_difference(reference, other):
+    for i, (a, b) in enumerate(zip(reference, other)):
+        if a != b:
+            return i
+    return None if len(reference) == len(other) else min(len(reference), len(other))
+
+def show(result):
+    status, content_type, etag, body = result
+    text = body.decode(errors="replace")
+    return f"{status} {content_type} etag={etag}\n    {text[:600]}{'...' if len(text) > 600 else ''}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--servers", default="flask,async", help="server da confrontare (il primo è il riferimento)")
+    parser.add_argument("--random", type=int, default=2000, help="transizioni casuali dopo i casi fissi")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    servers = args.servers.split(",")
+    unknown = [s for s in servers if s not in SERVERS]
+    if len(servers) < 2 or unknown:
+        parser.error(f"servono almeno due server tra {', '.join(SERVERS)}")
+    cases = fixed_cases() + random_cases(args.random, args.seed)
+
+    outcomes = {}
+    for server in servers:
+        with local_server(server, DATASET) as url:
+            started = time.perf_counter()
+            outcomes[server] = (run_cases(url, cases), run_events(url))
+            print(f"{server}: {len(cases)} richieste in {time.perf_counter() - started:.1f} s")
+
+    reference = servers[0]
+    ref_results, ref_events = outcomes[reference]
+    failed = False
+    for server in servers[1:]:
+        results, events = outcomes[server]
+        identical = True
+        i = first_difference(ref_results, results)
+        if i is not None:
+            identical = False
+            method, path, payload, headers = cases[i]
+            print(f"\nDIFFERENZA {reference} / {server} alla richiesta {i + 1}: {method} {path} {payload or ''} {headers or ''}")
+            print(f"  {reference}: {show(ref_results[i]) if i < len(ref_results) else '-'}")
+            print(f"  {server}: {show(results[i]) if i < len(results) else '-'}")
+        if events != ref_events:
+            identical = False
+            print(f"\nDIFFERENZA {reference} / {server} nel feed SSE:")
+            for a, b in zip(ref_events, events):
+                if a != b:
+                    print(f"  {reference}: {a[0]} {[e[:200] for e in a[1]]}")
+                    print(f"  {server}: {b[0]} {[e[:200] for e in b[1]]}")
+        failed = failed or not identical
+        if identical:
+            print(f"{server}: risposte identiche a {reference} ({len(cases)} richieste, {len(ref_events)} stream SSE)")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+"""Replay del traffico catturato (MES_CAPTURE, vedi mes_capture) contro un server MES.
+
+Le richieste partono con gli intervalli registrati (--speed 1), N volte più veloci
+(--speed N) o appena possibile (--speed max), con al massimo --concurrency richieste
+in volo sullo stesso pool di connessioni keep-alive. Gli ID generati dal server durante
+la cattura (SFCMOCK..., ROUTING... creati da POST /sfc, /routing, /bulk/sfc) sono
+riscritti con quelli generati nel replay, in path e body: una richiesta che usa un ID
+non ancora creato aspetta la richiesta che lo crea.
+
+    python bench/replay.py traffic.cap --url http://localhost:8080
+    python bench/replay.py traffic.cap --server async --speed max --concurrency 64
+    python bench/replay.py traffic.cap --server gunicorn --speed 10 --save replay.json
+
+Riporta le latenze (p50/p95/p99, totali e per endpoint) del replay accanto a quelle
+registrate e le divergenze: status diversi e body JSON diversi (confrontati con il
+digest registrato, dopo aver riportato gli ID a quelli della cattura). Il server deve
+partire dallo stesso dataset della cattura (stesso MES_SEED e profilo dei dati, niente
+MES_DATA_DIR con dati diversi), altrimenti le letture divergono.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import sys
+import time
+
+from bench_async import percentile, raise_fd_limit
+from clients import ROOT, local_server
+
+sys.path.insert(0, ROOT)
+from mes_capture import GENERATED_ID, canonical, created_ids, digest, read_capture  # noqa: E402
+from mes_shard import ShardClient, ShardError  # noqa: E402
+
+# Divergenze riportate per esteso
+EXAMPLES = 10
+
+
+def endpoint(method, target):
+    """Endpoint di una richiesta, con gli ID sostituiti dai parametri della route"""
+    path = target.split("?", 1)[0].encode()
+    path = GENERATED_ID.sub(lambda m: b"<sfc_id>" if m.group().startswith(b"SFC") else b"<routing_id>", path)
+    return f"{method} {path.decode()}"
+
+
+class Replay:
+    """Stato del replay: ID del replay per gli ID registrati e risultati per richiesta"""
+
+    def __init__(self, requests, client, speed):
+        self.requests = requests
+        self.client = client
+        self.speed = speed                   # None = appena possibile
+        # ID registrati creati dalle richieste già partite -> future con l'ID corrispondente del replay.
+        # Un ID creato solo più avanti nella cattura resta com'è (nella cattura la richiesta lo precedeva)
+        self.pending = {}
+        self.replayed = {}                   # ID del replay -> ID registrato (per confrontare i body)
+        self.results = []                    # (richiesta, status, latenza, digest del replay o None)
+        self.lag = 0.0                       # ritardo massimo rispetto alla pianificazione
+
+    async def rewrite(self, data):
+        """Sostituisce gli ID creati nella cattura con quelli del replay (aspettandone la creazione)"""
+        ids = {m for m in GENERATED_ID.findall(data) if m in self.pending}
+        if not ids:
+            return data
+        mapping = {i: await self.pending[i] for i in ids}
+        return GENERATED_ID.sub(lambda m: mapping.get(m.group(), m.group()), data)
+
+    def resolve(self, request, status, body):
+        """Associa gli ID creati dalla richiesta registrata a quelli creati nel replay"""
+        path = request.target.split("?", 1)[0]
+        new = created_ids(request.method, path, request.body, status, body) if body is not None else []
+        for i, recorded in enumerate(request.created):
+            replayed = new[i].encode() if i < len(new) else recorded
+            self.replayed[replayed] = recorded
+            if not self.pending[recorded].done():
+                self.pending[recorded].set_result(replayed)
+
+    async def send(self, request):
+        target = (await self.rewrite(request.target.encode())).decode()
+        body = await self.rewrite(request.body)
+        started = time.perf_counter()
+        try:
+            status, headers, response = await self.client.request(request.method, target, body)
+        except ShardError:
+            status, response, headers = 0, None, {}
+        seconds = time.perf_counter() - started
+        self.resolve(request, status, response)
+        replay_digest = None
+        if request.digest is not None and response is not None and \
+                headers.get("content-type", "").startswith("application/json"):
+            # ID del replay riportati a quelli registrati, poi chiavi di nuovo in ordine (possono essere ID)
+            response = GENERATED_ID.sub(lambda m: self.replayed.get(m.group(), m.group()), response)
+            replay_digest = digest(canonical(response))
+        self.results.append((request, status, seconds, replay_digest))
+
+    async def run(self, concurrency):
+        slots = asyncio.Semaphore(concurrency)
+        tasks = []
+        first = self.requests[0].start if self.requests else 0.0
+        origin = time.perf_counter()
+
+        async def one(request):
+            try:
+                await self.send(request)
+            finally:
+                slots.release()
+
+        for request in self.requests:
+            if self.speed is not None:
+                due = origin + (request.start - first) / self.speed
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            await slots.acquire()
+            loop = asyncio.get_running_loop()
+            for created in request.created:
+                self.pending.setdefault(created, loop.create_future())
+            if self.speed is not None:
+                self.lag = max(self.lag, time.perf_counter() - due)
+            tasks.append(asyncio.create_task(one(request)))
+        await asyncio.gather(*tasks)
+        return time.perf_counter() - origin
+
+
+def latency_summary(recorded, replayed):
+    summary = {"requests": len(replayed)}
+    for name, values in (("recorded", recorded), ("replay", replayed)):
+        for q in (50, 95, 99):
+            summary[f"{name}_p{q}_ms"] = round(percentile(values, q / 100) * 1000, 3)
+    return summary
+
+
+def report(replay, elapsed):
+    by_endpoint = {}
+    status_diffs, body_diffs, examples = 0, 0, []
+    for request, status, seconds, replay_digest in replay.results:
+        recorded, replayed = by_endpoint.setdefault(endpoint(request.method, request.target), ([], []))
+        recorded.append(request.duration)
+        replayed.append(seconds)
+        if status != request.status:
+            status_diffs += 1
+            kind = f"status {request.status} -> {status}"
+        elif replay_digest is not None and replay_digest != request.digest:
+            body_diffs += 1
+            kind = "body"
+        else:
+            continue
+        if len(examples) < EXAMPLES:
+            examples.append({"request": f"{request.method} {request.target}", "divergence": kind})
+    recorded = [d for r, _ in by_endpoint.values() for d in r]
+    replayed = [s for _, r in by_endpoint.values() for s in r]
+    requests = replay.requests
+    span = requests[-1].start - requests[0].start if requests else 0.0
+    return {
+        "requests": len(replay.results),
+        "recorded_seconds": round(span, 3),
+        "replay_seconds": round(elapsed, 3),
+        "rps": round(len(replay.results) / elapsed, 1) if elapsed else None,
+        "max_lag_ms": round(replay.lag * 1000, 3),
+        "latency": latency_summary(recorded, replayed),
+        "endpoints": {name: latency_summary(r, s) for name, (r, s) in sorted(by_endpoint.items())},
+        "divergences": {"status": status_diffs, "body": body_diffs, "compared_bodies":
+                        sum(1 for _, _, _, d in replay.results if d is not None), "examples": examples},
+    }
+
+
+def print_report(result, speed):
+    print(f"{result['requests']} richieste, catturate in {result['recorded_seconds']} s, "
+          f"replay ({speed}) in {result['replay_seconds']} s = {result['rps']} req/s, "
+          f"ritardo massimo {result['max_lag_ms']} ms")
+    print(f"\n{'endpoint':40} {'n':>7} {'cattura p50/p95/p99 ms':>24} {'replay p50/p95/p99 ms':>24}")
+    rows = list(result["endpoints"].items()) + [("totale", result["latency"])]
+    for name, s in rows:
+        recorded = f"{s['recorded_p50_ms']:.2f}/{s['recorded_p95_ms']:.2f}/{s['recorded_p99_ms']:.2f}"
+        replayed = f"{s['replay_p50_ms']:.2f}/{s['replay_p95_ms']:.2f}/{s['replay_p99_ms']:.2f}"
+        print(f"{name:40} {s['requests']:>7} {recorded:>24} {replayed:>24}")
+    d = result["divergences"]
+    print(f"\ndivergenze: {d['status']} status, {d['body']} body su {d['compared_bodies']} confrontati")
+    for example in d["examples"]:
+        print(f"  {example['request']}: {example['divergence']}")
+
+
+async def replay_to(url, requests, speed, concurrency):
+    client = ShardClient(url, connections=concurrency)
+    try:
+        replay = Replay(requests, client, speed)
+        elapsed = await replay.run(concurrency)
+    finally:
+        client.close()
+    return report(replay, elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("capture", help="file scritto con MES_CAPTURE")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--url", help="server già avviato")
+    target.add_argument("--server", choices=["flask", "gunicorn", "async"], default="async",
+                        help="server locale da avviare (default: async)")
+    parser.add_argument("--speed", default="1", help="1 = tempi registrati, N = N volte più veloce, max = senza pause")
+    parser.add_argument("--concurrency", type=int, default=32, help="richieste in volo al massimo")
+    parser.add_argument("--save", help="salva i risultati in JSON")
+    args = parser.parse_args()
+
+    speed = None if args.speed == "max" else float(args.speed)
+    if speed is not None and speed <= 0:
+        parser.error("--speed deve essere positivo o 'max'")
+    requests = sorted(read_capture(args.capture), key=lambda r: r.start)
+    raise_fd_limit()
+    with contextlib.ExitStack() as stack:
+        url = args.url or stack.enter_context(local_server(args.server))
+        result = asyncio.run(replay_to(url, requests, speed, args.concurrency))
+    result["meta"] = {"capture": args.capture, "target": args.url or args.server, "speed": args.speed,
+                      "concurrency": args.concurrency, "date": time.strftime("%Y-%m-%d %H:%M:%S")}
+    print_report(result, f"{args.speed}x" if speed is not None else "max")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(result, f, indent=2)
+            f.write("\n")
+        print(f"\nrisultati salvati in {args.save}")
+
+
+if __name__ == "__main__":
+    main()
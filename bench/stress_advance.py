@@ -0,0 +1,99 @@
+"""Stress test di concorrenza su /sfc/<id>/advance e /sfc.
+
+Molti thread avanzano gli stessi SFC e ne creano di nuovi in parallelo; alla fine
+verifica che non ci siano aggiornamenti persi, ID duplicati o stati incoerenti.
+
+    python bench/stress_advance.py                      # in-process (Flask test client)
+    python bench/stress_advance.py --url http://localhost:80
+
+Esce con codice 1 se trova incoerenze.
+"""
+import argparse
+import sys
+import threading
+import time
+
+from clients import HTTPClient, LocalClient, load_app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", help="server da stressare (default: app in-process)")
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--sfcs", type=int, default=4, help="SFC avanzati in parallelo da tutti i thread")
+    parser.add_argument("--advances", type=int, default=25, help="advance per thread per SFC")
+    parser.add_argument("--creates", type=int, default=50, help="SFC creati da ogni thread")
+    args = parser.parse_args()
+
+    if args.url:
+        make_client = lambda: HTTPClient(args.url)
+    else:
+        app = load_app()
+        make_client = lambda: LocalClient(app)
+
+    total_advances = args.threads * args.advances
+    setup = make_client()
+    # Routing più lungo degli advance totali: ogni advance deve completare esattamente un'operazione
+    _, routing = setup.request("POST", "/routing", {"operations": total_advances + 1})
+    targets = []
+    for _ in range(args.sfcs):
+        _, body = setup.request("POST", "/sfc")
+        setup.request("POST", f"/sfc/{body['sfc_id']}/assign_routing", {"routing_id": routing["routing_id"]})
+        targets.append(body["sfc_id"])
+
+    created = []
+    errors = []
+    barrier = threading.Barrier(args.threads)
+
+    def worker():
+        client = make_client()
+        mine = []
+        barrier.wait()
+        try:
+            for i in range(args.advances):
+                for sfc_id in targets:
+                    status, _ = client.request("POST", f"/sfc/{sfc_id}/advance")
+                    if status != 200:
+                        errors.append(f"advance {sfc_id}: status {status}")
+                if i < args.creates:
+                    mine.append(client.request("POST", "/sfc")[1]["sfc_id"])
+        except Exception as e:
+            errors.append(repr(e))
+        created.extend(mine)
+
+    threads = [threading.Thread(target=worker) for _ in range(args.threads)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    requests = args.threads * (args.advances * len(targets) + min(args.advances, args.creates))
+
+    # Verifiche
+    if len(created) != len(set(created)):
+        errors.append(f"ID SFC duplicati: {len(created) - len(set(created))}")
+    for sfc_id in targets:
+        _, body = setup.request("GET", f"/sfc/{sfc_id}")
+        states = [op["state"] for op in body["operations"]]
+        if states.count("done") != total_advances:
+            errors.append(f"{sfc_id}: {states.count('done')} operazioni done, attese {total_advances}")
+        if states.count("in work") != 1 or states.index("in work") != total_advances:
+            errors.append(f"{sfc_id}: operazione in work errata")
+    _, listing = setup.request("GET", "/sfcs?fields=sfc_state")
+    for sfc_id in targets:
+        _, in_index = setup.request("GET", f"/sfcs?state=In%20Work&fields=sfc_state&routing={routing['routing_id']}")
+        if sfc_id not in in_index or listing[sfc_id]["sfc_state"] != "In Work":
+            errors.append(f"{sfc_id}: indice per stato incoerente")
+
+    print(f"{requests} richieste in {elapsed:.2f}s ({requests / elapsed:.0f} req/s) con {args.threads} thread")
+    if errors:
+        print(f"FALLITO: {len(errors)} incoerenze")
+        for e in errors[:20]:
+            print(" -", e)
+        sys.exit(1)
+    print("OK: nessun aggiornamento perso, nessun ID duplicato")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Configurazione gunicorn per il mock MES in produzione.
+
+    gunicorn -c gunicorn.conf.py mock-mes:app
+
+Variabili d'ambiente:
+- PORT: porta di ascolto (default 80)
+- MES_WORKERS: numero di processi worker (default 1)
+- MES_CONNECTIONS: connessioni contemporanee per worker con il backend memory (default 10000)
+- MES_THREADS: thread per worker con il backend shared (default 4)
+- MES_HELD_THREADS: thread per worker che gli stream SSE possono occupare con il
+  backend shared (default MES_THREADS - 1); gli stream oltre il limite ricevono 503
+- MES_STATE_BACKEND: memory (default) oppure shared. Con più di un worker serve
+  shared: lo stato vive in un processo dedicato avviato dal master (vedi mes_backend).
+
+Con il backend memory il worker è gevent: stream SSE, connessioni inattive e attese
+simulate sono greenlet, non thread, e migliaia di client aperti costano pochi KB l'uno.
+Con il backend shared le chiamate al processo di stato sono bloccanti (socket di
+multiprocessing), quindi il worker resta gthread.
+- MES_DATA_DIR, MES_SEED, MES_SFCS, ...: persistenza e dati generati
+  (vedi mes_persistence e mes_generator)
+- MES_CAPTURE: file in cui tutti i worker registrano il traffico (vedi mes_capture)
+- MES_CAPTURE_SAMPLE: digest del body per una risposta ogni N nella cattura (default 1)
+"""
+import importlib
+import os
+import subprocess
+import sys
+
+import mes_backend
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 80)}"
+workers = int(os.environ.get("MES_WORKERS", 1))
+if mes_backend.is_shared():
+    worker_class = "gthread"
+    threads = int(os.environ.get("MES_THREADS", 4))
+    # Stream SSE trattenuti al massimo da threads - 1 thread per worker: oltre l'app
+    # risponde 503, così un thread resta sempre libero per le API (vedi mock-mes.py)
+    os.environ.setdefault("MES_HELD_THREADS", str(max(0, threads - 1)))
+else:
+    worker_class = "gevent"
+    worker_connections = int(os.environ.get("MES_CONNECTIONS", 10000))
+keepalive = 5
+accesslog = None
+
+if workers > 1 and not mes_backend.is_shared():
+    raise SystemExit("MES_WORKERS > 1 richiede MES_STATE_BACKEND=shared")
+
+_state_server = None
+
+
+def on_starting(server):
+    """Avvia il server di stato condiviso prima dei worker"""
+    global _state_server
+    if mes_backend.is_shared():
+        _state_server = subprocess.Popen([sys.executable, mes_backend.__file__])
+        server.log.info("State server avviato (pid %s) su %s", _state_server.pid, mes_backend.state_address())
+
+
+def post_worker_init(worker):
+    """Popola lo stato del worker (backend memory) dopo l'avvio, non all'import dell'app"""
+    if not mes_backend.is_shared():
+        importlib.import_module("mock-mes").init_state()
+
+
+def on_exit(server):
+    if _state_server is not None:
+        _state_server.terminate()
@@ -0,0 +1,246 @@
+"""Analytics incrementali per routing e operazione: WIP e tempi di ciclo (/analytics).
+
+Come il feed delle modifiche, Analytics è un listener di MESState: a ogni transizione
+(assign, advance, rollback, force_advance, rollback_single) aggiorna solo le operazioni
+che hanno cambiato stato. Le letture costano O(numero di operazioni), non O(numero di SFC).
+
+- conteggi: per ogni routing un array di 4 contatori (blank, in work, done, bypassed) per operazione
+- tempo di ciclo: da quando l'operazione diventa 'in work' a quando advance la completa.
+  L'istante di inizio è in un array indicizzato dalla posizione dello SFC (8 byte per SFC);
+  le durate finiscono in uno sketch di quantili per operazione con errore relativo dell'1%.
+
+Contatori e sketch sono divisi in ANALYTICS_STRIPES gruppi, ciascuno con il proprio lock,
+scelti dall'hash dello SFC come i lock di MESState: transizioni di SFC in gruppi diversi non
+si attendono a vicenda nel listener. Le letture sommano i gruppi.
+
+I conteggi sono ricostruiti dallo stato all'avvio (rebuild); i tempi di ciclo partono vuoti
+e contano solo le operazioni iniziate dopo l'avvio (quelle dei dati generati non hanno un inizio).
+"""
+from array import array
+import math
+import threading
+import time
+
+from mes_store import OPERATION_STATES
+
+STATES = len(OPERATION_STATES)
+IN_WORK = OPERATION_STATES.index("in work")
+
+# Errore relativo dei quantili e durata minima distinta (sotto finisce nel primo bucket)
+ACCURACY = 0.01
+MIN_SECONDS = 1e-6
+QUANTILES = (0.5, 0.9, 0.99)
+# Gruppi di contatori (divisore di LOCK_STRIPES: uno SFC finisce sempre nello stesso gruppo)
+ANALYTICS_STRIPES = 16
+
+_GAMMA = (1 + ACCURACY) / (1 - ACCURACY)
+_LOG_GAMMA = math.log(_GAMMA)
+
+
+class QuantileSketch:
+    """Quantili approssimati in memoria limitata: bucket logaritmici (come DDSketch).
+    Il valore restituito ha errore relativo al massimo ACCURACY; i bucket tra 1 µs e
+    un giorno sono circa 1300, in pratica ne vengono occupati poche decine.
+    """
+    __slots__ = ("buckets", "count", "total", "min", "max")
+
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def add(self, seconds):
+        index = math.ceil(math.log(max(seconds, MIN_SECONDS)) / _LOG_GAMMA)
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+        self.total += seconds
+        if seconds < self.min:
+            self.min = seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def merge(self, other):
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q):
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen > rank:
+                break
+        value = 2 * _GAMMA ** index / (_GAMMA + 1)
+        return min(max(value, self.min), self.max)
+
+    def summary(self):
+        if not self.count:
+            return {"count": 0}
+        summary = {"count": self.count, "mean": round(self.total / self.count, 6),
+                   "min": round(self.min, 6), "max": round(self.max, 6)}
+        for q in QUANTILES:
+            summary[f"p{round(q * 100)}"] = round(self.quantile(q), 6)
+        return summary
+
+
+class RoutingStats:
+    """Contatori e sketch delle operazioni di un routing"""
+    __slots__ = ("template", "counts", "cycle")
+
+    def __init__(self, template):
+        n = len(template)
+        self.template = template
+        self.counts = array("q", bytes(8 * STATES * n))     # operazione i, stato s -> counts[i * STATES + s]
+        self.cycle = [QuantileSketch() for _ in range(n)]
+
+    def add(self, states, sign):
+        counts = self.counts
+        for i, s in enumerate(states):
+            counts[i * STATES + s] += sign
+
+    def merge(self, other):
+        counts = self.counts
+        for i, count in enumerate(other.counts):
+            counts[i] += count
+        for sketch, part in zip(self.cycle, other.cycle):
+            sketch.merge(part)
+
+    def sfcs(self):
+        """SFC con questo routing: ognuno ha esattamente uno stato per la prima operazione"""
+        return sum(self.counts[:STATES])
+
+
+class _Stripe:
+    """Gruppo di contatori: Routing ID -> RoutingStats parziale, con il suo lock"""
+    __slots__ = ("lock", "routings")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.routings = {}
+
+
+class Analytics:
+    """Listener di MESState con WIP e tempi di ciclo per (routing, operazione)"""
+
+    def __init__(self, state, clock=time.monotonic):
+        self.state = state
+        self.clock = clock
+        self._stripes = [_Stripe() for _ in range(ANALYTICS_STRIPES)]
+        # posizione SFC -> inizio dell'operazione in work (0 = ignoto). Ogni elemento è scritto
+        # solo sotto il lock del proprio SFC; il lock serve solo ad allungare l'array
+        self._started = array("d")
+        self._grow_lock = threading.Lock()
+        self._listening = False
+        self.rebuild()
+
+    def rebuild(self):
+        """Ricalcola i conteggi dallo stato (all'avvio, dopo il caricamento dei dati).
+        Con le mutazioni bloccate: dopo il ricalcolo gli aggiornamenti arrivano dal listener.
+        """
+        state = self.state
+        with state.freeze():
+            patterns = {}
+            for sfc in list(state.sfcs.values()):
+                if sfc.routing is not None:
+                    key = (sfc.routing, bytes(sfc.states))
+                    patterns[key] = patterns.get(key, 0) + 1
+            # Con le mutazioni bloccate il listener non scrive: niente lock dei gruppi
+            for stripe in self._stripes:
+                stripe.routings = {}
+            for (routing_id, states), count in patterns.items():
+                self._stats(self._stripes[0], routing_id).add(states, count)
+            if len(self._started) < len(state.sfc_ids):
+                self._started.extend(bytes(8 * (len(state.sfc_ids) - len(self._started))))
+            if not self._listening:
+                state.add_listener(self)
+                self._listening = True
+
+    def _stats(self, stripe, routing_id):
+        stats = stripe.routings.get(routing_id)
+        if stats is None:
+            stats = stripe.routings[routing_id] = RoutingStats(self.state.routings[routing_id])
+        return stats
+
+    def _merged(self, routing_ids):
+        """Routing ID -> somma dei gruppi (ogni gruppo letto una volta, sotto il proprio lock)"""
+        merged = {routing_id: RoutingStats(self.state.routings[routing_id]) for routing_id in routing_ids}
+        for stripe in self._stripes:
+            with stripe.lock:
+                for routing_id, part in stripe.routings.items():
+                    if routing_id in merged:
+                        merged[routing_id].merge(part)
+        return merged
+
+    # ---------------------------
+    # Listener di MESState (sotto il lock dello SFC)
+    # ---------------------------
+    def __call__(self, event):
+        kind = event.kind
+        sfc = event.sfc
+        if kind in ("create_sfc", "create_routing") or sfc.routing is None:
+            return
+        now = self.clock()
+        started = self._started
+        pos = sfc.pos
+        if pos >= len(started):
+            with self._grow_lock:
+                if pos >= len(started):
+                    started.extend(bytes(8 * (pos + 1 - len(started))))
+        stripe = self._stripes[hash(event.sfc_id) % ANALYTICS_STRIPES]
+        with stripe.lock:
+            if kind == "assign":
+                if event.prev_routing is not None:
+                    self._stats(stripe, event.prev_routing).add(event.prev_ops, -1)
+                self._stats(stripe, sfc.routing).add(sfc.states, 1)
+            else:
+                stats = self._stats(stripe, sfc.routing)
+                counts = stats.counts
+                for i, (old, new) in enumerate(zip(event.prev_ops, sfc.states)):
+                    if old != new:
+                        counts[i * STATES + old] -= 1
+                        counts[i * STATES + new] += 1
+                if kind == "advance":
+                    # L'operazione completata è quella che era 'in work' prima della transizione
+                    done = event.prev_ops.find(IN_WORK)
+                    if done >= 0 and started[pos]:
+                        stats.cycle[done].add(now - started[pos])
+        started[pos] = now if sfc.current >= 0 else 0.0
+
+    # ---------------------------
+    # Letture (O(operazioni))
+    # ---------------------------
+    def overview(self):
+        """Per ogni routing: SFC, WIP e tempo medio in work per operazione"""
+        routings = {}
+        for routing_id, stats in self._merged(list(self.state.routing_ids)).items():
+            counts = stats.counts
+            routings[routing_id] = {
+                "sfcs": stats.sfcs(),
+                "wip": [counts[i * STATES + IN_WORK] for i in range(len(stats.template))],
+                "cycle_time_mean": [round(c.total / c.count, 6) if c.count else None for c in stats.cycle],
+            }
+        return {"routings": routings}
+
+    def routing_report(self, routing_id):
+        """Dettaglio di un routing: conteggi per stato e tempi di ciclo per operazione; (body, status)"""
+        if routing_id not in self.state.routings:
+            return {"error": "Routing not found"}, 404
+        stats = self._merged([routing_id])[routing_id]
+        counts = stats.counts
+        operations = []
+        for i, (op_id, description) in enumerate(zip(stats.template.ids, stats.template.descriptions)):
+            operations.append({
+                "id": op_id,
+                "description": description,
+                "states": {name: counts[i * STATES + s] for s, name in enumerate(OPERATION_STATES)},
+                "cycle_time": stats.cycle[i].summary(),
+            })
+        return {"routing": routing_id, "sfcs": stats.sfcs(), "operations": operations}, 200
@@ -0,0 +1,401 @@
+"""Logica degli endpoint REST del mock MES, indipendente dal server HTTP.
+
+La usano sia l'app Flask (mock-mes.py) sia il server asyncio (mes_async.py):
+validazione dei parametri, chiamate a MESState e forma delle risposte sono in un
+solo punto, quindi i due server restituiscono le stesse risposte.
+I metodi ricevono valori già estratti dalla richiesta (parametri del path, query
+string come mapping, body JSON) e restituiscono una Reply, che ciascun server
+converte nella propria risposta.
+"""
+import random
+
+import mes_json
+from mes_core import COMPACT_FIELDS, MAX_BULK_ITEMS, SFC_FIELDS, SFC_STATES, VIEW_FIELDS, MESState, PageError
+from mes_feed import DEFAULT_QUEUE_SIZE
+from mes_history import DEFAULT_HISTORY_LIMIT, MAX_HISTORY_LIMIT, parse_time_range
+
+JSON = "application/json"
+NDJSON = "application/x-ndjson"
+EVENT_STREAM = "text/event-stream; charset=utf-8"
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+# Dimensione delle pagine richieste al backend condiviso durante lo streaming NDJSON
+STREAM_CHUNK = 1000
+# Secondi senza eventi dopo cui /events invia un commento di keep-alive
+KEEPALIVE_SECONDS = 15
+
+
+class Reply:
+    """Risposta di un endpoint.
+    - payload: oggetto da serializzare come JSON (come jsonify)
+    - body: bytes già pronti, oppure un iteratore di bytes da inviare in streaming
+    """
+    __slots__ = ("status", "payload", "body", "content_type", "headers")
+
+    def __init__(self, status=200, payload=None, body=None, content_type=JSON, headers=None):
+        self.status = status
+        self.payload = payload
+        self.body = body
+        self.content_type = content_type
+        self.headers = headers or {}
+
+    @property
+    def streaming(self):
+        return self.body is not None and not isinstance(self.body, bytes)
+
+    def content(self):
+        """Body in bytes (solo per le risposte non in streaming)"""
+        if self.body is None:
+            return b"" if self.payload is None else mes_json.dumps(self.payload) + b"\n"
+        return self.body
+
+
+def json_reply(payload, status=200):
+    return Reply(status, payload)
+
+def error_reply(message, status=400):
+    return Reply(status, {"error": message})
+
+
+# ---------------------------
+# Helper
+# ---------------------------
+def parse_page_args(args):
+    """Legge limit e cursor dalla query string.
+    Il cursore è la posizione (in ordine di creazione) da cui riprendere la scansione.
+    """
+    try:
+        limit = int(args["limit"]) if "limit" in args else None
+    except ValueError:
+        raise PageError("Invalid limit")
+    if limit is not None and limit < 1:
+        raise PageError("Invalid limit")
+    try:
+        cursor = int(args.get("cursor", 0))
+    except ValueError:
+        raise PageError("Invalid cursor")
+    return limit, cursor
+
+def ndjson_lines(items, limit, render):
+    """Righe NDJSON generate man mano, senza costruire la lista in memoria.
+    items è un iteratore di (posizione, elemento).
+    Se è richiesto un limit, l'ultima riga riporta il cursore della pagina successiva.
+    """
+    dumps = mes_json.dumps
+    count = 0
+    next_cursor = None
+    for pos, item in items:
+        if limit is not None and count == limit:
+            next_cursor = str(pos)
+            break
+        yield dumps(render(item)) + b"\n"
+        count += 1
+    if limit is not None:
+        yield dumps({"next_cursor": next_cursor}) + b"\n"
+
+def iter_pages(list_page, cursor, **kwargs):
+    """Scorre un elenco del backend condiviso a pagine di STREAM_CHUNK elementi.
+    Genera (posizione, elemento) come gli iteratori di MESState.
+    """
+    while True:
+        page, next_cursor = list_page(cursor=cursor, limit=STREAM_CHUNK, positions=True, **kwargs)
+        yield from page
+        if next_cursor is None:
+            return
+        cursor = int(next_cursor)
+
+def parse_view(args):
+    """?view=: True per la vista compatta, False per quella completa (default)"""
+    view = args.get("view", "full")
+    if view not in ("full", "compact"):
+        raise PageError("Invalid view")
+    return view == "compact"
+
+def parse_etags(value):
+    """ETag di un header If-None-Match (senza virgolette né prefisso W/)"""
+    etags = []
+    for tag in (value or "").split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if len(tag) >= 2 and tag[0] == tag[-1] == '"':
+            etags.append(tag[1:-1])
+    return tuple(etags)
+
+
+# ---------------------------
+# Endpoint
+# ---------------------------
+class MESApi:
+    """Endpoint REST su uno stato (MESState o proxy del backend condiviso), un feed, la simulazione
+    gli analytics (mes_analytics), lo storico delle transizioni (mes_history) e il profilo
+    di fault del processo (mes_faults)
+    """
+
+    def __init__(self, state, feed, simulation=None, analytics=None, history=None, faults=None):
+        self.state = state
+        self.feed = feed
+        self.simulation = simulation
+        self.analytics = analytics
+        self.history = history
+        self.faults = faults
+
+    def create_sfc(self, data=None):
+        """Nuovo SFC; con {"sfc_id": ...} usa l'ID indicato (assegnato dal router degli shard)"""
+        if data and "sfc_id" in data:
+            return json_reply(*self.state.claim_sfc(data["sfc_id"]))
+        return json_reply({"sfc_id": self.state.create_sfc()})
+
+    def create_routing(self, data):
+        n = data.get("operations", random.randint(1, 15))
+        if "routing_id" in data:
+            return json_reply(*self.state.claim_routing(n, data["routing_id"]))
+        return json_reply(self.state.create_routing(n))
+
+    def assign_routing(self, sfc_id, data):
+        return json_reply(*self.state.assign_routing(sfc_id, data.get("routing_id")))
+
+    def transition(self, action, sfc_id, data):
+        """advance (o complete), rollback, force_advance, rollback_single"""
+        state = self.state
+        if action in ("advance", "complete"):
+            return json_reply(*state.advance(sfc_id))
+        if action == "rollback_single":
+            return json_reply(*state.rollback_single(sfc_id))
+        return json_reply(*getattr(state, action)(sfc_id, data.get("step")))
+
+    def bulk_create(self, data):
+        return json_reply(*self.state.bulk_create(data.get("count"), data.get("routing_id"), data.get("sfc_ids")))
+
+    def bulk_assign_routing(self, data):
+        return json_reply(*self.state.bulk_assign_routing(data.get("routing_id"), data.get("sfc_ids")))
+
+    def bulk_transition(self, action, data):
+        """SFC indicati da items o sfc_ids, oppure selezionati con routing e/o sfc_state:
+        in questo caso al massimo limit (default MAX_BULK_ITEMS) a partire da cursor,
+        e la risposta riporta next_cursor per proseguire.
+        Con "view": "compact" i risultati riportano solo sfc_state e step al posto delle operazioni.
+        """
+        selection = "items" not in data and "sfc_ids" not in data and bool(data.get("routing") or data.get("sfc_state"))
+        if "items" in data:
+            items = data["items"]
+            if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+                return error_reply("Invalid items")
+        elif selection:
+            routing = data.get("routing")
+            if routing is not None and not isinstance(routing, str):
+                return error_reply("Invalid routing")
+            if data.get("sfc_state") is not None and data["sfc_state"] not in SFC_STATES:
+                return error_reply("Invalid sfc_state")
+            if routing is not None and not self.state.routing_exists(routing):
+                return error_reply("Routing not found", 404)
+            try:
+                limit, cursor = parse_page_args(data)
+                if limit is not None and limit > MAX_BULK_ITEMS:
+                    raise PageError("Invalid limit")
+                page, next_cursor = self.state.list_sfcs(routing=routing, state=data.get("sfc_state"), cursor=cursor,
+                                                         limit=limit or MAX_BULK_ITEMS, fields=("sfc_state",))
+            except PageError as e:
+                return error_reply(str(e))
+            except TypeError:
+                return error_reply("Invalid limit or cursor")
+            items = [{"sfc_id": sfc_id, "step": data.get("step")} for sfc_id, _ in page]
+        else:
+            sfc_list = data.get("sfc_ids")
+            if not isinstance(sfc_list, list):
+                return error_reply("Invalid sfc_ids")
+            items = [{"sfc_id": sfc_id, "step": data.get("step")} for sfc_id in sfc_list]
+        body, status = self.state.bulk_transition(action, items, data.get("view") == "compact")
+        if selection and status == 200:
+            body["next_cursor"] = next_cursor
+        return json_reply(body, status)
+
+    def get_sfc(self, sfc_id, if_none_match=(), args=None):
+        """JSON già serializzato (in cache finché lo SFC non cambia) con ETag:
+        con If-None-Match uguale alla versione corrente risponde 304 senza body.
+        Con ?view=compact restituisce la vista compatta, con un proprio ETag.
+        """
+        if args:
+            try:
+                compact = parse_view(args)
+            except PageError as e:
+                return error_reply(str(e))
+            if compact:
+                view, etag, status = self.state.get_sfc_view(sfc_id, COMPACT_FIELDS, tuple(if_none_match))
+                headers = {"ETag": f'"{etag}"'} if etag is not None else None
+                body = b"" if view is None else mes_json.dumps(view) + b"\n"
+                return Reply(status, body=body, headers=headers)
+        body, etag, status = self.state.get_sfc_json(sfc_id, tuple(if_none_match))
+        headers = {"ETag": f'"{etag}"'} if etag is not None else None
+        return Reply(status, body=body if body is not None else b"", headers=headers)
+
+    def _stream_items(self, kind, cursor, **kwargs):
+        """Elementi da mettere in streaming (kind: "sfcs" o "routings").
+        Iteratore diretto se lo stato è locale, a pagine se è condiviso.
+        """
+        if isinstance(self.state, MESState):
+            return getattr(self.state, f"iter_{kind}")(cursor=cursor, **kwargs)
+        return iter_pages(getattr(self.state, f"list_{kind}"), cursor, **kwargs)
+
+    def list_sfcs(self, args, routing=None):
+        """Elenco SFC con filtri, proiezione (o vista compatta), paginazione e streaming"""
+        if routing is not None and not self.state.routing_exists(routing):
+            return error_reply("Routing not found", 404)
+        try:
+            fields = COMPACT_FIELDS if parse_view(args) else SFC_FIELDS
+        except PageError as e:
+            return error_reply(str(e))
+        if "fields" in args:
+            fields = tuple(f for f in args["fields"].split(",") if f)
+            if any(f not in VIEW_FIELDS for f in fields):
+                return error_reply("Invalid fields")
+        query = {
+            "routing": routing or args.get("routing"),
+            "state": args.get("sfc_state", args.get("state")),
+            "fields": fields,
+        }
+        try:
+            limit, cursor = parse_page_args(args)
+            if args.get("format") == "ndjson":
+                items = self._stream_items("sfcs", cursor, **query)
+                lines = ndjson_lines(items, limit, lambda item: {"sfc_id": item[0], **item[1]})
+                return Reply(body=lines, content_type=NDJSON)
+            page, next_cursor = self.state.list_sfcs(cursor=cursor, limit=limit, **query)
+        except PageError as e:
+            return error_reply(str(e))
+
+        all_sfcs = dict(page)
+        if limit is None and "cursor" not in args:
+            return json_reply(all_sfcs)
+        return json_reply({"sfcs": all_sfcs, "next_cursor": next_cursor})
+
+    def list_routings(self, args):
+        """Elenco routing; con ?view=compact solo il numero di operazioni di ciascuno"""
+        try:
+            compact = parse_view(args)
+            limit, cursor = parse_page_args(args)
+            if args.get("format") == "ndjson":
+                items = self._stream_items("routings", cursor)
+                ops = len if compact else (lambda operations: operations)
+                lines = ndjson_lines(items, limit, lambda item: {"routing_id": item[0], "operations": ops(item[1])})
+                return Reply(body=lines, content_type=NDJSON)
+            if compact:
+                page, next_cursor = self.state.list_routings(cursor=cursor, limit=limit)
+                sizes = {routing_id: len(operations) for routing_id, operations in page}
+                if limit is None and "cursor" not in args:
+                    return json_reply(sizes)
+                return json_reply({"routings": sizes, "next_cursor": next_cursor})
+            # Operazioni dei routing serializzate una volta sola (i template sono immutabili)
+            all_routings, next_cursor = self.state.routings_json(cursor=cursor, limit=limit)
+        except PageError as e:
+            return error_reply(str(e))
+
+        if limit is None and "cursor" not in args:
+            body = all_routings
+        else:
+            body = b'{"next_cursor":' + mes_json.dumps(next_cursor) + b',"routings":' + all_routings + b"}"
+        return Reply(body=body + b"\n")
+
+    def summary(self, args, routing=None):
+        """SFC per stato (ed eventualmente per routing) senza elencarli"""
+        routing = routing or args.get("routing")
+        if routing is not None and not self.state.routing_exists(routing):
+            return error_reply("Routing not found", 404)
+        return json_reply(self.state.summary(routing))
+
+    def analytics_overview(self):
+        """WIP e tempo medio in work per operazione di ogni routing"""
+        if self.analytics is None:
+            return error_reply("Analytics not enabled", 501)
+        return json_reply(self.analytics.overview())
+
+    def analytics_routing(self, routing_id):
+        """Conteggi per stato e quantili del tempo di ciclo per operazione del routing"""
+        if self.analytics is None:
+            return error_reply("Analytics not enabled", 501)
+        return json_reply(*self.analytics.routing_report(routing_id))
+
+    def sfc_history(self, sfc_id, args):
+        """Transizioni dello SFC (ring buffer limitato), opzionalmente tra since e until"""
+        if self.history is None:
+            return error_reply("History not enabled", 501)
+        try:
+            since, until = parse_time_range(args)
+            limit, _ = parse_page_args(args)
+        except PageError as e:
+            return error_reply(str(e))
+        return json_reply(*self.history.sfc_history(sfc_id, since, until, limit))
+
+    def history_events(self, args):
+        """Transizioni di tutti gli SFC tra since e until, in ordine di tempo, a pagine"""
+        if self.history is None:
+            return error_reply("History not enabled", 501)
+        try:
+            since, until = parse_time_range(args)
+            limit, cursor = parse_page_args(args)
+            if limit is not None and limit > MAX_HISTORY_LIMIT:
+                raise PageError("Invalid limit")
+        except PageError as e:
+            return error_reply(str(e))
+        return json_reply(self.history.events(since, until, cursor, limit or DEFAULT_HISTORY_LIMIT))
+
+    def simulation_status(self):
+        return json_reply(*self.simulation.status())
+
+    def simulation_start(self, data):
+        return json_reply(*self.simulation.start(data))
+
+    def simulation_stop(self):
+        return json_reply(*self.simulation.stop())
+
+    def simulation_speed(self, data):
+        return json_reply(*self.simulation.set_speed(data.get("speed")))
+
+    def faults_status(self):
+        """Profilo di fault corrente con i contatori delle regole"""
+        if self.faults is None:
+            return error_reply("Fault injection not enabled", 501)
+        return json_reply(*self.faults.status())
+
+    def faults_configure(self, data):
+        """Sostituisce il profilo di fault ({"rules": []} lo disattiva)"""
+        if self.faults is None:
+            return error_reply("Fault injection not enabled", 501)
+        return json_reply(*self.faults.configure(data))
+
+    def subscribe(self, args, last_event_id=None, notify=None):
+        """Registra un sottoscrittore di /events: (ID, None) oppure (None, Reply di errore).
+        notify: callback per i server asincroni (vedi ChangeFeed.subscribe)
+        """
+        try:
+            if last_event_id is None:
+                last_event_id = args.get("last_event_id")
+            options = {} if notify is None else {"notify": notify}
+            sub_id = self.feed.subscribe(
+                sfc_id=args.get("sfc_id"),
+                routing=args.get("routing"),
+                state=args.get("sfc_state", args.get("state")),
+                types=[t for t in args["types"].split(",") if t] if "types" in args else None,
+                queue_size=int(args.get("queue", DEFAULT_QUEUE_SIZE)),
+                policy=args.get("policy", "drop_oldest"),
+                last_event_id=int(last_event_id) if last_event_id else None,
+                **options,
+            )
+        except OverflowError as e:
+            return None, error_reply(str(e), 503)
+        except ValueError as e:
+            return None, error_reply(str(e) if "Invalid" in str(e) else "Invalid parameters")
+        return sub_id, None
+
+    def event_stream(self, sub_id):
+        """Stream SSE bloccante (un thread per client): attende gli eventi con ChangeFeed.poll"""
+        feed = self.feed
+        try:
+            yield b"retry: 3000\n\n"
+            while True:
+                frames, closed = feed.poll(sub_id, KEEPALIVE_SECONDS)
+                yield b"".join(frames) if frames else b": keepalive\n\n"
+                if closed:
+                    return
+        finally:
+            feed.unsubscribe(sub_id)
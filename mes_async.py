@@ -0,0 +1,472 @@
+"""Server asyncio del mock MES: stesso contratto REST dell'app Flask, in un solo thread.
+
+    python mes_async.py          # porta da PORT (default 80), come mock-mes.py
+
+Gli endpoint sono quelli di mes_api (condivisi con mock-mes.py), lo stato è un
+MESState in memoria con lo stesso bootstrap (persistenza, dati generati). Il server
+HTTP/1.1 usa solo la libreria standard: keep-alive, pipelining, body con
+Content-Length o chunked, risposte in streaming chunked (NDJSON e SSE).
+Una connessione inattiva o in attesa di eventi su /events costa solo un
+oggetto sul loop, non un thread: il server regge decine di migliaia di client
+collegati su un core.
+
+Differenze rispetto all'app Flask:
+- i 404/405/400 generati dal server (route inesistenti, richieste malformate) sono
+  JSON ({"error": ...}) invece delle pagine HTML di Werkzeug
+- niente /debug/profile; niente HEAD/OPTIONS automatici
+- solo backend di stato in memoria (MES_STATE_BACKEND=shared non è supportato)
+"""
+import asyncio
+from email.utils import formatdate
+from http import HTTPStatus
+import logging
+import os
+import re
+import signal
+import threading
+import time
+from urllib.parse import parse_qsl, unquote
+
+from mes_analytics import Analytics
+from mes_api import EVENT_STREAM, KEEPALIVE_SECONDS, SSE_HEADERS, MESApi, Reply, error_reply, parse_etags
+from mes_backend import is_shared
+import mes_json
+from mes_core import MESState
+from mes_faults import FaultInjector
+from mes_feed import ChangeFeed
+from mes_history import History
+from mes_metrics import CONTENT_TYPE, Metrics
+from mes_persistence import bootstrap
+from mes_simulation import Simulation, SimulationSettings, simulation_enabled
+
+MAX_HEADER_BYTES = 64 * 1024
+MAX_BODY_BYTES = 16 * 1024 * 1024
+# Secondi dopo cui una connessione keep-alive senza richieste viene chiusa
+IDLE_TIMEOUT = float(os.environ.get("MES_IDLE_TIMEOUT", 300))
+# Byte accumulati prima di inviare un chunk delle risposte in streaming
+STREAM_FLUSH = 64 * 1024
+
+log = logging.getLogger("mes_async")
+
+
+class HTTPError(Exception):
+    """Richiesta HTTP malformata: risposta di errore e chiusura della connessione"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class Request:
+    __slots__ = ("method", "path", "query", "version", "headers", "body", "_args")
+
+    def __init__(self, method, path, query, version, headers, body=b""):
+        self.method = method
+        self.path = path
+        self.query = query
+        self.version = version
+        self.headers = headers          # nomi in minuscolo
+        self.body = body
+        self._args = None
+
+    @property
+    def args(self):
+        """Query string come dict (per le chiavi ripetute vale la prima, come request.args)"""
+        if self._args is None:
+            args = {}
+            for key, value in parse_qsl(self.query, keep_blank_values=True):
+                args.setdefault(key, value)
+            self._args = args
+        return self._args
+
+    @property
+    def keep_alive(self):
+        connection = self.headers.get("connection", "").lower()
+        if self.version == "HTTP/1.0":
+            return connection == "keep-alive"
+        return connection != "close"
+
+    @property
+    def is_json(self):
+        mimetype = self.headers.get("content-type", "").split(";")[0].strip().lower()
+        return mimetype == "application/json" or (mimetype.startswith("application/") and mimetype.endswith("+json"))
+
+    def data(self):
+        """Body JSON come dict, {} se assente o non valido (come request_data di mock-mes)"""
+        if not self.is_json:
+            return {}
+        try:
+            data = mes_json.loads(self.body)
+        except ValueError:
+            return {}
+        return data if isinstance(data, dict) else {}
+
+    def json(self):
+        """Body JSON obbligatorio (come request.json): HTTPError se manca o non è valido"""
+        if not self.is_json:
+            raise HTTPError(415, "Unsupported Media Type")
+        try:
+            return mes_json.loads(self.body)
+        except ValueError:
+            raise HTTPError(400, "Invalid JSON body")
+
+
+# ---------------------------
+# Route
+# ---------------------------
+class Router:
+    """Route nella sintassi di Flask ("/sfc/<sfc_id>"); il segmento variabile non contiene "/" """
+
+    def __init__(self):
+        self._routes = []               # (regex, metodo, rule, handler)
+
+    def add(self, method, rule, handler):
+        pattern = re.sub(r"<(\w+)>", r"(?P<\1>[^/]+)", rule)
+        self._routes.append((re.compile(pattern + "$"), method, rule, handler))
+
+    def match(self, method, path):
+        """(rule, handler, parametri); handler None e rule None se il path non esiste,
+        handler None e rule valorizzata se il metodo non è ammesso
+        """
+        allowed = None
+        for regex, route_method, rule, handler in self._routes:
+            m = regex.match(path)
+            if m is None:
+                continue
+            if route_method == method:
+                return rule, handler, m.groupdict()
+            allowed = rule
+        return allowed, None, None
+
+
+def build_router(api, metrics):
+    router = Router()
+    add = router.add
+    add("POST", "/sfc", lambda req: api.create_sfc(req.data()))
+    add("POST", "/routing", lambda req: api.create_routing(req.json()))
+    add("POST", "/sfc/<sfc_id>/assign_routing", lambda req, sfc_id: api.assign_routing(sfc_id, req.data()))
+    for action in ("advance", "rollback", "force_advance", "rollback_single", "complete"):
+        add("POST", f"/sfc/<sfc_id>/{action}",
+            lambda req, sfc_id, action=action: api.transition(action, sfc_id, req.data()))
+    add("POST", "/bulk/sfc", lambda req: api.bulk_create(req.data()))
+    add("POST", "/bulk/assign_routing", lambda req: api.bulk_assign_routing(req.data()))
+    add("POST", "/bulk/<action>", lambda req, action: api.bulk_transition(action, req.data()))
+    get_sfc = lambda req, sfc_id: api.get_sfc(sfc_id, parse_etags(req.headers.get("if-none-match")), req.args)
+    add("GET", "/sfc/<sfc_id>", get_sfc)
+    add("GET", "/sfc/<sfc_id>/routing_state", get_sfc)
+    add("GET", "/sfcs", lambda req: api.list_sfcs(req.args))
+    add("GET", "/routings/<routing_id>/sfcs", lambda req, routing_id: api.list_sfcs(req.args, routing_id))
+    add("GET", "/sfcs/summary", lambda req: api.summary(req.args))
+    add("GET", "/routings/<routing_id>/summary", lambda req, routing_id: api.summary(req.args, routing_id))
+    add("GET", "/routings", lambda req: api.list_routings(req.args))
+    add("GET", "/analytics", lambda req: api.analytics_overview())
+    add("GET", "/sfc/<sfc_id>/history", lambda req, sfc_id: api.sfc_history(sfc_id, req.args))
+    add("GET", "/history", lambda req: api.history_events(req.args))
+    add("GET", "/analytics/routings/<routing_id>", lambda req, routing_id: api.analytics_routing(routing_id))
+    add("GET", "/simulation", lambda req: api.simulation_status())
+    add("POST", "/simulation/start", lambda req: api.simulation_start(req.data()))
+    add("POST", "/simulation/stop", lambda req: api.simulation_stop())
+    add("POST", "/simulation/speed", lambda req: api.simulation_speed(req.data()))
+    add("GET", "/admin/faults", lambda req: api.faults_status())
+    add("POST", "/admin/faults", lambda req: api.faults_configure(req.json()))
+    add("GET", "/events", None)     # gestito dal server: lo stream attende gli eventi sul loop
+    add("GET", "/metrics", lambda req: Reply(body=metrics.render(api.state.stats()).encode(),
+                                             content_type=CONTENT_TYPE))
+    return router
+
+
+# ---------------------------
+# Server
+# ---------------------------
+_date_cache = [0, ""]
+
+def http_date():
+    now = int(time.time())
+    if _date_cache[0] != now:
+        _date_cache[:] = [now, formatdate(now, usegmt=True)]
+    return _date_cache[1]
+
+def response_head(status, content_type, headers, length=None, keep_alive=True, chunked=False):
+    """Status line e header. Senza length né chunked il body termina con la chiusura della connessione"""
+    lines = [f"HTTP/1.1 {status} {HTTPStatus(status).phrase}", f"Date: {http_date()}", "Server: mes-async"]
+    if status != 304:
+        lines.append(f"Content-Type: {content_type}")
+        if length is not None:
+            lines.append(f"Content-Length: {length}")
+        elif chunked:
+            lines.append("Transfer-Encoding: chunked")
+    lines += [f"{name}: {value}" for name, value in headers.items()]
+    if not keep_alive:
+        lines.append("Connection: close")
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+def chunk(data):
+    return b"%x\r\n%s\r\n" % (len(data), data)
+
+
+class AsyncMESServer:
+    """Server HTTP asyncio sugli endpoint di mes_api"""
+
+    def __init__(self, state, feed, simulation=None, analytics=None, history=None, faults=None):
+        self.state = state
+        self.feed = feed
+        self.faults = faults if faults is not None else FaultInjector()
+        self.api = MESApi(state, feed, simulation, analytics, history, self.faults)
+        self.metrics = Metrics()
+        self.router = build_router(self.api, self.metrics)
+        self.connections = 0
+        self.streams = 0
+        self._loop = None
+        self._loop_thread = None
+
+    async def start(self, host="0.0.0.0", port=80, **kwargs):
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        return await asyncio.start_server(self.handle, host, port, limit=MAX_HEADER_BYTES, **kwargs)
+
+    async def handle(self, reader, writer):
+        """Una connessione: richieste in sequenza finché il client la tiene aperta"""
+        self.connections += 1
+        try:
+            while True:
+                # Timer invece di wait_for: nessun task in più per richiesta
+                idle = self._loop.call_later(IDLE_TIMEOUT, writer.transport.abort)
+                try:
+                    request = await self.read_request(reader, writer)
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    return
+                except HTTPError as e:
+                    writer.write(self.render(error_reply(str(e), e.status), keep_alive=False))
+                    await writer.drain()
+                    return
+                finally:
+                    idle.cancel()
+                if request is None:
+                    return
+                if not await self.respond(request, reader, writer):
+                    return
+        except ConnectionError:
+            pass
+        finally:
+            self.connections -= 1
+            writer.close()
+
+    async def read_request(self, reader, writer):
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+        except asyncio.LimitOverrunError:
+            raise HTTPError(431, "Request header too large")
+        except asyncio.IncompleteReadError as e:
+            if not e.partial.strip():
+                return None         # connessione chiusa tra una richiesta e l'altra
+            raise
+        lines = head.decode("latin-1").split("\r\n")
+        try:
+            method, target, version = lines[0].split(" ")
+        except ValueError:
+            raise HTTPError(400, "Bad request line")
+        if version not in ("HTTP/1.1", "HTTP/1.0"):
+            raise HTTPError(505, "HTTP version not supported")
+        headers = {}
+        for line in lines[1:]:
+            if line:
+                name, _, value = line.partition(":")
+                headers[name.strip().lower()] = value.strip()
+        path, _, query = target.partition("?")
+        request = Request(method, unquote(path), query, version, headers)
+
+        if headers.get("expect", "").lower() == "100-continue":
+            writer.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+        if "chunked" in headers.get("transfer-encoding", "").lower():
+            request.body = await self.read_chunked(reader)
+        elif "content-length" in headers:
+            try:
+                length = int(headers["content-length"])
+            except ValueError:
+                raise HTTPError(400, "Invalid Content-Length")
+            if not 0 <= length <= MAX_BODY_BYTES:
+                raise HTTPError(413, "Request body too large")
+            request.body = await reader.readexactly(length)
+        return request
+
+    async def read_chunked(self, reader):
+        parts, size = [], 0
+        while True:
+            line = await reader.readline()
+            try:
+                length = int(line.split(b";")[0], 16)
+            except ValueError:
+                raise HTTPError(400, "Invalid chunk")
+            size += length
+            if size > MAX_BODY_BYTES:
+                raise HTTPError(413, "Request body too large")
+            if length == 0:
+                while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    pass            # trailer
+                return b"".join(parts)
+            parts.append(await reader.readexactly(length))
+            await reader.readexactly(2)
+
+    def render(self, reply, keep_alive=True, body=None):
+        """Risposta completa (non in streaming) in bytes"""
+        if reply.status == 304:
+            return response_head(304, None, reply.headers, keep_alive=keep_alive)
+        if body is None:
+            body = reply.content()
+        return response_head(reply.status, reply.content_type, reply.headers, len(body), keep_alive) + body
+
+    def dispatch(self, handler, rule, request, params):
+        if handler is None:
+            return error_reply("Method not allowed", 405) if rule else error_reply("Not found", 404)
+        try:
+            return handler(request, **params)
+        except HTTPError as e:
+            return error_reply(str(e), e.status)
+        except Exception:
+            log.exception("Errore in %s %s", request.method, request.path)
+            return error_reply("Internal server error", 500)
+
+    async def respond(self, request, reader, writer):
+        """Serve una richiesta; restituisce False se la connessione va chiusa"""
+        start = time.perf_counter()
+        keep_alive = request.keep_alive
+        rule, handler, params = self.router.match(request.method, request.path)
+        size = None
+        # Fault injection: l'attesa è un timer del loop, non occupa thread
+        fault = self.faults.plan(request.method, rule) if params is not None else None
+        bandwidth = fault.bandwidth if fault is not None else None
+        if fault is not None and fault.delay:
+            await asyncio.sleep(fault.delay)
+        if handler is None and params is not None and (fault is None or fault.status is None):
+            status, keep_alive = await self.stream_events(request, reader, writer)
+        else:
+            if fault is not None and fault.status is not None:
+                reply = error_reply(fault.message, fault.status)
+            else:
+                reply = self.dispatch(handler, rule, request, params)
+            status = reply.status
+            if reply.streaming:
+                keep_alive = keep_alive and request.version == "HTTP/1.1"
+                await self.stream(reply, writer, keep_alive, bandwidth)
+            else:
+                body = reply.content()
+                size = len(body)
+                await self.send(writer, self.render(reply, keep_alive, body), bandwidth)
+        route = rule if params is not None else "<unmatched>"
+        self.metrics.observe(request.method, route, status, time.perf_counter() - start, size)
+        return keep_alive
+
+    async def send(self, writer, data, bandwidth=None):
+        """Scrive data; con bandwidth (byte/s, fault injection) a pezzi da 1/10 di secondo"""
+        if not bandwidth:
+            writer.write(data)
+            await writer.drain()
+            return
+        step = max(1, int(bandwidth // 10))
+        for i in range(0, len(data), step):
+            piece = data[i:i + step]
+            writer.write(piece)
+            await writer.drain()
+            await asyncio.sleep(len(piece) / bandwidth)
+
+    async def stream(self, reply, writer, chunked, bandwidth=None):
+        """Body in streaming: chunked con HTTP/1.1, altrimenti delimitato dalla chiusura"""
+        writer.write(response_head(reply.status, reply.content_type, reply.headers, keep_alive=chunked, chunked=chunked))
+        encode = chunk if chunked else bytes
+        buffer, size = [], 0
+        for data in reply.body:
+            buffer.append(data)
+            size += len(data)
+            if size >= STREAM_FLUSH:
+                await self.send(writer, encode(b"".join(buffer)), bandwidth)
+                buffer, size = [], 0
+                await asyncio.sleep(0)      # lascia servire le altre connessioni
+        if buffer:
+            await self.send(writer, encode(b"".join(buffer)), bandwidth)
+        if chunked:
+            writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    async def stream_events(self, request, reader, writer):
+        """/events senza thread: il feed segnala i nuovi messaggi al loop tramite notify.
+        Restituisce (status, keep-alive)
+        """
+        wake = asyncio.Event()
+        loop, loop_thread = self._loop, self._loop_thread
+
+        def notify():
+            if threading.get_ident() == loop_thread:
+                wake.set()
+            else:
+                loop.call_soon_threadsafe(wake.set)
+
+        sub_id, error = self.api.subscribe(request.args, request.headers.get("last-event-id"), notify)
+        if error is not None:
+            writer.write(self.render(error, request.keep_alive))
+            await writer.drain()
+            return error.status, request.keep_alive
+        chunked = request.version == "HTTP/1.1"
+        encode = chunk if chunked else bytes
+        feed = self.feed
+        # Il client non invia altro: la lettura termina solo quando chiude la connessione
+        closed_by_client = asyncio.ensure_future(reader.read(1))
+        self.streams += 1
+        try:
+            writer.write(response_head(200, EVENT_STREAM, SSE_HEADERS, keep_alive=False, chunked=chunked))
+            writer.write(encode(b"retry: 3000\n\n"))
+            while True:
+                wake.clear()
+                frames, closed = feed.poll(sub_id, 0)
+                if frames:
+                    writer.write(encode(b"".join(frames)))
+                    await writer.drain()
+                if closed:
+                    break
+                if not frames:
+                    waiter = asyncio.ensure_future(wake.wait())
+                    done, _ = await asyncio.wait((waiter, closed_by_client), timeout=KEEPALIVE_SECONDS,
+                                                 return_when=asyncio.FIRST_COMPLETED)
+                    waiter.cancel()
+                    if closed_by_client in done:
+                        break
+                    if not done:
+                        writer.write(encode(b": keepalive\n\n"))
+                        await writer.drain()
+            if chunked:
+                writer.write(b"0\r\n\r\n")
+                await writer.drain()
+        finally:
+            self.streams -= 1
+            closed_by_client.cancel()
+            feed.unsubscribe(sub_id)
+        return 200, False
+
+
+# ---------------------------
+# Run Server
+# ---------------------------
+async def serve(host="0.0.0.0", port=80):
+    if is_shared():
+        raise SystemExit("mes_async usa lo stato in memoria: MES_STATE_BACKEND=shared non è supportato")
+    state = MESState()
+    feed = ChangeFeed(state)
+    simulation = Simulation(state, SimulationSettings.from_env())
+    bootstrap(state)
+    analytics = Analytics(state)
+    history = History(state)
+    if simulation_enabled():
+        simulation.start()
+    server = AsyncMESServer(state, feed, simulation, analytics, history, FaultInjector.from_env())
+    listener = await server.start(host, port, backlog=4096)
+    # SIGTERM (docker stop) chiude il server in modo ordinato: gli hook atexit salvano la persistenza
+    stop = asyncio.Event()
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop.set)
+    async with listener:
+        await stop.wait()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(serve(port=int(os.environ.get("PORT", 80))))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,120 @@
+"""Backend dello stato del MES.
+
+- memory: MESState vive nel processo del server (dev server o un solo worker)
+- shared: MESState vive in un processo dedicato e i worker lo usano tramite
+  un proxy multiprocessing, così più worker vedono gli stessi SFC
+
+Configurazione tramite variabili d'ambiente:
+MES_STATE_BACKEND (memory|shared), MES_STATE_ADDRESS, MES_STATE_AUTHKEY.
+"""
+import os
+import time
+from multiprocessing.managers import BaseManager
+
+from mes_analytics import Analytics
+from mes_core import MESState
+from mes_feed import ChangeFeed
+from mes_history import History
+from mes_persistence import bootstrap
+from mes_simulation import Simulation, SimulationSettings, simulation_enabled
+
+DEFAULT_ADDRESS = "/tmp/mock-mes-state.sock"
+
+# Metodi di MESState raggiungibili dai worker (i generatori non sono serializzabili)
+EXPOSED = (
+    "create_sfc", "create_routing", "claim_sfc", "claim_routing", "routing_exists",
+    "assign_routing", "advance", "rollback", "force_advance", "rollback_single",
+    "get_sfc", "get_sfc_json", "get_sfc_view", "list_sfcs", "list_routings", "routings_json",
+    "summary", "stats",
+    "bulk_create", "bulk_assign_routing", "bulk_transition",
+)
+
+
+class StateManager(BaseManager):
+    pass
+
+
+_shared_state = None
+_shared_feed = None
+_shared_simulation = None
+_shared_analytics = None
+_shared_history = None
+
+def _get_shared_state():
+    return _shared_state
+
+def _get_shared_feed():
+    return _shared_feed
+
+def _get_shared_simulation():
+    return _shared_simulation
+
+def _get_shared_analytics():
+    return _shared_analytics
+
+def _get_shared_history():
+    return _shared_history
+
+StateManager.register("MESState", callable=_get_shared_state, exposed=EXPOSED)
+# Feed delle modifiche (/events): vive con lo stato, i worker ne leggono le code tramite proxy
+StateManager.register("ChangeFeed", callable=_get_shared_feed, exposed=("subscribe", "unsubscribe", "poll", "stats"))
+# Simulazione: il thread che avanza gli SFC gira nel processo dello stato
+StateManager.register("Simulation", callable=_get_shared_simulation, exposed=("start", "stop", "set_speed", "status"))
+# Analytics (/analytics): listener dello stato, aggiornato nel processo dello stato
+StateManager.register("Analytics", callable=_get_shared_analytics, exposed=("overview", "routing_report"))
+# Storico delle transizioni (/history): listener dello stato come gli analytics
+StateManager.register("History", callable=_get_shared_history, exposed=("sfc_history", "events", "stats"))
+
+
+def state_address():
+    """Indirizzo del server di stato: path di un socket unix oppure host:port"""
+    address = os.environ.get("MES_STATE_ADDRESS", DEFAULT_ADDRESS)
+    if ":" in address and not address.startswith("/"):
+        host, port = address.rsplit(":", 1)
+        return host, int(port)
+    return address
+
+def state_authkey():
+    return os.environ.get("MES_STATE_AUTHKEY", "mock-mes").encode()
+
+def serve_state(state=None):
+    """Avvia il server dello stato condiviso (bloccante).
+    All'avvio ripristina lo stato da MES_DATA_DIR o genera i dati mock (vedi mes_generator).
+    """
+    global _shared_state, _shared_feed, _shared_simulation, _shared_analytics, _shared_history
+    address = state_address()
+    if isinstance(address, str) and os.path.exists(address):
+        os.unlink(address)
+    _shared_state = state or MESState()
+    _shared_feed = ChangeFeed(_shared_state)
+    _shared_simulation = Simulation(_shared_state, SimulationSettings.from_env())
+    bootstrap(_shared_state)
+    _shared_analytics = Analytics(_shared_state)
+    _shared_history = History(_shared_state)
+    if simulation_enabled():
+        _shared_simulation.start()
+    manager = StateManager(address=address, authkey=state_authkey())
+    manager.get_server().serve_forever()
+
+def connect_state(timeout=10.0, typeid="MESState"):
+    """Proxy verso lo stato condiviso (o verso feed, simulazione, analytics e storico con typeid
+    "ChangeFeed", "Simulation", "Analytics", "History");
+    riprova finché il server non è pronto
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        manager = StateManager(address=state_address(), authkey=state_authkey())
+        try:
+            manager.connect()
+            return getattr(manager, typeid)()
+        except (ConnectionError, FileNotFoundError):
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.1)
+
+def is_shared():
+    return os.environ.get("MES_STATE_BACKEND", "memory") == "shared"
+
+
+if __name__ == "__main__":
+    serve_state()
@@ -0,0 +1,189 @@
+"""Cattura del traffico HTTP verso il mock MES, per riprodurlo con bench/replay.py.
+
+Con MES_CAPTURE=<file> l'app Flask accoda ogni richiesta (tranne gli stream /events)
+al file, in record binari: header a larghezza fissa seguito da path, body della
+richiesta e ID creati dalla richiesta (SFC e routing generati dal server).
+
+    MES_CAPTURE=traffic.cap python mock-mes.py
+    python bench/replay.py traffic.cap --url http://localhost:8080 --speed 10
+
+Per confrontare le risposte senza salvarle si registra un digest (blake2b, 8 byte)
+del body JSON con i campi "time" azzerati, calcolato sui byte della risposta: il server
+li produce già in forma canonica (mes_json: chiavi ordinate, formato compatto). Il replay
+riporta gli ID a quelli registrati e rimette il body in forma canonica prima del digest.
+Con MES_CAPTURE_SAMPLE=N il digest è registrato per una risposta ogni N (default 1, tutte).
+Le risposte in streaming e non JSON non sono confrontate.
+
+I record sono accumulati in memoria e scritti con una sola write in append ogni
+CAPTURE_FLUSH_SECONDS o CAPTURE_FLUSH_BYTES: più worker gunicorn possono scrivere
+sullo stesso file (le write in O_APPEND non si mescolano). Alla chiusura del processo
+(atexit, anche con SIGTERM) il buffer viene scritto.
+"""
+import atexit
+import fcntl
+import hashlib
+import os
+import re
+import struct
+import threading
+
+import mes_json
+
+MAGIC = b"MESCAP1\n"
+METHODS = ("GET", "POST", "PUT", "DELETE", "PATCH", "HEAD", "OPTIONS")
+_METHOD_CODES = {method: code for code, method in enumerate(METHODS)}
+
+# inizio (epoch), durata (s), status, metodo, lunghezza di path, body e ID creati, digest della risposta
+RECORD = struct.Struct("<dfHBHII8s")
+NO_DIGEST = bytes(8)
+
+CAPTURE_FLUSH_SECONDS = 1.0
+CAPTURE_FLUSH_BYTES = 256 * 1024
+CAPTURE_SAMPLE = int(os.environ.get("MES_CAPTURE_SAMPLE", 1))
+
+# ID generati dal server, da riscrivere nel replay
+GENERATED_ID = re.compile(rb"SFCMOCK[0-9]+|ROUTING[0-9]+")
+_TIME = re.compile(rb'"time":[0-9.eE+-]+')
+
+# Endpoint che generano ID: path -> estrazione degli ID creati dalla risposta
+_CREATED = {
+    "/sfc": lambda body: [body["sfc_id"]],
+    "/routing": lambda body: [body["routing_id"]],
+    "/bulk/sfc": lambda body: [r["sfc_id"] for r in body["results"] if r["status"] == 200],
+}
+# Campi del body con cui il client sceglie l'ID (router degli shard): niente ID generati
+_CHOSEN = {"/sfc": "sfc_id", "/routing": "routing_id", "/bulk/sfc": "sfc_ids"}
+
+
+def created_ids(method, path, request_body, status, response_body):
+    """ID generati dal server per la richiesta (lista vuota se non ne crea)"""
+    extract = _CREATED.get(path) if method == "POST" and status == 200 else None
+    if extract is None:
+        return []
+    try:
+        request_data = mes_json.loads(request_body) if request_body else {}
+        if isinstance(request_data, dict) and _CHOSEN[path] in request_data:
+            return []
+        return [str(i) for i in extract(mes_json.loads(response_body))]
+    except (ValueError, KeyError, TypeError):
+        return []
+
+def canonical(body):
+    """Body JSON in forma canonica (chiavi ordinate, formato compatto), come lo produce mes_json"""
+    try:
+        return mes_json.dumps(mes_json.loads(body))
+    except ValueError:
+        return body
+
+def digest(body):
+    """Digest di un body JSON già in forma canonica, senza gli istanti"""
+    return hashlib.blake2b(_TIME.sub(b'"time":0', body.strip()), digest_size=8).digest()
+
+
+class CapturedRequest:
+    __slots__ = ("start", "duration", "status", "method", "target", "body", "created", "digest")
+
+    def __init__(self, start, duration, status, method, target, body, created, digest):
+        self.start = start
+        self.duration = duration
+        self.status = status
+        self.method = method
+        self.target = target            # path (quotato) e query string
+        self.body = body
+        self.created = created          # ID generati, nell'ordine della risposta
+        self.digest = digest
+
+
+class TrafficCapture:
+    """Scrittore del file di cattura, condivisibile tra thread e processi.
+    Come EventLog: i record si accumulano in un buffer che un thread scrive periodicamente.
+    """
+
+    def __init__(self, path, flush_interval=CAPTURE_FLUSH_SECONDS, sample=CAPTURE_SAMPLE):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.sample = max(1, sample)
+        self.requests = 0
+        self._fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(self._fd).st_size == 0:
+                os.write(self._fd, MAGIC)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._buffer = bytearray()
+        self._lock = threading.Lock()         # protegge il buffer
+        self._write_lock = threading.Lock()   # serializza le write e la chiusura
+        self._closed = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="mes-capture", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def record(self, method, target, body, start, seconds, status, response_body=None, json_response=False):
+        """Accoda una richiesta; response_body serve per gli ID creati e, se JSON, per il digest"""
+        path = target.split("?", 1)[0]
+        created = b""
+        response_digest = NO_DIGEST
+        if response_body is not None:
+            created = " ".join(created_ids(method, path, body, status, response_body)).encode()
+            # Contatore letto senza lock: al più qualche digest in più o in meno sul campione
+            if json_response and self.requests % self.sample == 0:
+                response_digest = digest(response_body)
+        target = target.encode()
+        data = RECORD.pack(start, seconds, status, _METHOD_CODES.get(method, 0), len(target), len(body),
+                           len(created), response_digest) + target + body + created
+        with self._lock:
+            self._buffer += data
+            self.requests += 1
+            full = len(self._buffer) >= CAPTURE_FLUSH_BYTES
+        if full:
+            self.flush()
+
+    def _run(self):
+        while not self._closed.wait(self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        """Scrive i record accumulati con una sola write (in append: atomica rispetto agli altri processi)"""
+        with self._write_lock:
+            with self._lock:
+                if not self._buffer or self._fd is None:
+                    return
+                data, self._buffer = self._buffer, bytearray()
+            os.write(self._fd, data)
+
+    def close(self):
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        self._thread.join()
+        self.flush()
+        with self._write_lock:
+            os.close(self._fd)
+            self._fd = None
+
+
+def open_capture():
+    """TrafficCapture su MES_CAPTURE, None se la cattura non è attiva"""
+    path = os.environ.get("MES_CAPTURE")
+    return TrafficCapture(path) if path else None
+
+def read_capture(path):
+    """Richieste catturate, nell'ordine del file"""
+    with open(path, "rb") as f:
+        data = f.read()
+    if not data.startswith(MAGIC):
+        raise ValueError(f"{path}: not a MES capture file")
+    pos, size = len(MAGIC), RECORD.size
+    while pos + size <= len(data):
+        start, duration, status, method, target_len, body_len, created_len, response_digest = \
+            RECORD.unpack_from(data, pos)
+        pos += size
+        target = data[pos:pos + target_len].decode()
+        pos += target_len
+        body = data[pos:pos + body_len]
+        pos += body_len
+        created = data[pos:pos + created_len].split()
+        pos += created_len
+        yield CapturedRequest(start, duration, status, METHODS[method], target, body, created,
+                              None if response_digest == NO_DIGEST else response_digest)
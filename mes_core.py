@@ -0,0 +1,634 @@
+from contextlib import contextmanager
+import heapq
+import itertools
+import os
+import re
+import sys
+import threading
+
+from mes_json import dumps
+from mes_store import SFCRecord, routing_template
+
+# Campi della rappresentazione completa degli SFC
+SFC_FIELDS = ("routing", "operations", "sfc_state")
+# Vista compatta (?view=compact): step in work (1-based, come per rollback/force_advance) e stati in run-length
+COMPACT_FIELDS = ("routing", "sfc_state", "step", "ops")
+# Campi selezionabili con ?fields= su /sfcs
+VIEW_FIELDS = SFC_FIELDS + ("step", "ops")
+SFC_STATES = ("New", "In Work", "Done")
+
+MAX_BULK_ITEMS = 10000
+
+# ID assegnati dall'esterno (router degli shard, vedi mes_shard): stesso formato di quelli generati
+SFC_ID = re.compile(r"SFCMOCK[1-9][0-9]*")
+ROUTING_ID = re.compile(r"ROUTING[1-9][0-9]*")
+
+# Numero di lock in cui sono ripartiti gli SFC: operazioni su SFC diversi procedono in parallelo
+LOCK_STRIPES = 256
+
+# Risposte GET /sfc/<id> serializzate tenute in cache (ripartite tra i lock)
+RESPONSE_CACHE_SIZE = 50000
+
+
+class PageError(ValueError):
+    pass
+
+
+class Event:
+    """Mutazione avvenuta sullo stato, notificata ai listener di MESState.
+
+    kind: create_sfc, create_routing, assign, advance, rollback, rollback_single, force_advance
+    arg: step per rollback/force_advance, numero di operazioni per create_routing
+    prev_state: stato SFC prima della mutazione
+    prev_routing, prev_ops: routing e byte di stato delle operazioni prima della mutazione (transizioni)
+    """
+    __slots__ = ("kind", "sfc_id", "routing", "arg", "sfc", "prev_state", "prev_routing", "prev_ops")
+
+    def __init__(self, kind, sfc_id=None, routing=None, arg=None, sfc=None, prev_state=None,
+                 prev_routing=None, prev_ops=None):
+        self.kind = kind
+        self.sfc_id = sfc_id
+        self.routing = routing
+        self.arg = arg
+        self.sfc = sfc
+        self.prev_state = prev_state
+        self.prev_routing = prev_routing
+        self.prev_ops = prev_ops
+
+
+# ---------------------------
+# Helper Functions
+# ---------------------------
+def sfc_response(sfc_id, sfc):
+    return {"sfc_id": sfc_id, "operations": sfc.operations(), "sfc_state": sfc.sfc_state()}
+
+def sfc_view(sfc, fields=SFC_FIELDS):
+    """Rappresentazione JSON di uno SFC limitata ai campi richiesti"""
+    view = {}
+    if "routing" in fields:
+        view["routing"] = sfc.routing
+    if "operations" in fields:
+        view["operations"] = sfc.operations()
+    if "sfc_state" in fields:
+        view["sfc_state"] = sfc.sfc_state()
+    if "step" in fields:
+        view["step"] = sfc.current + 1 if sfc.current >= 0 else None
+    if "ops" in fields:
+        view["ops"] = sfc.runs()
+    return view
+
+def paginate(items, limit, positions=False):
+    """Una pagina da un iteratore di (posizione, elemento).
+    Restituisce (elementi selezionati, cursore della pagina successiva o None);
+    con positions=True gli elementi restano coppie (posizione, elemento).
+    """
+    page = []
+    for pos, item in items:
+        if limit is not None and len(page) == limit:
+            return page, str(pos)
+        page.append((pos, item) if positions else item)
+    return page, None
+
+
+# ---------------------------
+# Stato del MES
+# ---------------------------
+class MESState:
+    """Stato completo del mock MES (SFC, routing, indici) e logica delle transizioni.
+
+    Non dipende da Flask: gli endpoint traducono richieste e risposte HTTP,
+    le transizioni restituiscono (body, status). Può vivere nel processo del
+    server oppure essere condiviso tra più worker tramite mes_backend.
+
+    Concorrenza: ogni SFC è protetto da uno di LOCK_STRIPES lock (scelto per hash
+    dell'ID), gli ID sono allocati da contatori atomici e la sola registrazione
+    di nuovi SFC/routing passa da un lock dedicato.
+    """
+
+    def __init__(self):
+        # next() su itertools.count è atomico: niente ID duplicati sotto server multi-thread
+        self._sfc_numbers = itertools.count(1)
+        self._routing_numbers = itertools.count(1)
+        self.sfcs = {}          # SFC ID -> SFCRecord (routing + un byte di stato per operazione)
+        self.routings = {}      # Routing ID -> RoutingTemplate (definizione immutabile e condivisa)
+        self.sfc_ids = []       # SFC ID in ordine di creazione (posizioni usate come cursore di paginazione)
+        self.routing_ids = []   # Routing ID in ordine di creazione
+        # Indici secondari, aggiornati a ogni mutazione
+        self.sfcs_by_state = {state: set() for state in SFC_STATES}   # stato SFC -> SFC ID
+        self.sfcs_by_routing = {}                                      # Routing ID -> SFC ID
+        self._locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+        # Serializza solo l'aggiunta a sfc_ids/routing_ids (posizione = indice nella lista)
+        self._register_lock = threading.Lock()
+        # Callback chiamate con un Event dopo ogni mutazione, sotto il lock dello SFC
+        self.listeners = []
+        # Cache delle risposte GET /sfc/<id>: per ogni lock, SFC ID -> (versione, JSON).
+        # È protetta dallo stesso lock dello SFC, quindi non aggiunge contesa
+        self._json_cache = [{} for _ in range(LOCK_STRIPES)]
+        self._json_cache_limit = max(1, RESPONSE_CACHE_SIZE // LOCK_STRIPES)
+        # Prefisso degli ETag: cambia a ogni avvio, perché le versioni ripartono da 0
+        self.epoch = os.urandom(4).hex()
+
+    def lock_for(self, sfc_id):
+        """Lock che protegge lo SFC"""
+        return self._locks[hash(sfc_id) % LOCK_STRIPES]
+
+    def stripe(self, sfc_id):
+        """Indice del lock che protegge lo SFC (da 0 a LOCK_STRIPES - 1)"""
+        return hash(sfc_id) % LOCK_STRIPES
+
+    def stripe_lock(self, stripe):
+        return self._locks[stripe]
+
+    @contextmanager
+    def freeze(self):
+        """Blocca tutte le mutazioni (per uno snapshot consistente).
+        Ordine dei lock come in create_sfc: prima quelli degli SFC, poi quello di registrazione.
+        """
+        for lock in self._locks:
+            lock.acquire()
+        try:
+            with self._register_lock:
+                yield
+        finally:
+            for lock in self._locks:
+                lock.release()
+
+    # ---------------------------
+    # Listener
+    # ---------------------------
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def _emit(self, kind, sfc_id=None, routing=None, arg=None, sfc=None, prev_state=None,
+              prev_routing=None, prev_ops=None):
+        event = Event(kind, sfc_id, routing, arg, sfc, prev_state, prev_routing, prev_ops)
+        for listener in self.listeners:
+            listener(event)
+
+    # ---------------------------
+    # Indici
+    # ---------------------------
+    def _register_sfc(self, sfc_id):
+        """Crea e indicizza un nuovo SFC senza routing"""
+        with self._register_lock:
+            sfc = SFCRecord(len(self.sfc_ids))
+            self.sfcs[sfc_id] = sfc
+            self.sfc_ids.append(sfc_id)
+            self.sfcs_by_state[sfc.sfc_state()].add(sfc_id)
+            # Sotto il lock di registrazione (come create_routing): i listener vedono le
+            # creazioni nell'ordine di sfc_ids, che il log deve riprodurre
+            if self.listeners:
+                self._emit("create_sfc", sfc_id, sfc=sfc)
+        return sfc
+
+    def _reindex(self, sfc_id, prev_state, prev_routing=None):
+        """Aggiorna gli indici e la versione dopo una mutazione dello SFC.
+        Va chiamato con il lock dello SFC: add/discard sui set sono atomici,
+        quindi gli indici non richiedono un lock globale.
+        """
+        sfc = self.sfcs[sfc_id]
+        sfc.version += 1
+        state = sfc.sfc_state()
+        if state != prev_state:
+            self.sfcs_by_state[prev_state].discard(sfc_id)
+            self.sfcs_by_state[state].add(sfc_id)
+        if sfc.routing != prev_routing:
+            if prev_routing is not None:
+                self.sfcs_by_routing[prev_routing].discard(sfc_id)
+            self.sfcs_by_routing.setdefault(sfc.routing, set()).add(sfc_id)
+
+    # ---------------------------
+    # Creazione
+    # ---------------------------
+    def create_sfc(self, sfc_id=None):
+        """Crea uno SFC con il prossimo ID libero (o con l'ID indicato, ad es. nel replay del log)"""
+        if sfc_id is None:
+            sfc_id = f"SFCMOCK{next(self._sfc_numbers)}"
+            while sfc_id in self.sfcs:          # già preso con claim_sfc
+                sfc_id = f"SFCMOCK{next(self._sfc_numbers)}"
+        # Lo SFC è visibile appena registrato: il lock evita che una transizione concorrente
+        # lo reindicizzi prima che sia inserito negli indici
+        with self.lock_for(sfc_id):
+            self._register_sfc(sfc_id)
+        return sfc_id
+
+    def claim_sfc(self, sfc_id):
+        """Crea lo SFC con un ID scelto dal chiamante (il router degli shard): (body, status)"""
+        if not isinstance(sfc_id, str) or not SFC_ID.fullmatch(sfc_id):
+            return {"error": "Invalid sfc_id"}, 400
+        with self.lock_for(sfc_id):
+            if sfc_id in self.sfcs:
+                return {"error": "SFC already exists"}, 409
+            self._register_sfc(sfc_id)
+        return {"sfc_id": sfc_id}, 200
+
+    def _register_routing(self, n, routing_id=None):
+        if routing_id is None:
+            routing_id = f"ROUTING{next(self._routing_numbers)}"
+            while routing_id in self.routings:  # già preso con claim_routing
+                routing_id = f"ROUTING{next(self._routing_numbers)}"
+        template = routing_template(n)
+        with self._register_lock:
+            # Emesso prima che il routing sia visibile: nessuna assign concorrente può
+            # finire nel log prima della creazione del routing che usa
+            if self.listeners:
+                self._emit("create_routing", routing=routing_id, arg=n)
+            self.routings[routing_id] = template
+            self.routing_ids.append(routing_id)
+        return routing_id
+
+    def create_routing(self, n, routing_id=None):
+        routing_id = self._register_routing(n, routing_id)
+        return {"routing_id": routing_id, "operations": self.routings[routing_id].operations()}
+
+    def claim_routing(self, n, routing_id):
+        """Crea il routing con un ID scelto dal chiamante (replicato su tutti gli shard): (body, status)"""
+        if not isinstance(routing_id, str) or not ROUTING_ID.fullmatch(routing_id):
+            return {"error": "Invalid routing_id"}, 400
+        if routing_id in self.routings:
+            return {"error": "Routing already exists"}, 409
+        return self.create_routing(n, routing_id), 200
+
+    def sync_counters(self):
+        """Riallinea i contatori degli ID dopo un ripristino (prossimo ID = massimo esistente + 1)"""
+        def next_number(ids, prefix):
+            return max((int(i[len(prefix):]) for i in ids if i[len(prefix):].isdigit()), default=0) + 1
+        self._sfc_numbers = itertools.count(next_number(self.sfc_ids, "SFCMOCK"))
+        self._routing_numbers = itertools.count(next_number(self.routing_ids, "ROUTING"))
+
+    def load_sfcs(self, items):
+        """Inserisce in blocco SFC già costruiti (snapshot, dati generati) senza notificare i listener.
+        items: iterabile di (SFC ID, SFCRecord). Da usare prima di servire richieste.
+        """
+        sfcs, sfc_ids = self.sfcs, self.sfc_ids
+        by_state, by_routing = self.sfcs_by_state, self.sfcs_by_routing
+        with self._register_lock:
+            for sfc_id, sfc in items:
+                sfc.pos = len(sfc_ids)
+                sfcs[sfc_id] = sfc
+                sfc_ids.append(sfc_id)
+                by_state[sfc.sfc_state()].add(sfc_id)
+                if sfc.routing is not None:
+                    routing_sfcs = by_routing.get(sfc.routing)
+                    if routing_sfcs is None:
+                        routing_sfcs = by_routing[sfc.routing] = set()
+                    routing_sfcs.add(sfc_id)
+
+    def routing_exists(self, routing_id):
+        return routing_id in self.routings
+
+    # ---------------------------
+    # Transizioni: restituiscono (body, status)
+    # ---------------------------
+    def assign_routing(self, sfc_id, routing_id):
+        if sfc_id not in self.sfcs:
+            return {"error": "SFC not found"}, 404
+        if routing_id not in self.routings:
+            return {"error": "Routing not found"}, 404
+        with self.lock_for(sfc_id):
+            sfc = self.sfcs[sfc_id]
+            prev_state, prev_routing = sfc.sfc_state(), sfc.routing
+            prev_ops = bytes(sfc.states) if self.listeners else None
+            sfc.assign(routing_id, self.routings[routing_id])
+            self._reindex(sfc_id, prev_state, prev_routing)
+            if self.listeners:
+                self._emit("assign", sfc_id, routing_id, sfc=sfc, prev_state=prev_state,
+                           prev_routing=prev_routing, prev_ops=prev_ops)
+            return {"sfc_id": sfc_id, "routing": routing_id, "operations": sfc.operations()}, 200
+
+    def advance(self, sfc_id, version=None):
+        """version: se indicata, la transizione avviene solo se lo SFC è ancora a quella versione (altrimenti 409)"""
+        if sfc_id not in self.sfcs:
+            return {"error": "SFC not found"}, 404
+        with self.lock_for(sfc_id):
+            sfc = self.sfcs[sfc_id]
+            if version is not None and sfc.version != version:
+                return {"error": "SFC version changed"}, 409
+            prev_state = sfc.sfc_state()
+            prev_ops = bytes(sfc.states) if self.listeners else None
+            sfc.advance()
+            self._reindex(sfc_id, prev_state, sfc.routing)
+            if self.listeners:
+                self._emit("advance", sfc_id, sfc.routing, sfc=sfc, prev_state=prev_state, prev_ops=prev_ops)
+            return sfc_response(sfc_id, sfc), 200
+
+    def rollback(self, sfc_id, target_step, version=None):
+        if sfc_id not in self.sfcs:
+            return {"error": "SFC not found"}, 404
+        if target_step is None:
+            return {"error": "Step not provided"}, 400
+        with self.lock_for(sfc_id):
+            sfc = self.sfcs[sfc_id]
+            if version is not None and sfc.version != version:
+                return {"error": "SFC version changed"}, 409
+            # Controllo validità step
+            if not isinstance(target_step, int) or target_step < 1 or target_step > len(sfc):
+                return {"error": "Invalid step"}, 400
+            # Aggiorna stati delle operazioni
+            prev_state = sfc.sfc_state()
+            prev_ops = bytes(sfc.states) if self.listeners else None
+            sfc.rollback(target_step)
+            self._reindex(sfc_id, prev_state, sfc.routing)
+            if self.listeners:
+                self._emit("rollback", sfc_id, sfc.routing, target_step, sfc, prev_state, prev_ops=prev_ops)
+            return sfc_response(sfc_id, sfc), 200
+
+    def force_advance(self, sfc_id, target_step, version=None):
+        if sfc_id not in self.sfcs:
+            return {"error": "SFC not found"}, 404
+        with self.lock_for(sfc_id):
+            sfc = self.sfcs[sfc_id]
+            if version is not None and sfc.version != version:
+                return {"error": "SFC version changed"}, 409
+            if not isinstance(target_step, int) or target_step < 1 or target_step > len(sfc):
+                return {"error": "Invalid step"}, 400
+            prev_state = sfc.sfc_state()
+            prev_ops = bytes(sfc.states) if self.listeners else None
+            sfc.force_advance(target_step)
+            self._reindex(sfc_id, prev_state, sfc.routing)
+            if self.listeners:
+                self._emit("force_advance", sfc_id, sfc.routing, target_step, sfc, prev_state, prev_ops=prev_ops)
+            return sfc_response(sfc_id, sfc), 200
+
+    def rollback_single(self, sfc_id):
+        if sfc_id not in self.sfcs:
+            return {"error": "SFC not found"}, 404
+        with self.lock_for(sfc_id):
+            sfc = self.sfcs[sfc_id]
+            # La corrente torna blank, la precedente (che era done) torna in work
+            prev_state = sfc.sfc_state()
+            prev_ops = bytes(sfc.states) if self.listeners else None
+            error = sfc.rollback_single()
+            if error:
+                return {"error": error}, 400
+            self._reindex(sfc_id, prev_state, sfc.routing)
+            if self.listeners:
+                self._emit("rollback_single", sfc_id, sfc.routing, sfc=sfc, prev_state=prev_state, prev_ops=prev_ops)
+            return sfc_response(sfc_id, sfc), 200
+
+    # ---------------------------
+    # Letture
+    # ---------------------------
+    def get_sfc(self, sfc_id):
+        if sfc_id not in self.sfcs:
+            return {"error": "SFC not found"}, 404
+        with self.lock_for(sfc_id):
+            return self._sfc_body(sfc_id, self.sfcs[sfc_id]), 200
+
+    def _sfc_body(self, sfc_id, sfc):
+        return {
+            "sfc_id": sfc_id,
+            "routing": sfc.routing,
+            "operations": sfc.operations(),
+            "sfc_state": sfc.sfc_state()
+        }
+
+    def get_sfc_view(self, sfc_id, fields=COMPACT_FIELDS, if_none_match=()):
+        """Uno SFC limitato ai campi richiesti (es. la vista compatta): (body o None, ETag, status).
+        L'ETag segue la versione come in get_sfc_json, con un suffisso che distingue la vista.
+        """
+        sfc = self.sfcs.get(sfc_id)
+        if sfc is None:
+            return {"error": "SFC not found"}, None, 404
+        with self.lock_for(sfc_id):
+            etag = f"{self.epoch}-{sfc.version}-" + ".".join(fields)
+            if etag in if_none_match:
+                return None, etag, 304
+            return {"sfc_id": sfc_id, **sfc_view(sfc, fields)}, etag, 200
+
+    def get_sfc_json(self, sfc_id, if_none_match=()):
+        """Come get_sfc, ma già serializzato: (JSON in bytes o None, ETag, status).
+        Il JSON resta in cache finché la versione dello SFC non cambia. Se l'ETag corrente
+        è tra quelli di if_none_match il body è None e lo status 304.
+        """
+        sfc = self.sfcs.get(sfc_id)
+        if sfc is None:
+            return dumps({"error": "SFC not found"}) + b"\n", None, 404
+        stripe = self.stripe(sfc_id)
+        with self._locks[stripe]:
+            version = sfc.version
+            etag = f"{self.epoch}-{version}"
+            if etag in if_none_match:
+                return None, etag, 304
+            cache = self._json_cache[stripe]
+            entry = cache.get(sfc_id)
+            if entry is not None and entry[0] == version:
+                return entry[1], etag, 200
+            body = dumps(self._sfc_body(sfc_id, sfc)) + b"\n"
+            if entry is None and len(cache) >= self._json_cache_limit:
+                # Politica FIFO: esce la risposta inserita per prima in questo stripe
+                del cache[next(iter(cache))]
+            cache[sfc_id] = (version, body)
+            return body, etag, 200
+
+    def _scan(self, ids, cursor):
+        for pos in range(cursor, len(ids)):
+            yield pos, ids[pos]
+
+    def _scan_index(self, candidates, cursor, limit=None):
+        """Scorre in ordine di creazione gli SFC di un insieme dell'indice, a partire dal cursore.
+        Il costo è proporzionale alla dimensione dell'insieme, non al numero totale di SFC.
+        """
+        sfcs = self.sfcs
+        positions = [pos for pos in (sfcs[sfc_id].pos for sfc_id in candidates) if pos >= cursor]
+        if limit is None:
+            positions.sort()
+        else:
+            # Basta la pagina più il primo elemento della successiva (per il cursore)
+            positions = heapq.nsmallest(limit + 1, positions)
+        for pos in positions:
+            yield pos, self.sfc_ids[pos]
+
+    def iter_sfcs(self, routing=None, state=None, cursor=0, fields=SFC_FIELDS, limit=None):
+        """Iteratore di (posizione, (sfc_id, vista)) degli SFC che soddisfano i filtri.
+        I filtri sono risolti sugli indici: si scorre l'insieme più piccolo e si verifica
+        l'appartenenza all'altro. Il cursore è validato subito, prima di iniziare lo streaming.
+        """
+        if cursor < 0 or cursor > len(self.sfc_ids):
+            raise PageError("Invalid cursor")
+        return self._iter_sfcs(routing, state, cursor, fields, limit)
+
+    def _iter_sfcs(self, routing, state, cursor, fields, limit):
+        if state is None and routing is None:
+            items = self._scan(self.sfc_ids, cursor)
+        else:
+            # list() su un set è atomico: istantanea dell'indice senza bloccare le transizioni
+            candidates = []
+            if state is not None:
+                candidates.append(self.sfcs_by_state.get(state, set()))
+            if routing is not None:
+                candidates.append(self.sfcs_by_routing.get(routing, set()))
+            candidates.sort(key=len)
+            smallest, others = candidates[0], candidates[1:]
+            matching = [sfc_id for sfc_id in list(smallest) if all(sfc_id in other for other in others)]
+            items = self._scan_index(matching, cursor, limit)
+        for pos, sfc_id in items:
+            with self.lock_for(sfc_id):
+                view = sfc_view(self.sfcs[sfc_id], fields)
+            yield pos, (sfc_id, view)
+
+    def list_sfcs(self, routing=None, state=None, cursor=0, limit=None, fields=SFC_FIELDS, positions=False):
+        """Una pagina di SFC: ([(sfc_id, vista)], cursore successivo o None)"""
+        return paginate(self.iter_sfcs(routing, state, cursor, fields, limit), limit, positions)
+
+    def iter_routings(self, cursor=0):
+        """Iteratore di (posizione, (routing_id, operazioni))"""
+        if cursor < 0 or cursor > len(self.routing_ids):
+            raise PageError("Invalid cursor")
+        return (
+            (pos, (routing_id, self.routings[routing_id].operations()))
+            for pos, routing_id in self._scan(self.routing_ids, cursor)
+        )
+
+    def list_routings(self, cursor=0, limit=None, positions=False):
+        """Una pagina di routing: ([(routing_id, operazioni)], cursore successivo o None)"""
+        return paginate(self.iter_routings(cursor), limit, positions)
+
+    def routings_json(self, cursor=0, limit=None):
+        """Una pagina di routing già serializzata come oggetto {routing_id: operazioni}
+        (chiavi ordinate come jsonify): (JSON in bytes, cursore successivo o None).
+        Le operazioni di ogni template sono serializzate una volta sola.
+        """
+        if cursor < 0 or cursor > len(self.routing_ids):
+            raise PageError("Invalid cursor")
+        page, next_cursor = paginate(self._scan(self.routing_ids, cursor), limit)
+        routings = self.routings
+        body = b",".join(
+            dumps(routing_id) + b":" + routings[routing_id].operations_json() for routing_id in sorted(page)
+        )
+        return b"{" + body + b"}", next_cursor
+
+    def summary(self, routing=None):
+        """Numero di SFC per stato, di tutto il sistema o di un routing, letto dagli indici:
+        non serializza gli SFC. Senza routing riporta anche gli SFC per routing.
+        """
+        by_state = self.sfcs_by_state
+        if routing is None:
+            counts = {state: len(ids) for state, ids in by_state.items()}
+            by_routing = {r: len(ids) for r, ids in list(self.sfcs_by_routing.items())}
+            return {"total": len(self.sfc_ids), "by_state": counts, "by_routing": by_routing}
+        # list() su un set è atomico: istantanea dell'indice senza bloccare le transizioni
+        ids = list(self.sfcs_by_routing.get(routing, ()))
+        counts = {state: sum(1 for sfc_id in ids if sfc_id in members) for state, members in by_state.items()}
+        return {"total": len(ids), "by_state": counts, "routing": routing}
+
+    def stats(self, sample_size=1000):
+        """Conteggi e stima della memoria occupata dallo store (per /metrics).
+        La memoria dei record SFC è stimata su un campione: costo costante anche con milioni di SFC.
+        """
+        sfc_ids = self.sfc_ids
+        n = len(sfc_ids)
+        containers = [self.sfcs, sfc_ids, self.routings, self.routing_ids]
+        containers += self.sfcs_by_state.values()
+        containers += list(self.sfcs_by_routing.values())
+        memory = sum(sys.getsizeof(c) for c in containers)
+        if n:
+            sample = sfc_ids[::max(1, n // sample_size)]
+            sampled = 0
+            for sfc_id in sample:
+                sfc = self.sfcs[sfc_id]
+                sampled += (sys.getsizeof(sfc_id) + sys.getsizeof(sfc)
+                            + sys.getsizeof(sfc.states) + sys.getsizeof(sfc.counts))
+            memory += sampled * n // len(sample)
+        return {
+            "sfcs": n,
+            "sfcs_by_state": {state: len(ids) for state, ids in self.sfcs_by_state.items()},
+            "routings": len(self.routing_ids),
+            "memory_bytes": memory,
+        }
+
+    # ---------------------------
+    # Bulk
+    # ---------------------------
+    # Transizioni applicabili a una lista di SFC: azione -> (metodo, richiede step)
+    BULK_TRANSITIONS = {
+        "advance": ("advance", False),
+        "complete": ("advance", False),
+        "force_advance": ("force_advance", True),
+        "rollback": ("rollback", True),
+        "rollback_single": ("rollback_single", False),
+    }
+
+    @staticmethod
+    def _bulk_body(results):
+        """Risultati per elemento: ognuno riporta il proprio status HTTP"""
+        ok = sum(1 for r in results if r["status"] == 200)
+        return {"results": results, "ok": ok, "failed": len(results) - ok}
+
+    def bulk_create(self, count, routing_id=None, sfc_ids=None):
+        """count SFC con nuovi ID, oppure quelli di sfc_ids (ID scelti dal router degli shard)"""
+        if sfc_ids is not None:
+            if not isinstance(sfc_ids, list) or not sfc_ids or len(sfc_ids) > MAX_BULK_ITEMS:
+                return {"error": "Invalid sfc_ids"}, 400
+        elif not isinstance(count, int) or count < 1 or count > MAX_BULK_ITEMS:
+            return {"error": "Invalid count"}, 400
+        if routing_id is not None and not isinstance(routing_id, str):
+            return {"error": "Invalid routing_id"}, 400
+        if routing_id is not None and routing_id not in self.routings:
+            return {"error": "Routing not found"}, 404
+        results = []
+        for sfc_id in sfc_ids if sfc_ids is not None else itertools.repeat(None, count):
+            if sfc_id is None:
+                sfc_id = self.create_sfc()
+            else:
+                body, status = self.claim_sfc(sfc_id)
+                if status != 200:
+                    results.append({"sfc_id": sfc_id, "status": status, **body})
+                    continue
+            if routing_id is None:
+                results.append({"sfc_id": sfc_id, "status": 200})
+            else:
+                body, status = self.assign_routing(sfc_id, routing_id)
+                results.append({"sfc_id": sfc_id, "status": status, **body})
+        return self._bulk_body(results), 200
+
+    def bulk_assign_routing(self, routing_id, sfc_list):
+        if not isinstance(sfc_list, list) or len(sfc_list) > MAX_BULK_ITEMS:
+            return {"error": "Invalid sfc_ids"}, 400
+        if not isinstance(routing_id, str):
+            return {"error": "Invalid routing_id"}, 400
+        results = []
+        for sfc_id in sfc_list:
+            if not isinstance(sfc_id, str):
+                results.append(self._invalid_item(sfc_id))
+                continue
+            body, status = self.assign_routing(sfc_id, routing_id)
+            results.append({"sfc_id": sfc_id, "status": status, **body})
+        return self._bulk_body(results), 200
+
+    @staticmethod
+    def _invalid_item(sfc_id):
+        """Risultato di un elemento con un ID che non è una stringa (gli altri elementi proseguono)"""
+        return {"sfc_id": sfc_id, "status": 400, "error": "Invalid sfc_id"}
+
+    @staticmethod
+    def _compact_result(sfc_id, status, body):
+        """Risultato senza la lista delle operazioni: sfc_state e step in work (da 1), oppure l'errore"""
+        if status != 200:
+            return {"sfc_id": sfc_id, "status": status, **body}
+        step = next((i for i, op in enumerate(body["operations"], 1) if op["state"] == "in work"), None)
+        return {"sfc_id": sfc_id, "status": status, "sfc_state": body["sfc_state"], "step": step}
+
+    def bulk_transition(self, action, items, compact=False):
+        """items: lista di {"sfc_id": ..., "step": ...}; compact: risultati senza le operazioni"""
+        if action not in self.BULK_TRANSITIONS:
+            return {"error": "Unknown action"}, 404
+        if len(items) > MAX_BULK_ITEMS:
+            return {"error": "Too many items"}, 400
+        method, needs_step = self.BULK_TRANSITIONS[action]
+        transition = getattr(self, method)
+        results = []
+        for item in items:
+            sfc_id = item.get("sfc_id")
+            if not isinstance(sfc_id, str):
+                results.append(self._invalid_item(sfc_id))
+                continue
+            if needs_step:
+                body, status = transition(sfc_id, item.get("step"))
+            else:
+                body, status = transition(sfc_id)
+            if compact:
+                results.append(self._compact_result(sfc_id, status, body))
+            else:
+                results.append({"sfc_id": sfc_id, "status": status, **body})
+        return self._bulk_body(results), 200
@@ -0,0 +1,189 @@
+"""Latenze, errori e banda limitata simulati per endpoint (/admin/faults).
+
+Il mock risponde in pochi µs: con un profilo di fault client e agenti vedono i ritardi
+e gli errori di un MES reale. Il profilo è un JSON, all'avvio da MES_FAULTS (JSON o
+path di un file JSON) oppure a runtime con POST /admin/faults:
+
+    {"seed": 42, "rules": [
+        {"endpoint": "POST /sfc/<sfc_id>/*", "latency": "lognormal:40,0.5", "error_rate": 0.02},
+        {"endpoint": "GET /sfcs", "latency": "uniform:50-200", "bandwidth": 65536,
+         "timeout_rate": 0.01, "timeout": 30}
+    ]}
+
+- endpoint: pattern (fnmatch) su "<METODO> <route>", con la route nella sintassi di Flask
+  ("GET /sfc/<sfc_id>"); vale la prima regola che corrisponde, default "*"
+- latency: distribuzione del ritardo in millisecondi, con la sintassi dei tempi ciclo
+  della simulazione (const:50, uniform:10-50, exp:30, normal:50,10, lognormal:40,0.5,
+  triangular:10,20,80)
+- error_rate: probabilità di rispondere con uno degli status di error_status (default [500, 503])
+- timeout_rate: probabilità di tenere la richiesta per timeout secondi (default 30) e
+  rispondere 504, oltre il timeout dei client
+- bandwidth: byte al secondo con cui viene inviato il body della risposta
+
+Ogni regola ha il proprio generatore, inizializzato da seed e posizione della regola:
+a parità di profilo e di sequenza di richieste per endpoint le estrazioni sono identiche.
+Il profilo è del processo: con più worker gunicorn POST /admin/faults configura solo
+il worker che risponde (MES_FAULTS vale per tutti). Le attese le esegue il server:
+timer del loop in mes_async.py, time.sleep nell'app Flask, che con il worker gevent di
+gunicorn cede il controllo agli altri greenlet invece di occupare un thread. Il profilo
+decide da solo gli status: il server non aggiunge 503 quando le richieste ritardate sono molte.
+"""
+from fnmatch import fnmatchcase
+import json
+import os
+import random
+import threading
+
+from mes_simulation import CycleTime, is_number
+
+DEFAULT_ERROR_STATUS = (500, 503)
+DEFAULT_TIMEOUT = 30.0
+TIMEOUT_STATUS = 504
+# Le route di amministrazione non subiscono fault: il profilo resta sempre modificabile
+ADMIN_PREFIX = "/admin/"
+
+
+class Fault:
+    """Esito delle estrazioni per una richiesta: attesa (s), status d'errore, banda (byte/s)"""
+    __slots__ = ("delay", "status", "bandwidth")
+
+    def __init__(self, delay=0.0, status=None, bandwidth=None):
+        self.delay = delay
+        self.status = status
+        self.bandwidth = bandwidth
+
+    @property
+    def message(self):
+        return "Injected timeout" if self.status == TIMEOUT_STATUS else "Injected fault"
+
+
+class FaultRule:
+    FIELDS = ("endpoint", "latency", "error_rate", "error_status", "timeout_rate", "timeout", "bandwidth")
+
+    def __init__(self, endpoint="*", latency=None, error_rate=0.0, error_status=DEFAULT_ERROR_STATUS,
+                 timeout_rate=0.0, timeout=DEFAULT_TIMEOUT, bandwidth=None):
+        if not isinstance(endpoint, str) or not endpoint:
+            raise ValueError("Invalid endpoint")
+        self.endpoint = endpoint
+        self.latency = latency
+        self._latency = None
+        if latency is not None:
+            try:
+                if not isinstance(latency, str):
+                    raise ValueError
+                self._latency = CycleTime(latency)
+            except ValueError:
+                raise ValueError(f"Invalid latency: {latency!r}")
+        for name, rate in (("error rate", error_rate), ("timeout rate", timeout_rate)):
+            if not is_number(rate) or not 0 <= rate <= 1:
+                raise ValueError(f"Invalid {name}")
+        if error_rate + timeout_rate > 1:
+            raise ValueError("Error rate + timeout rate must not exceed 1")
+        self.error_rate = error_rate
+        self.timeout_rate = timeout_rate
+        if not isinstance(error_status, (list, tuple)) or not error_status or \
+                not all(isinstance(s, int) and 400 <= s <= 599 for s in error_status):
+            raise ValueError("Invalid error status")
+        self.error_status = list(error_status)
+        if not is_number(timeout) or timeout < 0:
+            raise ValueError("Invalid timeout")
+        self.timeout = timeout
+        if bandwidth is not None and (not is_number(bandwidth) or bandwidth <= 0):
+            raise ValueError("Invalid bandwidth")
+        self.bandwidth = bandwidth
+        self.rng = random.Random()
+        self.counters = {"requests": 0, "delayed_seconds": 0.0, "errors": 0, "timeouts": 0}
+
+    @classmethod
+    def from_dict(cls, data):
+        if not isinstance(data, dict):
+            raise ValueError("Invalid rule")
+        unknown = set(data) - set(cls.FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown rule fields: {', '.join(sorted(unknown))}")
+        return cls(**data)
+
+    def draw(self):
+        """Fault per la prossima richiesta (chiamato sotto il lock dell'injector)"""
+        rng, counters = self.rng, self.counters
+        delay = self._latency.sample(rng) / 1000 if self._latency is not None else 0.0
+        status = None
+        if self.error_rate or self.timeout_rate:
+            r = rng.random()
+            if r < self.timeout_rate:
+                delay += self.timeout
+                status = TIMEOUT_STATUS
+                counters["timeouts"] += 1
+            elif r < self.timeout_rate + self.error_rate:
+                status = rng.choice(self.error_status)
+                counters["errors"] += 1
+        counters["requests"] += 1
+        counters["delayed_seconds"] += delay
+        return Fault(delay, status, self.bandwidth)
+
+    def as_dict(self):
+        rule = {name: getattr(self, name) for name in self.FIELDS}
+        counters = dict(self.counters, delayed_seconds=round(self.counters["delayed_seconds"], 3))
+        return dict(rule, counters=counters)
+
+
+class FaultInjector:
+    """Profilo di fault del processo; plan() è chiamato dal server per ogni richiesta"""
+
+    def __init__(self, profile=None):
+        self._lock = threading.Lock()
+        self.seed = None
+        self.rules = []
+        self._matches = {}               # "METODO route" -> regola (o None), per non ripetere fnmatch
+        if profile is not None:
+            body, status = self.configure(profile)
+            if status != 200:
+                raise ValueError(body["error"])
+
+    @classmethod
+    def from_env(cls, environ=os.environ):
+        spec = environ.get("MES_FAULTS", "").strip()
+        if not spec:
+            return cls()
+        if not spec.startswith("{"):
+            with open(spec) as f:
+                spec = f.read()
+        return cls(json.loads(spec))
+
+    def configure(self, profile):
+        """Sostituisce il profilo (dict dal body JSON; {} o {"rules": []} disattiva); (body, status)"""
+        try:
+            if not isinstance(profile, dict) or set(profile) - {"seed", "rules"}:
+                raise ValueError("Invalid fault profile: expected {\"seed\": ..., \"rules\": [...]}")
+            seed = profile.get("seed")
+            if seed is not None and (not isinstance(seed, int) or isinstance(seed, bool)):
+                raise ValueError("Invalid seed")
+            rules = profile.get("rules", [])
+            if not isinstance(rules, list):
+                raise ValueError("Invalid rules")
+            rules = [FaultRule.from_dict(rule) for rule in rules]
+        except (TypeError, ValueError) as e:
+            return {"error": str(e)}, 400
+        for i, rule in enumerate(rules):
+            rule.rng = random.Random(f"{seed}:{i}") if seed is not None else random.Random()
+        with self._lock:
+            self.seed, self.rules, self._matches = seed, rules, {}
+            return self._status(), 200
+
+    def plan(self, method, route):
+        """Fault per una richiesta sulla route (nella sintassi di Flask), None se nessuna regola vale"""
+        if not self.rules or route.startswith(ADMIN_PREFIX):
+            return None
+        with self._lock:
+            key = f"{method} {route}"
+            rule = self._matches.get(key, False)
+            if rule is False:
+                rule = self._matches[key] = next((r for r in self.rules if fnmatchcase(key, r.endpoint)), None)
+            return rule.draw() if rule is not None else None
+
+    def status(self):
+        with self._lock:
+            return self._status(), 200
+
+    def _status(self):
+        return {"seed": self.seed, "rules": [rule.as_dict() for rule in self.rules]}
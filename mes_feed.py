@@ -0,0 +1,276 @@
+"""Feed delle modifiche: le mutazioni di MESState inviate in push ai sottoscrittori (SSE su /events).
+
+Il feed è un listener di MESState, quindi riceve gli eventi dagli stessi punti di
+mutazione degli endpoint. Ogni sottoscrittore ha filtri (SFC, routing, stato,
+tipi di evento) e una coda limitata con una politica di overflow:
+- drop_oldest (default): scarta gli eventi più vecchi
+- drop_newest: scarta i nuovi eventi finché la coda non si svuota
+- disconnect: chiude la sottoscrizione (il client si riconnette con Last-Event-ID)
+Gli eventi scartati vengono segnalati al client con un evento "dropped".
+
+I sottoscrittori sono indicizzati per il filtro più selettivo: un evento tocca
+solo quelli che potrebbero riceverlo, quindi quelli inattivi non costano nulla.
+Gli ultimi RECENT_EVENTS eventi restano in memoria per riprendere dopo una riconnessione.
+"""
+from collections import deque
+import itertools
+import threading
+import time
+
+import mes_json
+
+POLICIES = ("drop_oldest", "drop_newest", "disconnect")
+EVENT_TYPES = ("sfc_created", "routing_assigned", "operation_changed", "sfc_state_changed")
+
+DEFAULT_QUEUE_SIZE = 1000
+MAX_QUEUE_SIZE = 100000
+MAX_SUBSCRIBERS = 10000
+RECENT_EVENTS = 10000
+
+# Tipo di Event di MESState -> tipo di evento del feed (create_routing non riguarda gli SFC)
+_EVENT_TYPE = {
+    "create_sfc": "sfc_created",
+    "assign": "routing_assigned",
+    "advance": "operation_changed",
+    "rollback": "operation_changed",
+    "rollback_single": "operation_changed",
+    "force_advance": "operation_changed",
+}
+
+
+class Change:
+    """Mutazione di uno SFC come vista dal feed (copia immutabile, presa sotto il lock dello SFC)"""
+    __slots__ = ("seq", "type", "action", "sfc_id", "routing", "step", "sfc_state", "prev_state",
+                 "current_operation", "time", "_frames")
+
+    def __init__(self, seq, event):
+        sfc = event.sfc
+        self.seq = seq
+        self.type = _EVENT_TYPE[event.kind]
+        self.action = event.kind
+        self.sfc_id = event.sfc_id
+        self.routing = sfc.routing
+        self.step = event.arg
+        self.sfc_state = sfc.sfc_state()
+        self.prev_state = event.prev_state
+        self.current_operation = sfc.template.ids[sfc.current] if sfc.current >= 0 else None
+        self.time = time.time()
+        self._frames = None
+
+    @property
+    def state_changed(self):
+        return self.prev_state is not None and self.prev_state != self.sfc_state
+
+    def frames(self):
+        """Messaggi SSE dell'evento: (tipo, bytes), più sfc_state_changed se lo stato è cambiato.
+        Serializzati una sola volta e condivisi tra tutti i sottoscrittori.
+        """
+        if self._frames is None:
+            data = {
+                "seq": self.seq,
+                "action": self.action,
+                "sfc_id": self.sfc_id,
+                "routing": self.routing,
+                "sfc_state": self.sfc_state,
+                "prev_state": self.prev_state,
+                "current_operation": self.current_operation,
+                "time": round(self.time, 3),
+            }
+            if self.step is not None:
+                data["step"] = self.step
+            frames = [(self.type, sse_message(self.type, data, self.seq))]
+            if self.state_changed:
+                frames.append(("sfc_state_changed", sse_message("sfc_state_changed", data, self.seq)))
+            self._frames = frames
+        return self._frames
+
+
+def sse_message(event_type, data, event_id=None):
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{head}event: {event_type}\n".encode() + b"data: " + mes_json.dumps(data) + b"\n\n"
+
+
+# ---------------------------
+# Sottoscrittori
+# ---------------------------
+class Subscriber:
+    __slots__ = ("id", "sfc_id", "routing", "state", "types", "queue", "size", "policy",
+                 "dropped", "closed", "wakeup", "notify")
+
+    def __init__(self, sub_id, sfc_id, routing, state, types, size, policy, notify=None):
+        self.id = sub_id
+        self.sfc_id = sfc_id
+        self.routing = routing
+        self.state = state
+        self.types = types
+        self.size = size
+        self.policy = policy
+        self.queue = deque(maxlen=size if policy == "drop_oldest" else None)
+        self.dropped = 0
+        self.closed = False
+        self.wakeup = threading.Event()
+        self.notify = notify
+
+    def wake(self):
+        self.wakeup.set()
+        if self.notify is not None:
+            self.notify()
+
+    def matches(self, change):
+        return (
+            (self.sfc_id is None or self.sfc_id == change.sfc_id)
+            and (self.routing is None or self.routing == change.routing)
+            and (self.state is None or self.state in (change.sfc_state, change.prev_state))
+        )
+
+    def push(self, change):
+        """Accoda i messaggi dell'evento secondo la politica di overflow. Non blocca mai."""
+        if self.closed:
+            return
+        queued = False
+        for event_type, frame in change.frames():
+            if self.types is not None and event_type not in self.types:
+                continue
+            if len(self.queue) >= self.size:
+                if self.policy == "disconnect":
+                    self.closed = True
+                    self.wake()
+                    return
+                self.dropped += 1
+                if self.policy == "drop_newest":
+                    continue
+            self.queue.append(frame)
+            queued = True
+        if queued:
+            self.wake()
+
+
+class ChangeFeed:
+    """Distribuisce le mutazioni di MESState ai sottoscrittori"""
+
+    def __init__(self, state=None, recent=RECENT_EVENTS):
+        self._seq = itertools.count(1)
+        self._ids = itertools.count(1)
+        self._subs = {}                      # ID sottoscrittore -> Subscriber
+        # Indici dei sottoscrittori, ciascuno nel solo indice del suo filtro più selettivo
+        self._by_sfc = {}
+        self._by_routing = {}
+        self._by_state = {}
+        self._unfiltered = set()
+        self._lock = threading.Lock()        # solo per (dis)iscrizioni
+        self.recent = deque(maxlen=recent)   # ultimi eventi, per Last-Event-ID
+        if state is not None:
+            state.add_listener(self)
+
+    def _index_for(self, sub):
+        """(indice, chiave) in cui è registrato il sottoscrittore; chiave None per quelli senza filtri"""
+        if sub.sfc_id is not None:
+            return self._by_sfc, sub.sfc_id
+        if sub.routing is not None:
+            return self._by_routing, sub.routing
+        if sub.state is not None:
+            return self._by_state, sub.state
+        return None, None
+
+    # ---------------------------
+    # Listener di MESState (chiamato sotto il lock dello SFC: solo operazioni O(1) non bloccanti)
+    # ---------------------------
+    def __call__(self, event):
+        if event.kind not in _EVENT_TYPE:
+            return
+        change = Change(next(self._seq), event)
+        self.recent.append(change)
+        if not self._subs:
+            return
+        candidates = []
+        for index, key in ((self._by_sfc, change.sfc_id), (self._by_routing, change.routing),
+                           (self._by_state, change.sfc_state)):
+            subs = index.get(key)
+            if subs:
+                candidates += tuple(subs)
+        if change.state_changed:
+            subs = self._by_state.get(change.prev_state)
+            if subs:
+                candidates += tuple(subs)
+        if self._unfiltered:
+            candidates += tuple(self._unfiltered)
+        for sub in candidates:
+            if sub.matches(change):
+                sub.push(change)
+
+    # ---------------------------
+    # API dei sottoscrittori (usata anche tramite il proxy del backend condiviso)
+    # ---------------------------
+    def subscribe(self, sfc_id=None, routing=None, state=None, types=None,
+                  queue_size=DEFAULT_QUEUE_SIZE, policy="drop_oldest", last_event_id=None, notify=None):
+        """Registra un sottoscrittore e ne restituisce l'ID. Solleva ValueError se i parametri non sono validi.
+        Con last_event_id riaccoda gli eventi successivi ancora in memoria.
+        notify (solo in-process): chiamata senza argomenti quando arrivano messaggi o la
+        sottoscrizione si chiude, per i server asincroni che non possono attendere con poll.
+        Viene invocata dal thread che muta lo stato, sotto il lock dello SFC: deve solo
+        segnalare (es. loop.call_soon_threadsafe).
+        """
+        if policy not in POLICIES:
+            raise ValueError("Invalid policy")
+        if not isinstance(queue_size, int) or not 1 <= queue_size <= MAX_QUEUE_SIZE:
+            raise ValueError("Invalid queue size")
+        if types is not None:
+            types = frozenset(types)
+            if not types or not types <= set(EVENT_TYPES):
+                raise ValueError("Invalid types")
+        with self._lock:
+            if len(self._subs) >= MAX_SUBSCRIBERS:
+                raise OverflowError("Too many subscribers")
+            sub = Subscriber(next(self._ids), sfc_id, routing, state, types, queue_size, policy, notify)
+            if last_event_id is not None:
+                self._replay(sub, last_event_id)
+            self._subs[sub.id] = sub
+            index, key = self._index_for(sub)
+            if index is None:
+                self._unfiltered.add(sub)
+            else:
+                index.setdefault(key, set()).add(sub)
+        return sub.id
+
+    def _replay(self, sub, last_event_id):
+        recent = list(self.recent)
+        if recent and recent[0].seq > last_event_id + 1:
+            # Eventi persi oltre la memoria del feed: il client deve rileggere lo stato
+            sub.queue.append(sse_message("reset", {"reason": "events expired", "oldest_seq": recent[0].seq}))
+        for change in recent:
+            if change.seq > last_event_id and sub.matches(change):
+                sub.push(change)
+
+    def unsubscribe(self, sub_id):
+        with self._lock:
+            sub = self._subs.pop(sub_id, None)
+            if sub is not None:
+                index, key = self._index_for(sub)
+                if index is None:
+                    self._unfiltered.discard(sub)
+                else:
+                    index[key].discard(sub)
+                    if not index[key]:
+                        del index[key]
+                sub.closed = True
+                sub.wake()
+
+    def poll(self, sub_id, timeout):
+        """Attende fino a timeout secondi e restituisce (messaggi SSE accodati, sottoscrizione chiusa)"""
+        sub = self._subs.get(sub_id)
+        if sub is None:
+            return [], True
+        if not sub.queue and not sub.closed:
+            sub.wakeup.wait(timeout)
+        sub.wakeup.clear()
+        frames = []
+        if sub.dropped:
+            dropped, sub.dropped = sub.dropped, 0
+            frames.append(sse_message("dropped", {"count": dropped}))
+        queue = sub.queue
+        while queue:
+            frames.append(queue.popleft())
+        return frames, sub.closed
+
+    def stats(self):
+        return {"subscribers": len(self._subs), "last_seq": self.recent[-1].seq if self.recent else 0}
@@ -0,0 +1,229 @@
+"""Generatore deterministico di dati mock per il MES.
+
+Costruisce routing e SFC direttamente nello store compatto: per ogni combinazione
+(routing, stato, avanzamento) viene preparato un solo SFC prototipo che poi
+viene clonato, così anche milioni di SFC si caricano in pochi secondi.
+A parità di profilo (seed compreso) i dati generati sono identici.
+
+Profilo configurabile da variabili d'ambiente (all'avvio del server) o da CLI:
+
+    python mes_generator.py --seed 42 --sfcs 1000000 --routings 50 \\
+        --operations 5-15 --state-mix in_work=0.7,done=0.2,unassigned=0.1 \\
+        --progress uniform --data-dir ./data
+
+- MES_SEED / --seed: seed del generatore (default casuale)
+- MES_ROUTINGS / --routings: numero di routing (default 3)
+- MES_SFCS / --sfcs: numero di SFC (default 5)
+- MES_OPERATIONS / --operations: operazioni per routing, intervallo uniforme
+  "5-10" (default) oppure pesi "5=1,8=3,12=1"
+- MES_STATE_MIX / --state-mix: pesi degli SFC per stato:
+  unassigned (senza routing), in_work, done (default "in_work=1")
+- MES_PROGRESS / --progress: operazione in work degli SFC in_work,
+  start (la prima, default) oppure uniform (qualsiasi)
+- MES_BYPASS_RATE / --bypass-rate: probabilità che un'operazione già
+  superata risulti 'bypassed' invece di 'done' (default 0)
+
+Con --data-dir i dati generati vengono salvati come snapshot (vedi mes_persistence)
+e il server li carica all'avvio con MES_DATA_DIR.
+"""
+import argparse
+import os
+import random
+import time
+
+from mes_store import BYPASSED, SFCRecord
+
+MIX_KEYS = ("unassigned", "in_work", "done")
+PROGRESS_MODES = ("start", "uniform")
+
+
+# ---------------------------
+# Profilo
+# ---------------------------
+def parse_weights(spec, convert=str):
+    """'a=1,b=3' -> ([a, b], [1.0, 3.0])"""
+    values, weights = [], []
+    for part in spec.split(","):
+        key, sep, weight = part.partition("=")
+        if not sep:
+            raise ValueError(f"Invalid weight spec: {spec!r}")
+        values.append(convert(key.strip()))
+        weights.append(float(weight))
+    if any(w < 0 for w in weights) or not sum(weights):
+        raise ValueError(f"Invalid weights: {spec!r}")
+    return values, weights
+
+def parse_operations(spec):
+    """Distribuzione del numero di operazioni: '5-10' (uniforme) o '5=1,8=3'"""
+    if "=" in spec:
+        values, weights = parse_weights(spec, int)
+    else:
+        low, _, high = spec.partition("-")
+        low = int(low)
+        high = int(high) if high else low
+        values, weights = list(range(low, high + 1)), None
+    if not values or min(values) < 1:
+        raise ValueError(f"Invalid operations spec: {spec!r}")
+    return values, weights
+
+
+class ShopFloorProfile:
+    """Parametri della generazione; i campi hanno gli stessi nomi delle opzioni CLI"""
+
+    def __init__(self, seed=None, routings=3, sfcs=5, operations="5-10",
+                 state_mix="in_work=1", progress="start", bypass_rate=0.0):
+        self.seed = seed
+        self.routings = routings
+        self.sfcs = sfcs
+        self.operations = parse_operations(operations)
+        self.state_mix = parse_weights(state_mix)
+        if any(key not in MIX_KEYS for key in self.state_mix[0]):
+            raise ValueError(f"Invalid state mix: {state_mix!r} (keys: {', '.join(MIX_KEYS)})")
+        if progress not in PROGRESS_MODES:
+            raise ValueError(f"Invalid progress: {progress!r}")
+        self.progress = progress
+        if not 0 <= bypass_rate <= 1:
+            raise ValueError(f"Invalid bypass rate: {bypass_rate!r}")
+        self.bypass_rate = bypass_rate
+        if routings < 1 and sfcs and any(key != "unassigned" for key in self.state_mix[0]):
+            raise ValueError("At least one routing is required to assign SFCs")
+
+    @classmethod
+    def from_env(cls, environ=os.environ):
+        seed = environ.get("MES_SEED")
+        return cls(
+            seed=int(seed) if seed else None,
+            routings=int(environ.get("MES_ROUTINGS", 3)),
+            sfcs=int(environ.get("MES_SFCS", 5)),
+            operations=environ.get("MES_OPERATIONS", "5-10"),
+            state_mix=environ.get("MES_STATE_MIX", "in_work=1"),
+            progress=environ.get("MES_PROGRESS", "start"),
+            bypass_rate=float(environ.get("MES_BYPASS_RATE", 0)),
+        )
+
+
+# ---------------------------
+# Generazione
+# ---------------------------
+def _prototype(routing_id, template, mix, step, bypassed=()):
+    """SFC con il routing assegnato e le operazioni prima di step superate"""
+    sfc = SFCRecord()
+    sfc.assign(routing_id, template)
+    n = len(template)
+    if mix == "done":
+        step = n
+    for _ in range(step):
+        sfc.advance()
+    for i in bypassed:
+        sfc._set(i, BYPASSED)
+    return sfc
+
+def generate(state, profile=None, owns=None):
+    """Popola state (vuoto) secondo il profilo; restituisce gli ID degli SFC creati.
+    owns: filtro sugli ID (uno shard tiene solo i propri SFC). Gli SFC scartati sono comunque
+    estratti, quindi ogni shard ha gli stessi routing e gli stessi SFC del dataset non partizionato.
+    """
+    profile = profile or ShopFloorProfile()
+    rng = random.Random(profile.seed)
+
+    values, weights = profile.operations
+    if weights is None:
+        sizes = [rng.choice(values) for _ in range(profile.routings)]
+    else:
+        sizes = rng.choices(values, weights, k=profile.routings)
+    routing_ids = [state.create_routing(n)["routing_id"] for n in sizes]
+
+    # Estrazioni in blocco: rng.choices è molto più veloce di una chiamata per SFC
+    n_sfcs = profile.sfcs
+    keys, mix_weights = profile.state_mix
+    mixes = rng.choices(keys, mix_weights, k=n_sfcs)
+    routing_choices = rng.choices(routing_ids, k=n_sfcs) if routing_ids else [None] * n_sfcs
+    progress = [rng.random() for _ in range(n_sfcs)] if profile.progress == "uniform" else None
+    bypass_rate = profile.bypass_rate
+    templates = state.routings
+    prototypes = {}
+    unassigned = SFCRecord()
+
+    def records():
+        for i, (mix, routing_id) in enumerate(zip(mixes, routing_choices)):
+            sfc_id = f"SFCMOCK{next(state._sfc_numbers)}"
+            if owns is not None and not owns(sfc_id):
+                if bypass_rate and mix != "unassigned":
+                    # Stesse estrazioni del ramo con bypass: i numeri casuali restano allineati
+                    n = len(templates[routing_id])
+                    step = int(progress[i] * n) if progress and mix == "in_work" else 0
+                    if step or mix == "done":
+                        for _ in range(n if mix == "done" else step):
+                            rng.random()
+                continue
+            if mix == "unassigned":
+                yield sfc_id, unassigned.clone()
+                continue
+            template = templates[routing_id]
+            n = len(template)
+            step = int(progress[i] * n) if progress and mix == "in_work" else 0
+            if bypass_rate and (step or mix == "done"):
+                # Pattern di bypass casuale: niente prototipo condiviso
+                passed = n if mix == "done" else step
+                bypassed = [j for j in range(passed) if rng.random() < bypass_rate]
+                yield sfc_id, _prototype(routing_id, template, mix, step, bypassed)
+                continue
+            key = (routing_id, mix, step)
+            prototype = prototypes.get(key)
+            if prototype is None:
+                prototype = prototypes[key] = _prototype(routing_id, template, mix, step)
+            yield sfc_id, prototype.clone()
+
+    start = len(state.sfc_ids)
+    state.load_sfcs(records())
+    return state.sfc_ids[start:]
+
+
+# ---------------------------
+# CLI
+# ---------------------------
+def main():
+    from mes_core import MESState
+    from mes_persistence import Persistence
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--routings", type=int, default=3)
+    parser.add_argument("--sfcs", type=int, default=5)
+    parser.add_argument("--operations", default="5-10")
+    parser.add_argument("--state-mix", default="in_work=1")
+    parser.add_argument("--progress", choices=PROGRESS_MODES, default="start")
+    parser.add_argument("--bypass-rate", type=float, default=0.0)
+    parser.add_argument("--data-dir", help="salva i dati generati come snapshot in questa directory")
+    args = parser.parse_args()
+    data_dir = args.data_dir
+    del args.data_dir
+    try:
+        profile = ShopFloorProfile(**vars(args))
+    except ValueError as e:
+        parser.error(str(e))
+
+    state = MESState()
+    persistence = None
+    if data_dir:
+        persistence = Persistence(state, data_dir, snapshot_interval=0)
+        if persistence.restored:
+            persistence.close()
+            parser.error(f"{data_dir} contiene già dati")
+
+    start = time.perf_counter()
+    generate(state, profile)
+    elapsed = time.perf_counter() - start
+    print(f"{len(state.routings)} routing, {len(state.sfcs)} SFC generati in {elapsed:.2f}s")
+    for sfc_state, ids in state.sfcs_by_state.items():
+        print(f"  {sfc_state}: {len(ids)}")
+
+    if persistence is not None:
+        start = time.perf_counter()
+        persistence.snapshot()
+        persistence.close()
+        print(f"snapshot salvato in {data_dir} in {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
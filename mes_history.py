@@ -0,0 +1,231 @@
+"""Storico delle transizioni degli SFC (/sfc/<id>/history, /history).
+
+History è un listener di MESState, come il feed e gli analytics. Ogni transizione è un
+record a larghezza fissa (struct, 20 byte) con istante, azione, step di partenza e di
+arrivo, operazioni bypassate, stato SFC e routing risultanti:
+
+- per SFC: un bytearray usato come ring buffer (header di 6 byte + al massimo
+  MES_HISTORY_PER_SFC record), quindi la memoria per SFC resta limitata anche con
+  advance/rollback senza fine; i record più vecchi vengono sovrascritti. Il ring esiste
+  solo per gli SFC con transizioni dall'avvio e costa 6 + 20 * MES_HISTORY_PER_SFC byte
+  più ~130 byte di bytearray e voce del dict: ~0,3 KB con il default 8 (~300 MB con
+  1 milione di SFC attivi), 0 lo disattiva
+- globale: un ring buffer di MES_HISTORY_EVENTS record (più posizione dello SFC e
+  numero del record) in ordine di tempo, per le interrogazioni su un intervallo. È diviso
+  in segmenti di SEGMENT_RECORDS record allocati man mano che si riempiono; ogni transizione
+  riserva sotto il lock solo istante e numero del record e scrive il record fuori dal lock
+
+Entrambi sono ordinati per istante: since/until sono risolti con una ricerca binaria
+sui record, senza scansioni. Lo storico vive solo in memoria e riparte vuoto a ogni avvio.
+"""
+import os
+import struct
+import threading
+import time
+
+from mes_core import SFC_STATES, PageError
+from mes_store import OPERATION_STATES
+
+HISTORY_PER_SFC = int(os.environ.get("MES_HISTORY_PER_SFC", 8))
+HISTORY_EVENTS = int(os.environ.get("MES_HISTORY_EVENTS", 1_000_000))
+# Record per pagina di /history
+DEFAULT_HISTORY_LIMIT = 1000
+MAX_HISTORY_LIMIT = 10000
+
+ACTIONS = ("create_sfc", "assign", "advance", "rollback", "force_advance", "rollback_single")
+_ACTION_CODES = {action: code for code, action in enumerate(ACTIONS)}
+_STATE_CODES = {state: code for code, state in enumerate(SFC_STATES)}
+_BYPASSED = OPERATION_STATES.index("bypassed")
+_IN_WORK = OPERATION_STATES.index("in work")
+
+# istante, azione, stato SFC, step di partenza e di arrivo (da 1, 0 = nessuno), bypassate, routing (posizione + 1)
+RECORD = struct.Struct("<dBBHHHI")
+# record globale: record + posizione dello SFC + numero del record (mod 2^32, per
+# riconoscere gli slot riservati e non ancora scritti)
+GLOBAL_RECORD = struct.Struct("<dBBHHHIII")
+# Record per segmento del ring globale (~1,8 MB)
+SEGMENT_RECORDS = 65536
+# Record in coda controllati dalle letture: più dei thread che scrivono contemporaneamente
+INFLIGHT_SCAN = 64
+# header del ring per SFC: prossimo slot, record scritti in totale
+_HEADER = struct.Struct("<HI")
+_TIME = struct.Struct("<d")
+
+
+def _step(sfc_current):
+    return sfc_current + 1 if sfc_current >= 0 else 0
+
+def parse_time_range(args):
+    """since/until (secondi epoch, estremi inclusi) dalla query string"""
+    bounds = []
+    for name in ("since", "until"):
+        try:
+            bounds.append(float(args[name]) if args.get(name) else None)
+        except ValueError:
+            raise PageError(f"Invalid {name}")
+    return bounds
+
+def _bisect(count, time_at, value, right=False):
+    """Primo indice logico con istante >= value (> value con right=True)"""
+    lo, hi = 0, count
+    while lo < hi:
+        mid = (lo + hi) // 2
+        t = time_at(mid)
+        if t < value or (right and t == value):
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+class History:
+    """Listener di MESState che registra le transizioni per SFC e in un indice globale"""
+
+    def __init__(self, state, per_sfc=HISTORY_PER_SFC, events=HISTORY_EVENTS, clock=time.time):
+        self.state = state
+        self.per_sfc = per_sfc
+        self.capacity = events
+        self.clock = clock
+        self._lock = threading.Lock()           # numero e istante (monotono) dei record globali
+        self.reset()
+        state.add_listener(self)
+
+    def reset(self):
+        """Svuota lo storico (dopo il bootstrap: gli eventi riapplicati dal log non hanno l'istante originale)"""
+        with self._lock:
+            self._sfcs = {}                      # SFC ID -> bytearray (header + ring di RECORD)
+            self._segments = []                  # bytearray di SEGMENT_RECORDS record, allocati al primo uso
+            self._total = 0                      # record globali riservati (il prossimo ha questo numero)
+            self._last = 0.0
+            self._routing_pos = {routing_id: i + 1 for i, routing_id in enumerate(self.state.routing_ids)}
+
+    # ---------------------------
+    # Listener di MESState (sotto il lock dello SFC)
+    # ---------------------------
+    def __call__(self, event):
+        kind = event.kind
+        if kind == "create_routing":
+            # Emesso subito prima dell'aggiunta a routing_ids, sotto il lock di registrazione
+            self._routing_pos[event.routing] = len(self.state.routing_ids) + 1
+            return
+        sfc = event.sfc
+        to_step = _step(sfc.current)
+        if event.prev_ops is None:
+            from_step = bypassed = 0
+        else:
+            from_step = event.prev_ops.find(_IN_WORK) + 1
+            bypassed = sum(1 for prev, op in zip(event.prev_ops, sfc.states) if op == _BYPASSED and prev != _BYPASSED) \
+                if kind == "force_advance" else 0
+        routing = self._routing_pos.get(sfc.routing, 0)
+        action, sfc_state = _ACTION_CODES[kind], _STATE_CODES[sfc.sfc_state()]
+        with self._lock:
+            # Istante non decrescente: l'ordine dei record è quello di riserva
+            now = self._last = max(self.clock(), self._last)
+            number = self._total
+            self._total += 1
+            if self.capacity and number < self.capacity and number % SEGMENT_RECORDS == 0:
+                self._segments.append(bytearray(GLOBAL_RECORD.size * min(SEGMENT_RECORDS, self.capacity - number)))
+        if self.capacity:
+            segment, offset = self._slot(number)
+            GLOBAL_RECORD.pack_into(segment, offset, now, action, sfc_state, from_step, to_step, bypassed,
+                                    routing, sfc.pos, number & 0xFFFFFFFF)
+        if not self.per_sfc:
+            return
+        buf = self._sfcs.get(event.sfc_id)
+        if buf is None:
+            buf = self._sfcs[event.sfc_id] = bytearray(_HEADER.size)
+        slot, written = _HEADER.unpack_from(buf)
+        record = RECORD.pack(now, action, sfc_state, from_step, to_step, bypassed, routing)
+        if written < self.per_sfc:
+            buf += record
+        else:
+            offset = _HEADER.size + slot * RECORD.size
+            buf[offset:offset + RECORD.size] = record
+        _HEADER.pack_into(buf, 0, (slot + 1) % self.per_sfc, written + 1)
+
+    def _slot(self, number):
+        """(segmento, offset) del record globale con quel numero"""
+        slot = number % self.capacity
+        return self._segments[slot // SEGMENT_RECORDS], (slot % SEGMENT_RECORDS) * GLOBAL_RECORD.size
+
+    # ---------------------------
+    # Letture
+    # ---------------------------
+    def _render(self, fields, sfc_id=None):
+        when, action, sfc_state, from_step, to_step, bypassed, routing = fields[:7]
+        item = {
+            "time": when,
+            "action": ACTIONS[action],
+            "from_step": from_step or None,
+            "to_step": to_step or None,
+            "sfc_state": SFC_STATES[sfc_state],
+            "routing": self.state.routing_ids[routing - 1] if routing else None,
+        }
+        if bypassed:
+            item["bypassed"] = bypassed
+        if sfc_id is not None:
+            item["sfc_id"] = sfc_id
+        return item
+
+    def sfc_history(self, sfc_id, since=None, until=None, limit=None):
+        """Transizioni dello SFC nell'intervallo, dalla più vecchia; (body, status)"""
+        if sfc_id not in self.state.sfcs:
+            return {"error": "SFC not found"}, 404
+        with self.state.lock_for(sfc_id):
+            buf = bytes(self._sfcs.get(sfc_id, b""))
+        if not buf:
+            return {"sfc_id": sfc_id, "history": [], "dropped": 0}, 200
+        slot, written = _HEADER.unpack_from(buf)
+        count = min(written, self.per_sfc)
+        first = slot if written > self.per_sfc else 0      # slot del record più vecchio
+
+        def offset(i):
+            return _HEADER.size + ((first + i) % count) * RECORD.size
+
+        def time_at(i):
+            return _TIME.unpack_from(buf, offset(i))[0]
+
+        start = 0 if since is None else _bisect(count, time_at, since)
+        end = count if until is None else _bisect(count, time_at, until, right=True)
+        if limit is not None:
+            end = min(end, start + limit)
+        history = [self._render(RECORD.unpack_from(buf, offset(i))) for i in range(start, end)]
+        return {"sfc_id": sfc_id, "history": history, "dropped": written - count}, 200
+
+    def events(self, since=None, until=None, cursor=None, limit=DEFAULT_HISTORY_LIMIT):
+        """Transizioni di tutti gli SFC nell'intervallo, in ordine di tempo.
+        Il cursore è il numero progressivo del record: resta valido finché il record è nel ring.
+        """
+        with self._lock:
+            total, capacity = self._total, self.capacity
+            if not capacity:
+                return {"events": [], "next_cursor": None, "dropped": total}
+            oldest = max(0, total - capacity)
+
+            def record(i):
+                return GLOBAL_RECORD.unpack_from(*self._slot(oldest + i))
+
+            # Gli ultimi record possono essere riservati ma non ancora scritti: si escludono
+            count = total - oldest
+            for i in range(count - 1, max(-1, count - 1 - INFLIGHT_SCAN), -1):
+                if record(i)[8] != (oldest + i) & 0xFFFFFFFF:
+                    count = i
+
+            def time_at(i):
+                return _TIME.unpack_from(*self._slot(oldest + i))[0]
+
+            start = 0 if since is None else _bisect(count, time_at, since)
+            if cursor is not None:
+                start = max(start, cursor - oldest)
+            end = count if until is None else _bisect(count, time_at, until, right=True)
+            stop = min(end, start + limit)
+            records = [record(i) for i in range(start, stop)]
+        sfc_ids = self.state.sfc_ids
+        return {
+            "events": [self._render(fields, sfc_ids[fields[7]]) for fields in records],
+            "next_cursor": str(oldest + stop) if stop < end else None,
+            "dropped": oldest,
+        }
+
+    def stats(self):
+        return {"events": self._total, "retained": min(self._total, self.capacity), "sfcs": len(self._sfcs)}
@@ -0,0 +1,34 @@
+"""Serializzazione JSON del mock MES.
+
+Usa orjson se installato, altrimenti il modulo json della libreria standard
+(MES_JSON=stdlib forza il fallback). L'output è compatto e con le chiavi
+ordinate, come jsonify: le risposte sono identiche con entrambi i backend
+(a parte i caratteri non ASCII, che orjson non esegue l'escape).
+"""
+import json
+import os
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+BACKEND = "orjson" if orjson is not None and os.environ.get("MES_JSON") != "stdlib" else "stdlib"
+
+if BACKEND == "orjson":
+    _OPTIONS = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS
+
+    def dumps(obj, indent=False):
+        """obj -> bytes"""
+        return orjson.dumps(obj, option=_OPTIONS | orjson.OPT_INDENT_2 if indent else _OPTIONS)
+
+    loads = orjson.loads
+else:
+    _compact = json.JSONEncoder(sort_keys=True, separators=(",", ":"))
+    _indented = json.JSONEncoder(sort_keys=True, indent=2)
+
+    def dumps(obj, indent=False):
+        """obj -> bytes"""
+        return (_indented if indent else _compact).encode(obj).encode()
+
+    loads = json.loads
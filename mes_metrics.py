@@ -0,0 +1,221 @@
+"""Strumentazione del mock MES: latenze per endpoint, metriche Prometheus e profiler a campionamento.
+
+I contatori sono per thread del sistema operativo: ogni thread del server aggiorna
+solo le proprie serie, senza lock; /metrics le somma al momento della lettura.
+Con il worker gevent le richieste sono greenlet dello stesso thread e condividono
+le sue serie (un greenlet non cede il controllo durante un'osservazione).
+Con più worker gunicorn ogni processo espone le proprie metriche.
+"""
+from bisect import bisect_left
+from collections import Counter
+import os
+import sys
+import threading
+import time
+
+# Limiti superiori dei bucket (secondi / byte), come negli istogrammi Prometheus
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Series:
+    """Istogrammi di latenza e dimensione della risposta di un (metodo, route, status)"""
+    __slots__ = ("latency", "latency_sum", "size", "size_sum", "count")
+
+    def __init__(self):
+        self.latency = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.latency_sum = 0.0
+        self.size = [0] * (len(SIZE_BUCKETS) + 1)
+        self.size_sum = 0
+        self.count = 0
+
+    def observe(self, seconds, size):
+        self.latency[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.latency_sum += seconds
+        if size is not None:
+            self.size[bisect_left(SIZE_BUCKETS, size)] += 1
+            self.size_sum += size
+        self.count += 1
+
+    def merge(self, other):
+        self.latency = [a + b for a, b in zip(self.latency, other.latency)]
+        self.latency_sum += other.latency_sum
+        self.size = [a + b for a, b in zip(self.size, other.size)]
+        self.size_sum += other.size_sum
+        self.count += other.count
+
+
+# ---------------------------
+# Metriche
+# ---------------------------
+class Metrics:
+    """Registro delle osservazioni delle richieste HTTP"""
+
+    def __init__(self):
+        self.started = time.time()
+        self._shards = {}                 # native id del thread -> {(metodo, route, status): Series}
+        self._lock = threading.Lock()     # solo per registrare lo shard di un nuovo thread
+        self.active = set()               # thread che stanno servendo una richiesta (per il profiler)
+
+    def _shard(self):
+        # Il native id, non threading.local: con gevent threading.local è per greenlet
+        # e ogni richiesta aggiungerebbe uno shard
+        thread_id = threading.get_native_id()
+        shard = self._shards.get(thread_id)
+        if shard is None:
+            with self._lock:
+                shard = self._shards.setdefault(thread_id, {})
+        return shard
+
+    def observe(self, method, route, status, seconds, size=None):
+        shard = self._shard()
+        key = (method, route, status)
+        series = shard.get(key)
+        if series is None:
+            series = shard[key] = Series()
+        series.observe(seconds, size)
+
+    def collect(self):
+        """Serie sommate su tutti i thread"""
+        with self._lock:
+            shards = list(self._shards.values())
+        merged = {}
+        for shard in shards:
+            for key, series in list(shard.items()):
+                total = merged.get(key)
+                if total is None:
+                    total = merged[key] = Series()
+                total.merge(series)
+        return merged
+
+    def render(self, stats=None):
+        """Testo nel formato di esposizione Prometheus; stats da MESState.stats()"""
+        lines = []
+        merged = sorted(self.collect().items())
+
+        lines += [
+            "# HELP mes_http_requests_total Richieste HTTP servite.",
+            "# TYPE mes_http_requests_total counter",
+        ]
+        for (method, route, status), series in merged:
+            lines.append(f'mes_http_requests_total{{method="{method}",route="{route}",status="{status}"}} {series.count}')
+
+        by_route = {}
+        for (method, route, _), series in merged:
+            total = by_route.get((method, route))
+            if total is None:
+                total = by_route[(method, route)] = Series()
+            total.merge(series)
+        lines += _histogram(
+            "mes_http_request_duration_seconds", "Latenza delle richieste per endpoint.",
+            by_route, LATENCY_BUCKETS, "latency", "latency_sum", lambda s: s.count,
+        )
+        lines += _histogram(
+            "mes_http_response_size_bytes", "Dimensione del body delle risposte (escluse quelle in streaming).",
+            by_route, SIZE_BUCKETS, "size", "size_sum", lambda s: sum(s.size),
+        )
+
+        if stats is not None:
+            lines += [
+                "# HELP mes_sfcs SFC presenti per stato.",
+                "# TYPE mes_sfcs gauge",
+            ]
+            for state, count in stats["sfcs_by_state"].items():
+                lines.append(f'mes_sfcs{{state="{state}"}} {count}')
+            lines += [
+                "# HELP mes_routings Routing presenti.",
+                "# TYPE mes_routings gauge",
+                f"mes_routings {stats['routings']}",
+                "# HELP mes_state_memory_bytes Memoria stimata dello store degli SFC.",
+                "# TYPE mes_state_memory_bytes gauge",
+                f"mes_state_memory_bytes {stats['memory_bytes']}",
+            ]
+        rss = resident_memory()
+        if rss is not None:
+            lines += [
+                "# HELP process_resident_memory_bytes Memoria residente del processo.",
+                "# TYPE process_resident_memory_bytes gauge",
+                f"process_resident_memory_bytes {rss}",
+            ]
+        lines += [
+            "# HELP process_start_time_seconds Avvio del processo (epoch).",
+            "# TYPE process_start_time_seconds gauge",
+            f"process_start_time_seconds {self.started:.3f}",
+        ]
+        return "\n".join(lines) + "\n"
+
+
+def _histogram(name, help_text, by_route, buckets, field, sum_field, count):
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+    for (method, route), series in sorted(by_route.items()):
+        labels = f'method="{method}",route="{route}"'
+        cumulative = 0
+        values = getattr(series, field)
+        for bound, observed in zip(buckets, values):
+            cumulative += observed
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {cumulative + values[-1]}')
+        lines.append(f"{name}_sum{{{labels}}} {getattr(series, sum_field)}")
+        lines.append(f"{name}_count{{{labels}}} {count(series)}")
+    return lines
+
+def resident_memory():
+    """RSS del processo in byte (Linux), None se non disponibile"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+# ---------------------------
+# Profiler a campionamento
+# ---------------------------
+def profiler_enabled():
+    return os.environ.get("MES_PROFILER") == "1"
+
+def sample_stacks(seconds, interval=0.005, threads=None):
+    """Campiona gli stack dei thread per seconds secondi, escluso il chiamante.
+    threads: insieme (anche variabile, es. Metrics.active) degli ident da campionare; None = tutti.
+    Con il worker gevent le richieste sono greenlet del thread principale: si campiona
+    quel thread (greenlet in esecuzione o hub in attesa) da un thread vero del threadpool.
+    Restituisce un Counter di stack collassati "modulo:funzione;...;modulo:funzione",
+    il formato letto da flamegraph.pl e speedscope.
+    """
+    monkey = sys.modules.get("gevent.monkey")
+    if monkey is not None and monkey.is_module_patched("threading"):
+        import gevent
+        hub_thread = monkey.get_original("_thread", "get_ident")()
+        return gevent.get_hub().threadpool.apply(_sample_stacks, (seconds, interval, {hub_thread}))
+    return _sample_stacks(seconds, interval, threads)
+
+def _sample_stacks(seconds, interval, threads):
+    stacks = Counter()
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        selected = set(threads) if threads is not None else None
+        caller = sys._getframe()
+        for thread_id, frame in sys._current_frames().items():
+            if frame is caller or (selected is not None and thread_id not in selected):
+                continue
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            stacks[";".join(reversed(names))] += 1
+        time.sleep(interval)
+    return stacks
+
+def hot_functions(stacks, top=30):
+    """Funzioni più presenti nei campioni: (funzione, campioni in cima allo stack, campioni totali)"""
+    self_counts, total_counts = Counter(), Counter()
+    for stack, count in stacks.items():
+        frames = stack.split(";")
+        self_counts[frames[-1]] += count
+        for name in set(frames):
+            total_counts[name] += count
+    ranked = sorted(total_counts, key=lambda name: (self_counts[name], total_counts[name]), reverse=True)
+    return [(name, self_counts[name], total_counts[name]) for name in ranked[:top]]
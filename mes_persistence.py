@@ -0,0 +1,376 @@
+"""Persistenza dello stato del MES: log append-only degli eventi e snapshot binari.
+
+Ogni mutazione viene accodata al log come record binario a larghezza fissa; un
+thread li scrive a gruppi con un solo fsync ogni MES_FSYNC_INTERVAL secondi
+(group commit). Ogni MES_SNAPSHOT_INTERVAL secondi uno snapshot binario
+fotografa lo stato e apre un nuovo segmento di log: all'avvio si carica lo
+snapshot e si riapplicano solo gli eventi successivi.
+
+File in MES_DATA_DIR (persistenza disattivata se non impostata):
+- snapshot.bin: ultimo snapshot, di generazione g
+- events.<g>.log: eventi successivi allo snapshot di generazione g
+"""
+from array import array
+import atexit
+from contextlib import contextmanager, nullcontext
+import glob
+import logging
+import os
+import re
+import struct
+import threading
+import time
+
+from mes_core import LOCK_STRIPES
+from mes_store import SFCRecord
+
+# tipo evento, numero SFC (SFCMOCK<n>), numero routing (ROUTING<n>), argomento (step o numero operazioni)
+RECORD = struct.Struct("<BIIi")
+KINDS = ("create_sfc", "create_routing", "assign", "advance", "rollback", "rollback_single", "force_advance")
+KIND_CODES = {kind: code for code, kind in enumerate(KINDS, 1)}
+CREATIONS = ("create_sfc", "create_routing")
+
+SNAPSHOT_MAGIC = b"MESSNAP1"
+# magic, generazione, numero routing, numero SFC
+SNAPSHOT_HEADER = struct.Struct("<8sQII")
+
+DEFAULT_FSYNC_INTERVAL = 0.05
+DEFAULT_SNAPSHOT_INTERVAL = 300
+# Frazione massima degli eventi riapplicati che può fallire prima di interrompere l'avvio
+DEFAULT_MAX_REPLAY_FAILURES = 0.01
+
+log = logging.getLogger("mes_persistence")
+
+
+def _number(item_id, prefix):
+    return int(item_id[len(prefix):]) if item_id else 0
+
+def _segment_path(data_dir, generation):
+    return os.path.join(data_dir, f"events.{generation}.log")
+
+def _segments(data_dir):
+    """Generazioni dei segmenti di log presenti, in ordine"""
+    generations = []
+    for path in glob.glob(os.path.join(data_dir, "events.*.log")):
+        match = re.search(r"events\.(\d+)\.log$", path)
+        if match:
+            generations.append(int(match.group(1)))
+    return sorted(generations)
+
+
+# ---------------------------
+# Event log
+# ---------------------------
+class EventLog:
+    """Log append-only con group commit: i record si accumulano in memoria
+    e un thread li scrive con un fsync per gruppo.
+    Si registra come listener di MESState. Le transizioni finiscono in un buffer per
+    lock di MESState, scritto sotto il lock dello SFC già tenuto da chi emette l'evento:
+    nessun lock globale per transizione. Le creazioni di SFC e routing (emesse sotto il
+    lock di registrazione, nell'ordine delle posizioni) hanno un buffer a parte, con il
+    proprio lock.
+    """
+
+    def __init__(self, path, state, fsync_interval=DEFAULT_FSYNC_INTERVAL, events=0):
+        self.path = path
+        self.state = state
+        self.fsync_interval = fsync_interval
+        self._file = open(path, "ab")
+        self._buffers = [bytearray() for _ in range(LOCK_STRIPES)]
+        self._counts = [0] * LOCK_STRIPES
+        self._created = bytearray()           # create_sfc e create_routing, in ordine
+        self._base = events                   # eventi dall'ultimo snapshot già scritti (o riapplicati)
+        self._lock = threading.Lock()         # protegge il buffer delle creazioni
+        self._write_lock = threading.Lock()   # serializza scritture e rotazioni del file
+        self._closed = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="mes-event-log", daemon=True)
+        self._thread.start()
+
+    @property
+    def events(self):
+        """Eventi dall'ultimo snapshot"""
+        return self._base + sum(self._counts) + len(self._created) // RECORD.size
+
+    def __call__(self, event):
+        record = RECORD.pack(
+            KIND_CODES[event.kind],
+            _number(event.sfc_id, "SFCMOCK"),
+            _number(event.routing, "ROUTING"),
+            event.arg or 0,
+        )
+        if event.kind in CREATIONS:
+            with self._lock:
+                self._created += record
+        else:
+            stripe = self.state.stripe(event.sfc_id)
+            self._buffers[stripe] += record
+            self._counts[stripe] += 1
+
+    def _take(self, frozen=False):
+        """Record accumulati, da scrivere in quest'ordine. I buffer delle transizioni sono presi
+        prima di quello delle creazioni e scritti dopo: una creazione è registrata prima che lo
+        SFC o il routing sia usabile, quindi precede nel file ogni transizione che lo usa.
+        """
+        parts = []
+        for stripe in range(LOCK_STRIPES):
+            with nullcontext() if frozen else self.state.stripe_lock(stripe):
+                if self._buffers[stripe]:
+                    parts.append(self._buffers[stripe])
+                    self._buffers[stripe] = bytearray()
+                    self._base += self._counts[stripe]
+                    self._counts[stripe] = 0
+        with self._lock:
+            created, self._created = self._created, bytearray()
+            self._base += len(created) // RECORD.size
+        return b"".join([created] + parts)
+
+    def _run(self):
+        while not self._closed.wait(self.fsync_interval):
+            self.flush()
+
+    def flush(self):
+        """Scrive su disco i record accumulati con un solo fsync"""
+        with self._write_lock:
+            data = self._take()
+            if not data:
+                return
+            self._file.write(data)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    @contextmanager
+    def paused(self):
+        """Nessuna scrittura finché il blocco è aperto (per la rotazione)"""
+        with self._write_lock:
+            yield
+
+    def rotate(self, path):
+        """Chiude il segmento corrente (dopo averlo scritto) e continua su un nuovo file.
+        Da chiamare dentro paused(), con lo stato congelato (MESState.freeze).
+        """
+        data = self._take(frozen=True)
+        self._base = 0
+        self._file.write(data)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        self._file = open(path, "ab")
+        self.path = path
+
+    def close(self):
+        self._closed.set()
+        self._thread.join()
+        self.flush()
+        self._file.close()
+
+
+class ReplayError(RuntimeError):
+    """Troppi eventi del log non riapplicabili: il log è corrotto o fuori ordine"""
+
+
+def replay(path, state):
+    """Riapplica a state gli eventi di un segmento di log; restituisce (eventi, falliti per tipo).
+    Un record finale incompleto (crash durante la scrittura) viene scartato. Nel log finiscono
+    solo mutazioni riuscite, quindi un evento che non si riapplica (status diverso da 200)
+    indica un log corrotto o fuori ordine.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    usable = len(data) - len(data) % RECORD.size
+    if usable != len(data):
+        with open(path, "r+b") as f:
+            f.truncate(usable)
+    count = 0
+    failed = {}
+    for code, sfc_number, routing_number, arg in RECORD.iter_unpack(memoryview(data)[:usable]):
+        kind = KINDS[code - 1] if 1 <= code <= len(KINDS) else "unknown"
+        sfc_id = f"SFCMOCK{sfc_number}"
+        if kind == "create_sfc":
+            _, status = state.claim_sfc(sfc_id)
+        elif kind == "create_routing":
+            _, status = state.claim_routing(arg, f"ROUTING{routing_number}")
+        elif kind == "assign":
+            _, status = state.assign_routing(sfc_id, f"ROUTING{routing_number}")
+        elif kind == "advance":
+            _, status = state.advance(sfc_id)
+        elif kind == "rollback":
+            _, status = state.rollback(sfc_id, arg)
+        elif kind == "rollback_single":
+            _, status = state.rollback_single(sfc_id)
+        elif kind == "force_advance":
+            _, status = state.force_advance(sfc_id, arg)
+        else:
+            status = None
+        if status != 200:
+            failed[kind] = failed.get(kind, 0) + 1
+        count += 1
+    return count, failed
+
+
+# ---------------------------
+# Snapshot
+# ---------------------------
+def capture_snapshot(state):
+    """Copia compatta dello stato; da chiamare con lo stato congelato (MESState.freeze)"""
+    routings = state.routings
+    sfcs = [state.sfcs[sfc_id] for sfc_id in state.sfc_ids]
+    return (
+        array("I", (_number(r, "ROUTING") for r in state.routing_ids)),
+        array("I", (len(routings[r]) for r in state.routing_ids)),
+        array("I", (_number(sfc_id, "SFCMOCK") for sfc_id in state.sfc_ids)),
+        array("I", (_number(sfc.routing, "ROUTING") for sfc in sfcs)),
+        array("I", (len(sfc.states) for sfc in sfcs)),
+        b"".join(sfc.states for sfc in sfcs),
+    )
+
+def write_snapshot(path, generation, captured):
+    routing_numbers, routing_sizes, sfc_numbers, sfc_routings, sfc_sizes, states = captured
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, generation, len(routing_numbers), len(sfc_numbers)))
+        for arr in (routing_numbers, routing_sizes, sfc_numbers, sfc_routings, sfc_sizes):
+            arr.tofile(f)
+        f.write(states)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+def load_snapshot(path, state):
+    """Carica uno snapshot in uno stato vuoto; restituisce la generazione"""
+    with open(path, "rb") as f:
+        data = f.read()
+    magic, generation, n_routings, n_sfcs = SNAPSHOT_HEADER.unpack_from(data)
+    if magic != SNAPSHOT_MAGIC:
+        raise ValueError(f"{path}: not a mock-mes snapshot")
+    offset = SNAPSHOT_HEADER.size
+
+    def take(n):
+        nonlocal offset
+        arr = array("I")
+        arr.frombytes(data[offset:offset + n * arr.itemsize])
+        offset += n * arr.itemsize
+        return arr
+
+    routing_numbers, routing_sizes = take(n_routings), take(n_routings)
+    sfc_numbers, sfc_routings, sfc_sizes = take(n_sfcs), take(n_sfcs), take(n_sfcs)
+    for number, size in zip(routing_numbers, routing_sizes):
+        state.create_routing(size, f"ROUTING{number}")
+
+    def records():
+        nonlocal offset
+        states = memoryview(data)
+        for number, routing_number, size in zip(sfc_numbers, sfc_routings, sfc_sizes):
+            sfc = SFCRecord()
+            if routing_number:
+                routing_id = f"ROUTING{routing_number}"
+                sfc.restore(routing_id, state.routings[routing_id], states[offset:offset + size])
+            offset += size
+            yield f"SFCMOCK{number}", sfc
+
+    state.load_sfcs(records())
+    return generation
+
+
+# ---------------------------
+# Persistence
+# ---------------------------
+class Persistence:
+    """Ripristina lo stato da MES_DATA_DIR e ne registra le mutazioni"""
+
+    def __init__(self, state, data_dir, fsync_interval=DEFAULT_FSYNC_INTERVAL,
+                 snapshot_interval=DEFAULT_SNAPSHOT_INTERVAL, max_replay_failures=DEFAULT_MAX_REPLAY_FAILURES):
+        self.state = state
+        self.data_dir = data_dir
+        self.snapshot_path = os.path.join(data_dir, "snapshot.bin")
+        os.makedirs(data_dir, exist_ok=True)
+
+        start = time.perf_counter()
+        self.generation = 0
+        restored_snapshot = os.path.exists(self.snapshot_path)
+        if restored_snapshot:
+            self.generation = load_snapshot(self.snapshot_path, state)
+        segments = [g for g in _segments(data_dir) if g >= self.generation]
+        replayed, failed = 0, {}
+        for g in segments:
+            count, segment_failed = replay(_segment_path(data_dir, g), state)
+            replayed += count
+            for kind, n in segment_failed.items():
+                failed[kind] = failed.get(kind, 0) + n
+        self.replay_failures = sum(failed.values())
+        if failed:
+            log.warning("%d eventi su %d non riapplicati dal log in %s: %s", self.replay_failures, replayed,
+                        data_dir, ", ".join(f"{kind} {n}" for kind, n in sorted(failed.items())))
+            if self.replay_failures > max_replay_failures * replayed:
+                raise ReplayError(f"{self.replay_failures} of {replayed} logged events failed to replay "
+                                  f"(limit MES_REPLAY_MAX_FAILURES={max_replay_failures})")
+        state.sync_counters()
+        self.restored = restored_snapshot or replayed > 0
+        self.startup_seconds = time.perf_counter() - start
+        self.replayed = replayed
+
+        current = segments[-1] if segments else self.generation
+        self.log = EventLog(_segment_path(data_dir, current), state, fsync_interval, events=replayed)
+        self._segment = current
+        state.add_listener(self.log)
+
+        self._stop = threading.Event()
+        self._snapshot_lock = threading.Lock()
+        if snapshot_interval > 0:
+            threading.Thread(
+                target=self._run, args=(snapshot_interval,), name="mes-snapshot", daemon=True
+            ).start()
+
+    def _run(self, interval):
+        while not self._stop.wait(interval):
+            if self.log.events:
+                self.snapshot()
+
+    def snapshot(self):
+        """Snapshot consistente: stato congelato solo per copiarlo e ruotare il log"""
+        with self._snapshot_lock:
+            generation = self._segment + 1
+            with self.log.paused(), self.state.freeze():
+                self.log.rotate(_segment_path(self.data_dir, generation))
+                captured = capture_snapshot(self.state)
+            self._segment = generation
+            write_snapshot(self.snapshot_path, generation, captured)
+            self.generation = generation
+            for g in _segments(self.data_dir):
+                if g < generation:
+                    os.unlink(_segment_path(self.data_dir, g))
+
+    def close(self):
+        self._stop.set()
+        self.log.close()
+
+
+def open_persistence(state):
+    """Persistenza configurata da variabili d'ambiente, None se MES_DATA_DIR non è impostata"""
+    data_dir = os.environ.get("MES_DATA_DIR")
+    if not data_dir:
+        return None
+    return Persistence(
+        state,
+        data_dir,
+        fsync_interval=float(os.environ.get("MES_FSYNC_INTERVAL", DEFAULT_FSYNC_INTERVAL)),
+        snapshot_interval=float(os.environ.get("MES_SNAPSHOT_INTERVAL", DEFAULT_SNAPSHOT_INTERVAL)),
+        max_replay_failures=float(os.environ.get("MES_REPLAY_MAX_FAILURES", DEFAULT_MAX_REPLAY_FAILURES)),
+    )
+
+def bootstrap(state):
+    """Prepara lo stato all'avvio: ripristino da disco se disponibile, altrimenti dati
+    generati secondo il profilo delle variabili d'ambiente (vedi mes_generator).
+    I dati generati non passano dal log: se la persistenza è attiva si salva subito uno snapshot.
+    """
+    from mes_generator import ShopFloorProfile, generate
+    from mes_shard import shard_filter
+
+    persistence = open_persistence(state)
+    if persistence is None or not persistence.restored:
+        # Con MES_SHARD il processo è uno shard: tiene solo gli SFC che gli assegna l'hash ring
+        generate(state, ShopFloorProfile.from_env(), owns=shard_filter())
+        if persistence is not None:
+            persistence.snapshot()
+    if persistence is not None:
+        atexit.register(persistence.close)
+    return persistence
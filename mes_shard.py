@@ -0,0 +1,727 @@
+"""Sharding del mock MES: SFC partizionati su più processi o nodi, con un router davanti.
+
+    python mes_shard.py --shards 4                  # 4 shard e un router sulla porta PORT (default 80)
+    python mes_shard.py --shards 4 --routers 4      # 4 processi router sulla stessa porta (SO_REUSEPORT)
+    python mes_shard.py --shard-urls http://10.0.0.1:80,http://10.0.0.2:80   # solo router, shard già avviati
+
+Gli SFC (ID SFCMOCK<n>) sono assegnati agli shard con consistent hashing: HashRing mette
+VNODES punti per shard su un anello a 64 bit (blake2b) e lo SFC appartiene allo shard del
+primo punto che segue il suo hash. I routing sono replicati su tutti gli shard.
+
+Ogni shard è un normale server mock MES (mes_async.py, o mock-mes.py) avviato con
+MES_SHARD=<indice>/<numero di shard>: genera lo stesso dataset (serve lo stesso MES_SEED,
+che il launcher sceglie se manca) e tiene solo gli SFC che l'anello gli assegna. Con
+MES_DATA_DIR ogni shard salva lo stato in una propria sottodirectory (shard<i>).
+
+Il router è un server asyncio (il parsing HTTP è quello di mes_async) senza stato:
+- le chiamate per SFC (/sfc/<id>/...) vanno allo shard proprietario
+- i nuovi SFC e routing ricevono l'ID dal router (POST /sfc {"sfc_id"}, POST /routing
+  {"routing_id"} sugli shard); con K router il router i assegna i numeri i, i+K, i+2K...
+  a partire dal massimo esistente all'avvio, quindi gli ID non si ripetono ma possono avere buchi
+- /routing è inviato a tutti gli shard (ritentato con lo stesso ID su quelli falliti, 502 con
+  failed_shards se resta creato solo su alcuni), /routings a uno qualsiasi
+- verso gli shard si ripetono solo le GET: una POST su una connessione caduta potrebbe
+  essere già stata applicata
+- le API bulk sono divise per shard e i risultati riuniti nell'ordine della richiesta;
+  gli SFC di uno shard in errore o non raggiunto hanno come risultato il suo status
+- /sfcs, /routings/<id>/sfcs e i riepiloghi sono scatter-gather. Con limit/cursor le
+  pagine scorrono gli shard in ordine e il cursore codifica shard e posizione
+  (posizione * shard + indice): l'ordine degli SFC è per shard, non di creazione.
+  Le selezioni bulk per routing/sfc_state sono paginate allo stesso modo
+- /events, /simulation, /analytics, /history, /admin/faults e /debug/profile non passano dal router:
+  si usano sugli shard;
+  /metrics del router riporta solo le richieste servite dal router
+
+Il ribilanciamento (spostare SFC quando cambia il numero di shard) non è supportato.
+"""
+import argparse
+import asyncio
+import bisect
+import hashlib
+import itertools
+import logging
+import os
+import random
+import signal
+import subprocess
+import sys
+import time
+from urllib.parse import quote, urlencode, urlsplit
+
+import mes_json
+from mes_api import JSON, NDJSON, Reply, error_reply, json_reply, parse_page_args
+from mes_async import HTTPError, AsyncMESServer, Router
+from mes_core import MAX_BULK_ITEMS, ROUTING_ID, SFC_ID, MESState, PageError
+from mes_metrics import CONTENT_TYPE, Metrics
+
+# Punti sull'anello per shard: con 128 lo scarto tra shard resta nell'ordine del 10%
+VNODES = 128
+# Connessioni tenute aperte dal router verso ogni shard
+SHARD_CONNECTIONS = 64
+# Metodi ripetibili su una connessione caduta durante la richiesta
+IDEMPOTENT = ("GET", "HEAD")
+# Tentativi ripetuti sugli shard che non hanno creato un routing replicato
+ROUTING_RETRIES = 2
+# SFC più recenti letti da ogni shard all'avvio del router per trovare l'ultimo ID assegnato
+RECENT_IDS = 256
+
+log = logging.getLogger("mes_shard")
+
+
+# ---------------------------
+# Hash ring
+# ---------------------------
+def _point(key):
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """Consistent hashing degli ID sugli shard 0..shards-1.
+    Con un shard in più si sposta solo la quota di ID che finisce sui suoi punti (~1/N).
+    """
+
+    def __init__(self, shards, vnodes=VNODES):
+        if shards < 1:
+            raise ValueError("At least one shard is required")
+        self.shards = shards
+        points = sorted((_point(f"shard-{i}#{v}"), i) for i in range(shards) for v in range(vnodes))
+        self._points = [p for p, _ in points]
+        self._owners = [i for _, i in points]
+
+    def owner(self, key):
+        i = bisect.bisect(self._points, _point(key))
+        return self._owners[i if i < len(self._owners) else 0]
+
+
+def shard_filter(environ=os.environ):
+    """Filtro sugli ID per il generatore se il processo è uno shard (MES_SHARD=<i>/<n>), altrimenti None"""
+    spec = environ.get("MES_SHARD")
+    if not spec:
+        return None
+    try:
+        index, shards = (int(part) for part in spec.split("/"))
+    except ValueError:
+        raise ValueError(f"Invalid MES_SHARD: {spec!r} (expected <index>/<shards>)")
+    if not 0 <= index < shards:
+        raise ValueError(f"Invalid MES_SHARD: {spec!r}")
+    ring = HashRing(shards, int(environ.get("MES_SHARD_VNODES", VNODES)))
+    return lambda sfc_id: ring.owner(sfc_id) == index
+
+
+def id_number(item_id, prefix):
+    return int(item_id[len(prefix):])
+
+
+# ---------------------------
+# Client verso gli shard
+# ---------------------------
+class ShardError(Exception):
+    pass
+
+
+class ShardClient:
+    """Pool di connessioni HTTP/1.1 keep-alive verso uno shard, sul loop del router"""
+
+    def __init__(self, url, connections=SHARD_CONNECTIONS):
+        parsed = urlsplit(url)
+        self.url = url
+        self.host, self.port = parsed.hostname, parsed.port or 80
+        self._idle = []
+        self._slots = asyncio.Semaphore(connections)
+
+    async def request(self, method, target, body=b"", headers=None):
+        """(status, header in minuscolo, body). Le connessioni riusate già chiuse dallo shard
+        sono scartate prima dell'invio; se una connessione riusata cade durante la richiesta
+        non si sa se lo shard l'abbia ricevuta, quindi si ripetono solo GET e HEAD.
+        """
+        head = f"{method} {target} HTTP/1.1\r\nHost: {self.host}\r\nContent-Length: {len(body)}\r\n"
+        if body and not (headers and "Content-Type" in headers):
+            head += "Content-Type: application/json\r\n"
+        for name, value in (headers or {}).items():
+            head += f"{name}: {value}\r\n"
+        data = head.encode("latin-1") + b"\r\n" + body
+        async with self._slots:
+            while True:
+                reader, writer = self._connection()
+                reused = reader is not None
+                if not reused:
+                    reader, writer = await asyncio.open_connection(self.host, self.port)
+                try:
+                    writer.write(data)
+                    status, resp_headers, resp_body, keep_alive = await read_response(reader)
+                except (ConnectionError, asyncio.IncompleteReadError) as e:
+                    writer.close()
+                    if reused and method in IDEMPOTENT and not getattr(e, "partial", b""):
+                        continue
+                    raise ShardError(f"{self.url}: {e!r}")
+                if keep_alive:
+                    self._idle.append((reader, writer))
+                else:
+                    writer.close()
+                return status, resp_headers, resp_body
+
+    def _connection(self):
+        """Connessione keep-alive libera ancora aperta, (None, None) se non ce ne sono"""
+        while self._idle:
+            reader, writer = self._idle.pop()
+            if not reader.at_eof() and not writer.is_closing():
+                return reader, writer
+            writer.close()
+        return None, None
+
+    async def post(self, target, payload):
+        return await self.request("POST", target, mes_json.dumps(payload))
+
+    async def get_json(self, target):
+        status, _, body = await self.request("GET", target)
+        if status != 200:
+            raise ShardError(f"{self.url}{target}: status {status}")
+        return mes_json.loads(body)
+
+    def close(self):
+        for _, writer in self._idle:
+            writer.close()
+        self._idle.clear()
+
+
+async def read_response(reader):
+    """(status, header, body, keep-alive) di una risposta HTTP/1.x"""
+    head = await reader.readuntil(b"\r\n\r\n")
+    lines = head.decode("latin-1").split("\r\n")
+    version, status = lines[0].split(" ", 2)[:2]
+    status = int(status)
+    headers = {}
+    for line in lines[1:]:
+        if line:
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+    connection = headers.get("connection", "").lower()
+    keep_alive = connection == "keep-alive" if version == "HTTP/1.0" else connection != "close"
+    if status in (204, 304) or status < 200:
+        body = b""
+    elif "chunked" in headers.get("transfer-encoding", "").lower():
+        parts = []
+        while True:
+            length = int((await reader.readline()).split(b";")[0], 16)
+            if length == 0:
+                while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    pass
+                break
+            parts.append(await reader.readexactly(length))
+            await reader.readexactly(2)
+        body = b"".join(parts)
+    elif "content-length" in headers:
+        body = await reader.readexactly(int(headers["content-length"]))
+    else:
+        body = await reader.read()
+        keep_alive = False
+    return status, headers, body, keep_alive
+
+
+def shard_reply(status, headers, body):
+    """Risposta di uno shard inoltrata al client così com'è"""
+    extra = {"ETag": headers["etag"]} if "etag" in headers else None
+    return Reply(status, body=body, content_type=headers.get("content-type", JSON), headers=extra)
+
+def shard_error(reply):
+    """(status, errore) di una risposta di errore di uno shard o di un'eccezione di rete"""
+    if isinstance(reply, Exception):
+        return 502, "Shard unavailable"
+    status, _, body = reply
+    try:
+        error = mes_json.loads(body).get("error")
+    except (ValueError, AttributeError):
+        error = None
+    return status, error or f"Shard error (status {status})"
+
+def merge_objects(bodies):
+    """Unisce oggetti JSON serializzati ({...}) senza rileggerli: le chiavi (ID) sono disgiunte"""
+    inner = [body.strip()[1:-1] for body in bodies]
+    return b"{" + b",".join(part for part in inner if part) + b"}\n"
+
+
+# ---------------------------
+# Router
+# ---------------------------
+class ShardRouter(AsyncMESServer):
+    """Router HTTP davanti agli shard. Del server asyncio usa connessioni, parsing e
+    rendering delle risposte; gli handler sono coroutine che interrogano gli shard.
+    """
+
+    def __init__(self, shard_urls, index=0, routers=1, vnodes=VNODES):
+        # Niente stato locale: AsyncMESServer.__init__ creerebbe MESApi e feed
+        self.shard_urls = list(shard_urls)
+        self.ring = HashRing(len(self.shard_urls), vnodes)
+        self.index = index
+        self.routers = routers
+        self.shards = []
+        self.metrics = Metrics()
+        self.router = self.build_routes()
+        self.connections = 0
+        self.streams = 0
+        self._loop = None
+        self._loop_thread = None
+        self._sfc_numbers = self._routing_numbers = None
+        self._round_robin = itertools.count()
+
+    async def start(self, host="0.0.0.0", port=80, **kwargs):
+        self.shards = [ShardClient(url) for url in self.shard_urls]
+        await self.init_counters()
+        return await super().start(host, port, **kwargs)
+
+    async def init_counters(self):
+        """Prossimi ID: dopo il massimo tra gli SFC più recenti di ogni shard e tra i routing"""
+        last_sfc = 0
+        for shard in self.shards:
+            total = (await shard.get_json("/sfcs/summary"))["total"]
+            if total:
+                cursor = max(0, total - RECENT_IDS)
+                page = await shard.get_json(f"/sfcs?fields=sfc_state&limit={RECENT_IDS}&cursor={cursor}")
+                numbers = [id_number(i, "SFCMOCK") for i in page["sfcs"] if SFC_ID.fullmatch(i)]
+                last_sfc = max([last_sfc] + numbers)
+        routings = await self.shards[0].get_json("/routings?view=compact")
+        last_routing = max([0] + [id_number(r, "ROUTING") for r in routings if ROUTING_ID.fullmatch(r)])
+        self._sfc_numbers = itertools.count(last_sfc + 1 + self.index, self.routers)
+        self._routing_numbers = itertools.count(last_routing + 1 + self.index, self.routers)
+
+    def build_routes(self):
+        router = Router()
+        add = router.add
+        add("POST", "/sfc", self.create_sfc)
+        add("POST", "/routing", self.create_routing)
+        for action in ("assign_routing", "advance", "rollback", "force_advance", "rollback_single", "complete"):
+            add("POST", f"/sfc/<sfc_id>/{action}", self.per_sfc)
+        add("GET", "/sfc/<sfc_id>", self.per_sfc)
+        add("GET", "/sfc/<sfc_id>/routing_state", self.per_sfc)
+        add("GET", "/sfc/<sfc_id>/history", self.per_sfc)
+        add("POST", "/bulk/sfc", self.bulk_create)
+        add("POST", "/bulk/assign_routing", self.bulk_assign_routing)
+        add("POST", "/bulk/<action>", self.bulk_transition)
+        add("GET", "/sfcs", self.list_sfcs)
+        add("GET", "/routings/<routing_id>/sfcs", self.list_sfcs)
+        add("GET", "/sfcs/summary", self.summary)
+        add("GET", "/routings/<routing_id>/summary", self.summary)
+        add("GET", "/routings", self.any_shard)
+        add("GET", "/shards", self.shard_status)
+        add("GET", "/metrics", self.render_metrics)
+        for method, rule in (("GET", "/events"), ("GET", "/simulation"), ("POST", "/simulation/start"),
+                             ("POST", "/simulation/stop"), ("POST", "/simulation/speed"), ("GET", "/debug/profile"),
+                             ("GET", "/analytics"), ("GET", "/analytics/routings/<routing_id>"), ("GET", "/history"),
+                             ("GET", "/admin/faults"), ("POST", "/admin/faults")):
+            add(method, rule, self.unsupported)
+        return router
+
+    async def respond(self, request, reader, writer):
+        start = time.perf_counter()
+        rule, handler, params = self.router.match(request.method, request.path)
+        if handler is None:
+            reply = error_reply("Method not allowed", 405) if rule else error_reply("Not found", 404)
+        else:
+            try:
+                reply = await handler(request, **params)
+            except HTTPError as e:
+                reply = error_reply(str(e), e.status)
+            except (OSError, ShardError) as e:
+                log.warning("Shard non raggiungibile in %s %s: %s", request.method, request.path, e)
+                reply = error_reply("Shard unavailable", 502)
+            except Exception:
+                log.exception("Errore in %s %s", request.method, request.path)
+                reply = error_reply("Internal server error", 500)
+        body = reply.content()
+        writer.write(self.render(reply, request.keep_alive, body))
+        await writer.drain()
+        route = rule if params is not None else "<unmatched>"
+        self.metrics.observe(request.method, route, reply.status, time.perf_counter() - start, len(body))
+        return request.keep_alive
+
+    # ---------------------------
+    # Inoltro
+    # ---------------------------
+    def owner(self, sfc_id):
+        return self.shards[self.ring.owner(str(sfc_id))]
+
+    async def forward(self, shard, request):
+        """La richiesta del client, invariata, a uno shard"""
+        target = quote(request.path) + (f"?{request.query}" if request.query else "")
+        headers = {}
+        if "if-none-match" in request.headers:
+            headers["If-None-Match"] = request.headers["if-none-match"]
+        if "content-type" in request.headers:
+            headers["Content-Type"] = request.headers["content-type"]
+        status, resp_headers, body = await shard.request(request.method, target, request.body, headers)
+        return shard_reply(status, resp_headers, body)
+
+    async def gather(self, method, target, payload=None):
+        """La stessa richiesta a tutti gli shard: [(status, header, body)]"""
+        body = mes_json.dumps(payload) if payload is not None else b""
+        return await asyncio.gather(*(shard.request(method, target, body) for shard in self.shards))
+
+    async def per_sfc(self, request, sfc_id):
+        return await self.forward(self.owner(sfc_id), request)
+
+    async def any_shard(self, request):
+        """Dati replicati (routing): uno shard a rotazione"""
+        return await self.forward(self.shards[next(self._round_robin) % len(self.shards)], request)
+
+    async def unsupported(self, request):
+        return error_reply("Not supported by the shard router: use the shards directly", 501)
+
+    async def shard_status(self, request):
+        return json_reply({"shards": self.shard_urls, "router": self.index, "routers": self.routers})
+
+    async def render_metrics(self, request):
+        return Reply(body=self.metrics.render().encode(), content_type=CONTENT_TYPE)
+
+    # ---------------------------
+    # Creazione
+    # ---------------------------
+    async def create_sfc(self, request):
+        data = request.data()
+        sfc_id = data["sfc_id"] if "sfc_id" in data else f"SFCMOCK{next(self._sfc_numbers)}"
+        return shard_reply(*await self.owner(sfc_id).post("/sfc", {"sfc_id": sfc_id}))
+
+    async def create_routing(self, request):
+        data = request.json()
+        if not isinstance(data, dict):
+            return await self.forward(self.shards[0], request)
+        # Numero di operazioni scelto qui: ogni shard deve creare lo stesso routing
+        payload = dict(data, operations=data.get("operations", random.randint(1, 15)))
+        routing_id = payload.setdefault("routing_id", f"ROUTING{next(self._routing_numbers)}")
+        replies = await self.post_all("/routing", payload, range(len(self.shards)))
+        created = [i for i, reply in enumerate(replies) if not isinstance(reply, Exception) and reply[0] == 200]
+        if not created:
+            # Errore di validazione (uguale su ogni shard) o shard tutti irraggiungibili
+            first = replies[0]
+            if isinstance(first, Exception):
+                raise first
+            return shard_reply(*first)
+        # Shard non raggiunti o in errore: si ripete con lo stesso ID. 409 = creato dal tentativo
+        # precedente (la richiesta era arrivata, la risposta no)
+        failed = [i for i, reply in enumerate(replies) if i not in created]
+        for _ in range(ROUTING_RETRIES):
+            retry = [i for i in failed if isinstance(replies[i], Exception) or replies[i][0] >= 500]
+            if not retry:
+                break
+            for i, reply in zip(retry, await self.post_all("/routing", payload, retry)):
+                replies[i] = reply
+                if not isinstance(reply, Exception) and reply[0] in (200, 409):
+                    failed.remove(i)
+        if failed:
+            log.warning("Routing %s non creato sugli shard %s", routing_id, [self.shard_urls[i] for i in failed])
+            return json_reply({"error": "Routing created on some shards only", "routing_id": routing_id,
+                               "failed_shards": [self.shard_urls[i] for i in failed]}, 502)
+        return shard_reply(*replies[created[0]])
+
+    async def post_all(self, target, payload, indices):
+        """POST agli shard indicati: [(status, header, body) o eccezione di rete]"""
+        body = mes_json.dumps(payload)
+        replies = await asyncio.gather(*(self.shards[i].request("POST", target, body) for i in indices),
+                                       return_exceptions=True)
+        for reply in replies:
+            if isinstance(reply, BaseException) and not isinstance(reply, (OSError, ShardError)):
+                raise reply
+        return replies
+
+    # ---------------------------
+    # Bulk
+    # ---------------------------
+    async def scatter(self, target, items, sfc_id_of, payload_for):
+        """Divide items per shard proprietario, una richiesta per shard in parallelo,
+        e riunisce i risultati nell'ordine di items (come la risposta di un solo server).
+        Gli elementi di uno shard in errore o non raggiunto hanno come risultato lo status
+        e l'errore dello shard; se nessuno shard risponde 200 (es. errore di validazione,
+        uguale su ogni shard) si restituisce la prima risposta
+        """
+        groups = {}
+        for i, item in enumerate(items):
+            groups.setdefault(self.ring.owner(str(sfc_id_of(item))), []).append(i)
+        shards = list(groups)
+        replies = await asyncio.gather(*(
+            self.shards[s].post(target, payload_for([items[i] for i in groups[s]])) for s in shards
+        ), return_exceptions=True)
+        for reply in replies:
+            if isinstance(reply, BaseException) and not isinstance(reply, (OSError, ShardError)):
+                raise reply
+        if all(isinstance(reply, Exception) or reply[0] != 200 for reply in replies):
+            first = replies[0]
+            if isinstance(first, Exception):
+                raise first
+            return shard_reply(*first)
+        results = [None] * len(items)
+        for s, reply in zip(shards, replies):
+            if isinstance(reply, Exception) or reply[0] != 200:
+                status, error = shard_error(reply)
+                log.warning("Shard %s in errore in POST %s: %s %s", self.shard_urls[s], target, status, error)
+                for i in groups[s]:
+                    results[i] = {"sfc_id": sfc_id_of(items[i]), "status": status, "error": error}
+                continue
+            for i, result in zip(groups[s], mes_json.loads(reply[2])["results"]):
+                results[i] = result
+        ok = sum(1 for r in results if r["status"] == 200)
+        return json_reply({"results": results, "ok": ok, "failed": len(results) - ok})
+
+    async def bulk_create(self, request):
+        data = request.data()
+        sfc_ids = data.get("sfc_ids")
+        if sfc_ids is None:
+            count = data.get("count")
+            if not isinstance(count, int) or not 1 <= count <= MAX_BULK_ITEMS:
+                return await self.forward(self.shards[0], request)     # stesso errore di un solo server
+            sfc_ids = [f"SFCMOCK{next(self._sfc_numbers)}" for _ in range(count)]
+        elif not isinstance(sfc_ids, list) or not sfc_ids or len(sfc_ids) > MAX_BULK_ITEMS:
+            return await self.forward(self.shards[0], request)
+        routing_id = data.get("routing_id")
+        return await self.scatter("/bulk/sfc", sfc_ids, str,
+                                  lambda group: {"sfc_ids": group, "routing_id": routing_id})
+
+    async def bulk_assign_routing(self, request):
+        data = request.data()
+        sfc_ids = data.get("sfc_ids")
+        if not isinstance(sfc_ids, list) or len(sfc_ids) > MAX_BULK_ITEMS:
+            return await self.forward(self.shards[0], request)
+        return await self.scatter("/bulk/assign_routing", sfc_ids, str, lambda group: dict(data, sfc_ids=group))
+
+    async def bulk_transition(self, request, action):
+        data = request.data()
+        target = f"/bulk/{quote(action)}"
+        if action not in MESState.BULK_TRANSITIONS:
+            return await self.forward(self.shards[0], request)
+        if "items" in data:
+            items = data["items"]
+            if not isinstance(items, list) or not all(isinstance(item, dict) for item in items) \
+                    or len(items) > MAX_BULK_ITEMS:
+                return await self.forward(self.shards[0], request)
+            return await self.scatter(target, items, lambda item: item.get("sfc_id"),
+                                      lambda group: dict(data, items=group))
+        if "sfc_ids" in data or not (data.get("routing") or data.get("sfc_state")):
+            sfc_ids = data.get("sfc_ids")
+            if not isinstance(sfc_ids, list) or len(sfc_ids) > MAX_BULK_ITEMS:
+                return await self.forward(self.shards[0], request)
+            return await self.scatter(target, sfc_ids, str, lambda group: dict(data, sfc_ids=group))
+        try:
+            limit, cursor = parse_page_args(data)
+        except (PageError, TypeError):
+            limit = cursor = None
+        if cursor is None or cursor < 0 or (limit is not None and limit > MAX_BULK_ITEMS):
+            return await self.forward(self.shards[0], request)         # stesso errore di un solo server
+        # Selezione a pagine come /sfcs: si scorrono gli shard in ordine fino a limit SFC,
+        # cursore = posizione nello shard * N + shard
+        limit = limit or MAX_BULK_ITEMS
+        n = len(self.shards)
+        shard, pos = cursor % n, cursor // n
+        results, next_cursor = [], None
+        while True:
+            status, headers, body = await self.shards[shard].post(
+                target, dict(data, cursor=pos, limit=limit - len(results)))
+            if status != 200:
+                return shard_reply(status, headers, body)
+            page = mes_json.loads(body)
+            results += page["results"]
+            if page["next_cursor"] is not None:
+                next_cursor = str(int(page["next_cursor"]) * n + shard)
+                break
+            shard, pos = shard + 1, 0
+            if shard == n:
+                break
+            if len(results) == limit:
+                next_cursor = str(shard)
+                break
+        ok = sum(1 for r in results if r["status"] == 200)
+        return json_reply({"results": results, "ok": ok, "failed": len(results) - ok, "next_cursor": next_cursor})
+
+    # ---------------------------
+    # Elenchi e riepiloghi (scatter-gather)
+    # ---------------------------
+    async def list_sfcs(self, request, routing_id=None):
+        args = request.args
+        try:
+            limit, cursor = parse_page_args(args)
+        except PageError as e:
+            return error_reply(str(e))
+        path = "/sfcs" if routing_id is None else f"/routings/{quote(routing_id)}/sfcs"
+        ndjson = args.get("format") == "ndjson"
+        if limit is None and "cursor" not in args:
+            replies = await self.gather("GET", f"{path}?{request.query}" if request.query else path)
+            for status, headers, body in replies:
+                if status != 200:
+                    return shard_reply(status, headers, body)
+            bodies = [body for _, _, body in replies]
+            if ndjson:
+                return Reply(body=b"".join(bodies), content_type=NDJSON)
+            return Reply(body=merge_objects(bodies))
+
+        # Pagina: si scorrono gli shard in ordine; cursore = posizione nello shard * N + shard
+        n = len(self.shards)
+        shard, pos = cursor % n, cursor // n
+        query = {k: v for k, v in args.items() if k not in ("limit", "cursor", "format")}
+        sfcs, next_cursor = {}, None
+        while True:
+            page_args = dict(query, cursor=pos)
+            if limit is not None:
+                page_args["limit"] = limit - len(sfcs)
+            page_query = urlencode(page_args)
+            status, headers, body = await self.shards[shard].request("GET", f"{path}?{page_query}")
+            if status != 200:
+                return shard_reply(status, headers, body)
+            page = mes_json.loads(body)
+            sfcs.update(page["sfcs"])
+            if page["next_cursor"] is not None:
+                next_cursor = str(int(page["next_cursor"]) * n + shard)
+                break
+            shard, pos = shard + 1, 0
+            if shard == n:
+                break
+            if limit is not None and len(sfcs) == limit:
+                next_cursor = str(shard)
+                break
+        if ndjson:
+            dumps = mes_json.dumps
+            lines = [dumps({"sfc_id": sfc_id, **view}) + b"\n" for sfc_id, view in sfcs.items()]
+            if limit is not None:
+                lines.append(dumps({"next_cursor": next_cursor}) + b"\n")
+            return Reply(body=b"".join(lines), content_type=NDJSON)
+        return json_reply({"sfcs": sfcs, "next_cursor": next_cursor})
+
+    async def summary(self, request, routing_id=None):
+        path = "/sfcs/summary" if routing_id is None else f"/routings/{quote(routing_id)}/summary"
+        replies = await self.gather("GET", f"{path}?{request.query}" if request.query else path)
+        for status, headers, body in replies:
+            if status != 200:
+                return shard_reply(status, headers, body)
+        merged = None
+        for _, _, body in replies:
+            part = mes_json.loads(body)
+            if merged is None:
+                merged = part
+                continue
+            merged["total"] += part["total"]
+            for key in ("by_state", "by_routing"):
+                for name, count in part.get(key, {}).items():
+                    merged[key][name] = merged[key].get(name, 0) + count
+        return json_reply(merged)
+
+
+# ---------------------------
+# Avvio
+# ---------------------------
+# Server usati come shard (cwd = directory del progetto, porta da PORT)
+SHARD_SERVERS = {
+    "async": [sys.executable, "mes_async.py"],
+    "flask": [sys.executable, "mock-mes.py"],
+}
+
+def parse_cpus(spec):
+    """"0-3,6" -> [0, 1, 2, 3, 6]"""
+    cpus = []
+    for part in spec.split(","):
+        first, _, last = part.partition("-")
+        cpus += range(int(first), int(last or first) + 1)
+    return cpus
+
+def wait_ready(url, proc, timeout=300):
+    """Attende che lo shard risponda (o termini)"""
+    parsed = urlsplit(url)
+    deadline = time.monotonic() + timeout
+
+    async def probe():
+        reader, writer = await asyncio.open_connection(parsed.hostname, parsed.port)
+        writer.write(b"GET /routings?limit=1 HTTP/1.1\r\nHost: shard\r\nConnection: close\r\n\r\n")
+        status = (await read_response(reader))[0]
+        writer.close()
+        return status
+
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"lo shard {url} è terminato con codice {proc.returncode}")
+        try:
+            if asyncio.run(probe()) == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"lo shard {url} non risponde")
+
+def start_shards(count, base_port, server="async", cpus=None):
+    """Avvia count shard sulle porte base_port.. e restituisce (URL, processi)"""
+    env = dict(os.environ)
+    if not env.get("MES_SEED"):
+        # Stesso dataset su tutti gli shard: ciascuno ne tiene la propria parte
+        env["MES_SEED"] = str(random.randrange(2 ** 32))
+        log.info("MES_SEED=%s", env["MES_SEED"])
+    root = os.path.dirname(os.path.abspath(__file__))
+    urls, procs = [], []
+    for i in range(count):
+        shard_env = dict(env, PORT=str(base_port + i), MES_SHARD=f"{i}/{count}")
+        if env.get("MES_DATA_DIR"):
+            shard_env["MES_DATA_DIR"] = os.path.join(env["MES_DATA_DIR"], f"shard{i}")
+        cpu = {cpus[i % len(cpus)]} if cpus else None
+        preexec = (lambda cpu=cpu: os.sched_setaffinity(0, cpu)) if cpu else None
+        procs.append(subprocess.Popen(SHARD_SERVERS[server], cwd=root, env=shard_env, preexec_fn=preexec))
+        urls.append(f"http://127.0.0.1:{base_port + i}")
+    try:
+        for url, proc in zip(urls, procs):
+            wait_ready(url, proc)
+    except BaseException:
+        stop_processes(procs)
+        raise
+    return urls, procs
+
+def stop_processes(procs):
+    """Termina i processi in ordine inverso di avvio: i router prima degli shard"""
+    for proc in reversed(procs):
+        if proc.poll() is None:
+            proc.terminate()
+        proc.wait()
+
+async def serve_router(shard_urls, port, index=0, routers=1):
+    server = ShardRouter(shard_urls, index, routers)
+    listener = await server.start("0.0.0.0", port, backlog=4096, reuse_port=routers > 1)
+    stop = asyncio.Event()
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop.set)
+    try:
+        async with listener:
+            await stop.wait()
+    finally:
+        for shard in server.shards:
+            shard.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--shards", type=int, default=2, help="shard da avviare in locale")
+    parser.add_argument("--shard-urls", help="shard già avviati (URL separati da virgola, in ordine di indice)")
+    parser.add_argument("--routers", type=int, default=1, help="processi router sulla stessa porta")
+    parser.add_argument("--router-index", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--base-port", type=int, default=int(os.environ.get("MES_SHARD_BASE_PORT", 8100)),
+                        help="porta del primo shard locale")
+    parser.add_argument("--server", default="async", choices=sorted(SHARD_SERVERS), help="server degli shard")
+    parser.add_argument("--cpus", help="core a cui vincolare gli shard, a rotazione (es. 0-3)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+    port = int(os.environ.get("PORT", 80))
+
+    if args.router_index is not None:
+        # Processo router avviato dal launcher
+        asyncio.run(serve_router(args.shard_urls.split(","), port, args.router_index, args.routers))
+        return
+
+    procs = []
+    try:
+        if args.shard_urls:
+            urls = args.shard_urls.split(",")
+        else:
+            urls, procs = start_shards(args.shards, args.base_port, args.server,
+                                       parse_cpus(args.cpus) if args.cpus else None)
+        for i in range(1, args.routers):
+            procs.append(subprocess.Popen([sys.executable, os.path.abspath(__file__), "--shard-urls", ",".join(urls),
+                                           "--routers", str(args.routers), "--router-index", str(i)]))
+        log.info("%d shard, %d router sulla porta %d", len(urls), args.routers, port)
+        asyncio.run(serve_router(urls, port, 0, args.routers))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop_processes(procs)
+
+
+if __name__ == "__main__":
+    main()
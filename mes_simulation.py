@@ -0,0 +1,373 @@
+"""Motore di simulazione della produzione: avanza da solo gli SFC in lavorazione.
+
+Ogni SFC in work ha una scadenza (tempo simulato) estratta dalla distribuzione del
+tempo ciclo della sua operazione corrente; un thread dedicato estrae dallo heap le
+scadenze raggiunte e applica la transizione con le stesse funzioni degli endpoint:
+- advance, nella maggior parte dei casi
+- rollback a uno step precedente con probabilità rollback_rate (come /rollback)
+- bypass dell'operazione corrente con probabilità bypass_rate (force_advance allo
+  step successivo, come /force_advance)
+Il costo è proporzionale alle scadenze raggiunte, non al numero di SFC: non c'è
+nessuna scansione periodica di state.sfcs.
+
+Il motore è un listener di MESState: ogni mutazione di uno SFC (della simulazione o
+dei client) lo rimette in coda con una nuova scadenza secondo il suo nuovo stato.
+Le voci dello heap portano la versione dello SFC: quelle superate da una mutazione
+successiva vengono scartate quando scadono.
+
+Configurazione (all'avvio con MES_SIM=1, oppure da POST /simulation/start):
+- MES_SIM_SPEED / speed: secondi simulati per secondo reale (default 1)
+- MES_SIM_CYCLE_TIME / cycle_time: tempi ciclo in secondi simulati, una distribuzione
+  ("exp:60") oppure regole separate da ";" per operazione e routing:
+  "default=exp:60;3=uniform:10-60;ROUTING2:1=const:5" (id operazione da 1)
+  Distribuzioni: const:S (o solo S), uniform:A-B, exp:MEDIA, normal:MEDIA,DEV,
+  lognormal:MEDIANA,SIGMA, triangular:MIN,MODA,MAX
+- MES_SIM_ROLLBACK_RATE / rollback_rate, MES_SIM_BYPASS_RATE / bypass_rate (default 0)
+- MES_SIM_ARRIVAL_RATE / arrival_rate: nuovi SFC al secondo simulato, con un routing
+  casuale (default 0)
+- MES_SIM_SEED / seed: seed delle estrazioni (default casuale)
+"""
+from collections import deque
+import heapq
+import itertools
+import math
+import os
+import random
+import threading
+import time
+
+# Scadenze elaborate prima di ricontrollare comandi e nuovi SFC
+BATCH = 1000
+# Attesa massima del thread tra due controlli (secondi reali)
+MAX_SLEEP = 0.05
+MAX_SPEED = 1_000_000
+
+
+# ---------------------------
+# Tempi ciclo
+# ---------------------------
+class CycleTime:
+    """Distribuzione del tempo ciclo di un'operazione (secondi simulati)"""
+    __slots__ = ("spec", "_sample")
+
+    def __init__(self, spec):
+        self.spec = spec
+        kind, sep, args = spec.partition(":")
+        if not sep:
+            kind, args = "const", spec
+        try:
+            if kind == "uniform":
+                low, high = (float(v) for v in args.split("-"))
+                valid = 0 <= low <= high
+                self._sample = lambda rng: rng.uniform(low, high)
+            else:
+                values = [float(v) for v in args.split(",")]
+                if kind == "const" and len(values) == 1:
+                    value = values[0]
+                    self._sample = lambda rng: value
+                elif kind == "exp" and len(values) == 1:
+                    rate = 1 / values[0] if values[0] > 0 else math.inf
+                    self._sample = lambda rng: rng.expovariate(rate) if rate != math.inf else 0.0
+                elif kind == "normal" and len(values) == 2:
+                    mean, dev = values
+                    self._sample = lambda rng: max(0.0, rng.gauss(mean, dev))
+                elif kind == "lognormal" and len(values) == 2 and values[0] > 0:
+                    mu, sigma = math.log(values[0]), values[1]
+                    self._sample = lambda rng: rng.lognormvariate(mu, sigma)
+                elif kind == "triangular" and len(values) == 3 and values[0] <= values[1] <= values[2]:
+                    low, mode, high = values
+                    self._sample = lambda rng: rng.triangular(low, high, mode)
+                else:
+                    raise ValueError
+                valid = all(v >= 0 for v in values)
+        except ValueError:
+            valid = False
+        if not valid:
+            raise ValueError(f"Invalid cycle time: {spec!r}")
+
+    def sample(self, rng):
+        return self._sample(rng)
+
+
+def parse_cycle_times(spec):
+    """'exp:60' oppure 'default=exp:60;3=uniform:10-60;ROUTING2:1=const:5'
+    -> {None: default, id operazione: ..., (routing, id operazione): ...}
+    """
+    rules = {}
+    for part in spec.split(";"):
+        part = part.strip()
+        if not part:
+            continue
+        key, sep, value = part.rpartition("=")
+        if not sep or key.strip() == "default":
+            rules[None] = CycleTime(value.strip())
+            continue
+        routing, _, op = key.strip().rpartition(":")
+        try:
+            op = int(op)
+        except ValueError:
+            raise ValueError(f"Invalid cycle time rule: {part!r}")
+        rules[(routing, op) if routing else op] = CycleTime(value.strip())
+    if None not in rules:
+        raise ValueError(f"Missing default cycle time: {spec!r}")
+    return rules
+
+
+class SimulationSettings:
+    """Parametri della simulazione; i campi hanno gli stessi nomi delle chiavi JSON di /simulation/start"""
+    FIELDS = ("speed", "cycle_time", "rollback_rate", "bypass_rate", "arrival_rate", "seed")
+
+    def __init__(self, speed=1.0, cycle_time="exp:60", rollback_rate=0.0, bypass_rate=0.0,
+                 arrival_rate=0.0, seed=None):
+        self.speed = check_speed(speed)
+        if not isinstance(cycle_time, str):
+            raise ValueError("Invalid cycle time")
+        self.cycle_time = cycle_time
+        self.cycle_rules = parse_cycle_times(cycle_time)
+        for name, rate in (("rollback rate", rollback_rate), ("bypass rate", bypass_rate)):
+            if not is_number(rate) or not 0 <= rate <= 1:
+                raise ValueError(f"Invalid {name}")
+        if rollback_rate + bypass_rate > 1:
+            raise ValueError("Rollback rate + bypass rate must not exceed 1")
+        self.rollback_rate = rollback_rate
+        self.bypass_rate = bypass_rate
+        if not is_number(arrival_rate) or arrival_rate < 0:
+            raise ValueError("Invalid arrival rate")
+        self.arrival_rate = arrival_rate
+        if seed is not None and not isinstance(seed, int):
+            raise ValueError("Invalid seed")
+        self.seed = seed
+
+    @classmethod
+    def from_env(cls, environ=os.environ):
+        seed = environ.get("MES_SIM_SEED")
+        return cls(
+            speed=float(environ.get("MES_SIM_SPEED", 1)),
+            cycle_time=environ.get("MES_SIM_CYCLE_TIME", "exp:60"),
+            rollback_rate=float(environ.get("MES_SIM_ROLLBACK_RATE", 0)),
+            bypass_rate=float(environ.get("MES_SIM_BYPASS_RATE", 0)),
+            arrival_rate=float(environ.get("MES_SIM_ARRIVAL_RATE", 0)),
+            seed=int(seed) if seed else None,
+        )
+
+    def replace(self, changes):
+        """Nuove impostazioni con i campi di changes (dict dal body JSON); ValueError se non validi"""
+        unknown = set(changes) - set(self.FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown settings: {', '.join(sorted(unknown))}")
+        values = {name: getattr(self, name) for name in self.FIELDS}
+        values.update(changes)
+        return SimulationSettings(**values)
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.FIELDS}
+
+    def cycle_time_for(self, routing, op_id):
+        rules = self.cycle_rules
+        return rules.get((routing, op_id)) or rules.get(op_id) or rules[None]
+
+
+def is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+def check_speed(speed):
+    if not is_number(speed) or not 0 < speed <= MAX_SPEED:
+        raise ValueError("Invalid speed")
+    return float(speed)
+
+def simulation_enabled(environ=os.environ):
+    return environ.get("MES_SIM") == "1"
+
+
+# ---------------------------
+# Motore
+# ---------------------------
+class Simulation:
+    """Scheduler delle transizioni simulate su uno MESState (vive nel processo dello stato)"""
+
+    def __init__(self, state, settings=None):
+        self.state = state
+        self.settings = settings or SimulationSettings()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._running = False
+        self._heap = []                 # (scadenza simulata, seq, SFC ID, versione dello SFC)
+        self._seq = itertools.count()
+        self._pending = deque()         # SFC mutati da rimettere in coda (dal listener)
+        self._rng = random.Random()
+        self._cycle_cache = {}          # (routing, indice operazione) -> CycleTime
+        self._sim_base = 0.0            # tempo simulato al cambio di velocità più recente
+        self._wall_base = 0.0
+        self._next_arrival = math.inf
+        self.counters = dict.fromkeys(("advanced", "completed", "rolled_back", "bypassed", "created", "stale"), 0)
+        state.add_listener(self)
+
+    # ---------------------------
+    # Listener di MESState (sotto il lock dello SFC: solo un append)
+    # ---------------------------
+    def __call__(self, event):
+        if self._running and event.sfc_id is not None:
+            self._pending.append(event.sfc_id)
+
+    # ---------------------------
+    # Comandi: restituiscono (body, status) come le transizioni di MESState
+    # ---------------------------
+    def start(self, changes=None):
+        """Avvia la simulazione, con le impostazioni correnti modificate da changes"""
+        with self._lock:
+            if self._running:
+                return {"error": "Simulation already running"}, 409
+            try:
+                settings = self.settings.replace(changes or {})
+            except ValueError as e:
+                return {"error": str(e)}, 400
+            self.settings = settings
+            self._rng = random.Random(settings.seed)
+            self._cycle_cache = {}
+            self._heap = []
+            self.counters = dict.fromkeys(self.counters, 0)
+            self._sim_base, self._wall_base = 0.0, time.monotonic()
+            self._next_arrival = self._arrival_gap()
+            self._running = True
+            # Unica scansione: gli SFC già in lavorazione; da qui in poi arrivano dal listener
+            self._pending.extend(list(self.state.sfcs_by_state["In Work"]))
+            self._thread = threading.Thread(target=self._run, name="mes-simulation", daemon=True)
+            self._thread.start()
+            return self._status(), 200
+
+    def stop(self):
+        with self._lock:
+            self._sim_base = self._now()
+            thread, self._running = self._thread, False
+            self._thread = None
+        self._wakeup.set()
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+        with self._lock:
+            self._heap = []
+            self._pending.clear()
+            return self._status(), 200
+
+    def set_speed(self, speed):
+        try:
+            speed = check_speed(speed)
+        except ValueError as e:
+            return {"error": str(e)}, 400
+        with self._lock:
+            self._sim_base, self._wall_base = self._now(), time.monotonic()
+            self.settings.speed = speed
+        self._wakeup.set()
+        with self._lock:
+            return self._status(), 200
+
+    def status(self):
+        with self._lock:
+            return self._status(), 200
+
+    def _status(self):
+        now = self._now()
+        heap = self._heap
+        return {
+            "running": self._running,
+            "sim_time": round(now, 3),
+            "scheduled": len(heap),
+            "lag": round(max(0.0, now - heap[0][0]), 3) if heap and self._running else 0.0,
+            "settings": self.settings.as_dict(),
+            "counters": dict(self.counters),
+        }
+
+    # ---------------------------
+    # Tempo simulato
+    # ---------------------------
+    def _now(self):
+        if not self._running:
+            return self._sim_base
+        return self._sim_base + (time.monotonic() - self._wall_base) * self.settings.speed
+
+    def _arrival_gap(self):
+        rate = self.settings.arrival_rate
+        return self._rng.expovariate(rate) if rate > 0 else math.inf
+
+    def _cycle_time(self, routing, template, index):
+        key = (routing, index)
+        cycle = self._cycle_cache.get(key)
+        if cycle is None:
+            cycle = self._cycle_cache[key] = self.settings.cycle_time_for(routing, template.ids[index])
+        return cycle.sample(self._rng)
+
+    # ---------------------------
+    # Thread della simulazione
+    # ---------------------------
+    def _schedule_pending(self, now):
+        """Mette in coda gli SFC mutati che sono in lavorazione (con il lock del motore)"""
+        sfcs, pending, heap = self.state.sfcs, self._pending, self._heap
+        # Più mutazioni dello stesso SFC dall'ultimo controllo: basta una voce
+        mutated = set()
+        while pending:
+            mutated.add(pending.popleft())
+        for sfc_id in mutated:
+            sfc = sfcs.get(sfc_id)
+            if sfc is None or sfc.current < 0:
+                continue
+            due = now + self._cycle_time(sfc.routing, sfc.template, sfc.current)
+            heapq.heappush(heap, (due, next(self._seq), sfc_id, sfc.version))
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._running:
+                    return
+                now = self._now()
+                self._schedule_pending(now)
+                heap = self._heap
+                due = []
+                while heap and heap[0][0] <= now and len(due) < BATCH:
+                    due.append(heapq.heappop(heap))
+                arrivals = 0
+                while self._next_arrival <= now and arrivals < BATCH:
+                    arrivals += 1
+                    self._next_arrival += self._arrival_gap()
+                next_due = min(heap[0][0] if heap else math.inf, self._next_arrival)
+                speed = self.settings.speed
+            # Transizioni fuori dal lock del motore: il listener viene chiamato sotto il lock dello SFC
+            for _, _, sfc_id, version in due:
+                self._step(sfc_id, version)
+            for _ in range(arrivals):
+                self._arrive()
+            if len(due) == BATCH or arrivals == BATCH or self._pending:
+                continue
+            self._wakeup.wait(min(MAX_SLEEP, max(0.0, (next_due - now) / speed)))
+            self._wakeup.clear()
+
+    def _step(self, sfc_id, version):
+        state, counters = self.state, self.counters
+        sfc = state.sfcs.get(sfc_id)
+        if sfc is None or sfc.version != version or sfc.current < 0:
+            counters["stale"] += 1
+            return
+        current, n = sfc.current, len(sfc)
+        settings = self.settings
+        r = self._rng.random()
+        # La versione è ricontrollata da MESState sotto il lock dello SFC: se una richiesta
+        # API lo ha modificato dopo la lettura di current, la transizione non avviene (409)
+        if r < settings.rollback_rate and current >= 1:
+            _, status = state.rollback(sfc_id, self._rng.randint(1, current), version=version)
+            counters["rolled_back"] += status == 200
+        elif r < settings.rollback_rate + settings.bypass_rate and current + 2 <= n:
+            # Lo step successivo diventa in work, la corrente 'bypassed'
+            _, status = state.force_advance(sfc_id, current + 2, version=version)
+            counters["bypassed"] += status == 200
+        else:
+            body, status = state.advance(sfc_id, version=version)
+            counters["advanced"] += status == 200
+            counters["completed"] += status == 200 and body["sfc_state"] == "Done"
+        counters["stale"] += status == 409
+
+    def _arrive(self):
+        state = self.state
+        if not state.routing_ids:
+            return
+        sfc_id = state.create_sfc()
+        state.assign_routing(sfc_id, self._rng.choice(state.routing_ids))
+        self.counters["created"] += 1
@@ -0,0 +1,216 @@
+from array import array
+from functools import lru_cache
+import sys
+
+import mes_json
+
+# ---------------------------
+# Stati delle operazioni
+# ---------------------------
+# Ogni operazione di uno SFC occupa un solo byte: il codice è l'indice in OPERATION_STATES
+OPERATION_STATES = ["blank", "in work", "done", "bypassed"]
+BLANK, IN_WORK, DONE, BYPASSED = range(len(OPERATION_STATES))
+
+
+@lru_cache(maxsize=4096)
+def run_length(states):
+    """Stati delle operazioni in run-length: done, done, in work, blank -> "done*2,in work,blank".
+    Gli schemi possibili sono pochi (le transizioni producono blocchi contigui), quindi in cache.
+    """
+    runs = []
+    i, n = 0, len(states)
+    while i < n:
+        j = i + 1
+        while j < n and states[j] == states[i]:
+            j += 1
+        name = OPERATION_STATES[states[i]]
+        runs.append(name if j - i == 1 else f"{name}*{j - i}")
+        i = j
+    return ",".join(runs)
+
+
+# force_advance: le operazioni precedenti al target non 'done' diventano 'bypassed'
+_BYPASS_TABLE = bytes([BYPASSED, BYPASSED, DONE, BYPASSED]) + bytes(252)
+
+
+# ---------------------------
+# Routing templates
+# ---------------------------
+class RoutingTemplate:
+    """Definizione immutabile delle operazioni di un routing.
+
+    Il template è condiviso da tutti gli SFC a cui il routing è assegnato:
+    ogni SFC conserva solo i propri byte di stato.
+    """
+    __slots__ = ("ids", "descriptions", "_json")
+
+    def __init__(self, ids, descriptions):
+        self.ids = tuple(ids)
+        self.descriptions = tuple(sys.intern(d) for d in descriptions)
+        self._json = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def operations(self, states=None):
+        """Operazioni nel formato delle risposte JSON, sovrapponendo gli stati dello SFC"""
+        if states is None:
+            return [{"id": i, "description": d, "state": "blank"} for i, d in zip(self.ids, self.descriptions)]
+        return [
+            {"id": i, "description": d, "state": OPERATION_STATES[s]}
+            for i, d, s in zip(self.ids, self.descriptions, states)
+        ]
+
+    def operations_json(self):
+        """Operazioni (tutte 'blank') già serializzate: il template è immutabile, la cache è permanente"""
+        if self._json is None:
+            self._json = mes_json.dumps(self.operations())
+        return self._json
+
+
+# Registry dei template: routing con lo stesso numero di operazioni condividono la definizione
+_templates = {}
+
+
+def routing_template(n):
+    """Template con n operazioni 'Operation 1'..'Operation n'"""
+    template = _templates.get(n)
+    if template is None:
+        template = _templates.setdefault(
+            n, RoutingTemplate(range(1, n + 1), (f"Operation {i}" for i in range(1, n + 1)))
+        )
+    return template
+
+
+# ---------------------------
+# SFC
+# ---------------------------
+class SFCRecord:
+    """Stato compatto di uno SFC.
+
+    - states: un byte per operazione (codici di OPERATION_STATES)
+    - current: indice dell'operazione 'in work', -1 se nessuna
+    - counts: numero di operazioni per ciascuno stato
+    - pos: posizione dello SFC in ordine di creazione
+    - version: incrementata a ogni mutazione (invalida la risposta JSON in cache, ETag)
+    Le definizioni delle operazioni (id, description) non vengono copiate:
+    template punta al RoutingTemplate del routing assegnato.
+    """
+    __slots__ = ("routing", "template", "states", "current", "counts", "pos", "version")
+
+    def __init__(self, pos=-1):
+        self.pos = pos
+        self.version = 0
+        self.routing = None
+        self.template = None
+        self.states = bytearray()
+        self.current = -1
+        self.counts = array("I", (0, 0, 0, 0))
+
+    def __len__(self):
+        return len(self.states)
+
+    def _set(self, i, state):
+        counts = self.counts
+        counts[self.states[i]] -= 1
+        counts[state] += 1
+        self.states[i] = state
+
+    def _recount(self):
+        states = self.states
+        self.counts = array("I", (states.count(s) for s in range(len(OPERATION_STATES))))
+
+    def assign(self, routing_id, template):
+        """Assegna il routing: prima operazione 'in work', le altre 'blank'"""
+        n = len(template)
+        self.routing = routing_id
+        self.template = template
+        self.states = bytearray(n)
+        if n:
+            self.states[0] = IN_WORK
+            self.current = 0
+            self.counts = array("I", (n - 1, 1, 0, 0))
+        else:
+            self.current = -1
+            self.counts = array("I", (0, 0, 0, 0))
+
+    def restore(self, routing_id, template, states):
+        """Ripristina routing e stati (da snapshot): cursore e contatori sono ricalcolati"""
+        self.routing = routing_id
+        self.template = template
+        self.states = bytearray(states)
+        self.current = self.states.find(IN_WORK)
+        self._recount()
+
+    def clone(self):
+        """Copia indipendente dello SFC (stessi routing e stati), usata per generare dati in blocco"""
+        sfc = SFCRecord.__new__(SFCRecord)
+        sfc.pos = -1
+        sfc.version = 0
+        sfc.routing = self.routing
+        sfc.template = self.template
+        sfc.states = bytearray(self.states)
+        sfc.current = self.current
+        sfc.counts = array("I", self.counts)
+        return sfc
+
+    def advance(self):
+        """Completa l'operazione 'in work' e mette in 'in work' la successiva"""
+        i = self.current
+        if i < 0:
+            return
+        self._set(i, DONE)
+        if i + 1 < len(self.states):
+            self._set(i + 1, IN_WORK)
+            self.current = i + 1
+        else:
+            self.current = -1
+
+    def rollback(self, step):
+        """Operazioni prima dello step 'done', lo step 'in work', le successive 'blank'"""
+        n = len(self.states)
+        k = step - 1
+        self.states[:] = bytes((DONE,)) * k + bytes((IN_WORK,)) + bytes(n - step)
+        self.current = k
+        self.counts = array("I", (n - step, 1, k, 0))
+
+    def force_advance(self, step):
+        """Operazioni prima dello step 'bypassed' (se non 'done'), lo step 'in work', le successive 'blank'"""
+        n = len(self.states)
+        k = step - 1
+        self.states[:] = self.states[:k].translate(_BYPASS_TABLE) + bytes((IN_WORK,)) + bytes(n - step)
+        self.current = k
+        self._recount()
+
+    def rollback_single(self):
+        """La corrente torna 'blank', la precedente torna 'in work'.
+        Restituisce un messaggio di errore se il rollback non è possibile.
+        """
+        i = self.current
+        if i < 0:
+            return "No operation currently in work"
+        if i == 0:
+            return "Cannot rollback the first operation"
+        self._set(i, BLANK)
+        self._set(i - 1, IN_WORK)
+        self.current = i - 1
+        return None
+
+    def sfc_state(self):
+        counts = self.counts
+        if counts[DONE] == len(self.states):
+            return "Done"
+        elif counts[IN_WORK]:
+            return "In Work"
+        else:
+            return "New"
+
+    def runs(self):
+        """Stati delle operazioni in run-length (vista compatta)"""
+        return run_length(bytes(self.states))
+
+    def operations(self):
+        """Lista delle operazioni nel formato delle risposte JSON"""
+        if self.template is None:
+            return []
+        return self.template.operations(self.states)
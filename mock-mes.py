@@ -1,39 +1,218 @@
-from flask import Flask, jsonify, request
-import random
+from flask import Flask, Response, jsonify, request, stream_with_context
+from flask.json.provider import DefaultJSONProvider
+import inspect
+import os
+import signal
+import sys
+import threading
+import time
+from urllib.parse import quote
+
+import mes_json
+from mes_analytics import Analytics
+from mes_api import EVENT_STREAM, SSE_HEADERS, MESApi, error_reply
+from mes_backend import connect_state, is_shared
+from mes_capture import open_capture
+from mes_core import MESState
+from mes_faults import FaultInjector
+from mes_feed import ChangeFeed
+from mes_history import History
+from mes_metrics import CONTENT_TYPE, Metrics, hot_functions, profiler_enabled, sample_stacks
+from mes_persistence import bootstrap
+from mes_simulation import Simulation, SimulationSettings, simulation_enabled
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """jsonify e request.get_json tramite mes_json (orjson se installato)"""
+
+    def dumps(self, obj, **kwargs):
+        return mes_json.dumps(obj).decode()
+
+    def loads(self, s, **kwargs):
+        return mes_json.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        body = mes_json.dumps(obj, indent=self._app.debug) + b"\n"
+        return self._app.response_class(body, mimetype=self.mimetype)
+
 
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
 
 # ---------------------------
-# In-memory data storage
+# State backend
 # ---------------------------
-sfc_counter = 1
-sfcs = {}          # SFC ID -> dict con routing e stato
-routings = {}      # Routing ID -> lista di operazioni
-
-# Stati possibili per le operazioni
-OPERATION_STATES = ["blank", "in work", "done", "bypassed"]
+# In memoria nel processo, oppure condiviso tra i worker (MES_STATE_BACKEND=shared, vedi mes_backend)
+if is_shared():
+    state = connect_state()
+    feed = connect_state(typeid="ChangeFeed")
+    simulation = connect_state(typeid="Simulation")
+    analytics = connect_state(typeid="Analytics")
+    history = connect_state(typeid="History")
+else:
+    state = MESState()
+    feed = ChangeFeed(state)
+    simulation = Simulation(state, SimulationSettings.from_env())
+    analytics = Analytics(state)
+    history = History(state)
+
+# Profilo di fault (latenze, errori, banda) del processo: MES_FAULTS o POST /admin/faults
+faults = FaultInjector.from_env()
+
+api = MESApi(state, feed, simulation, analytics, history, faults)
 
 # ---------------------------
 # Helper Functions
 # ---------------------------
-def generate_operation(i):
-    return {
-        "id": i,
-        "description": f"Operation {i}",
-        "state": "blank"
-    }
-
-def create_routing(n):
-    return [generate_operation(i+1) for i in range(n)]
-
-def get_sfc_state(sfc):
-    ops = sfcs[sfc]["operations"]
-    if all(op["state"] == "done" for op in ops):
-        return "Done"
-    elif any(op["state"] == "in work" for op in ops):
-        return "In Work"
-    else:
-        return "New"
+def request_data():
+    """Body JSON della richiesta, {} se assente o non valido"""
+    data = request.get_json(silent=True)
+    return data if isinstance(data, dict) else {}
+
+def send(reply):
+    """Reply di mes_api -> risposta Flask"""
+    if reply.body is None:
+        return jsonify(reply.payload), reply.status, reply.headers
+    body = stream_with_context(reply.body) if reply.streaming else reply.body
+    return Response(body, status=reply.status, content_type=reply.content_type, headers=reply.headers)
+
+# ---------------------------
+# Thread trattenuti a lungo
+# ---------------------------
+# Gli stream SSE tengono occupato un thread per tutta la loro durata, salvo con il worker
+# gevent (default di gunicorn.conf.py), dove sono greenlet. Con MES_HELD_THREADS
+# (gunicorn.conf.py lo imposta a MES_THREADS - 1 per il worker gthread del backend shared)
+# ne possono restare occupati al massimo tanti: oltre si risponde 503, e almeno un thread
+# serve sempre le API. Senza limite con il dev server, che usa un thread per richiesta,
+# e con gevent.
+HELD_RETRY_AFTER = 5
+_held_threads = os.environ.get("MES_HELD_THREADS")
+held_slots = threading.BoundedSemaphore(int(_held_threads)) if _held_threads else None
+
+def hold_thread():
+    """Riserva uno dei thread trattenibili; False se sono tutti occupati"""
+    return held_slots is None or held_slots.acquire(blocking=False)
+
+def release_thread():
+    if held_slots is not None:
+        held_slots.release()
+
+def busy_reply(message):
+    reply = error_reply(message, 503)
+    reply.headers["Retry-After"] = str(HELD_RETRY_AFTER)
+    return reply
+
+
+class HeldStream:
+    """Body di /events: alla chiusura della risposta (fine stream o disconnessione)
+    libera il thread riservato e la sottoscrizione, anche se lo stream non è mai partito
+    """
+
+    def __init__(self, sub_id):
+        self.sub_id = sub_id
+        self.body = api.event_stream(sub_id)
+        self.closed = False
+
+    def __iter__(self):
+        return self.body
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        if inspect.getgeneratorstate(self.body) == inspect.GEN_CREATED:
+            feed.unsubscribe(self.sub_id)
+        self.body.close()
+        release_thread()
+
+
+class ThrottledBody:
+    """Body inviato a banda limitata: alla chiusura della risposta chiude anche il body originale"""
+
+    def __init__(self, chunks, bandwidth):
+        self.chunks = chunks
+        self.body = throttled(chunks, bandwidth)
+        self.closed = False
+
+    def __iter__(self):
+        return self.body
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.body.close()
+        if hasattr(self.chunks, "close"):
+            self.chunks.close()
+
+# ---------------------------
+# Strumentazione
+# ---------------------------
+metrics = Metrics()
+# Cattura del traffico per bench/replay.py (MES_CAPTURE=<file>, vedi mes_capture)
+capture = open_capture()
+
+@app.before_request
+def start_timer():
+    request.environ["mes.start"] = time.perf_counter()
+    metrics.active.add(threading.get_ident())
+
+@app.before_request
+def inject_fault():
+    """Ritardo ed errore estratti dal profilo di fault (vedi mes_faults).
+    Con il worker gevent time.sleep cede il controllo agli altri greenlet: attesa e invio
+    a banda limitata non occupano thread. Con il dev server e il worker gthread (backend
+    shared) occupano il thread della richiesta.
+    """
+    rule = request.url_rule
+    fault = faults.plan(request.method, rule.rule) if rule is not None else None
+    if fault is None:
+        return None
+    request.environ["mes.fault"] = fault
+    if fault.delay:
+        time.sleep(fault.delay)
+    if fault.status is not None:
+        return send(error_reply(fault.message, fault.status))
+    return None
+
+@app.after_request
+def record_request(response):
+    """Registra latenza e dimensione della risposta (chiamato anche per le risposte di errore)"""
+    metrics.active.discard(threading.get_ident())
+    start = request.environ.get("mes.start")
+    if start is not None:
+        rule = request.url_rule
+        # content_length è None per le risposte in streaming (NDJSON)
+        seconds = time.perf_counter() - start
+        metrics.observe(request.method, rule.rule if rule else "<unmatched>", response.status_code,
+                        seconds, response.content_length)
+        if capture is not None and request.path != "/events":
+            capture_request(response, seconds)
+    fault = request.environ.get("mes.fault")
+    if fault is not None and fault.bandwidth:
+        body = response.response if response.is_streamed else [response.get_data()]
+        response.response = ThrottledBody(body, fault.bandwidth)
+    return response
+
+def throttled(chunks, bandwidth):
+    """Body inviato a bandwidth byte/s: pezzi da 1/10 di secondo seguiti da una pausa"""
+    step = max(1, int(bandwidth // 10))
+    for data in chunks:
+        data = data.encode() if isinstance(data, str) else data
+        for i in range(0, len(data), step):
+            piece = data[i:i + step]
+            yield piece
+            time.sleep(len(piece) / bandwidth)
+
+def capture_request(response, seconds):
+    """Accoda la richiesta al file di cattura (le risposte in streaming senza body né digest)"""
+    query = request.query_string.decode()
+    target = quote(request.path) + ("?" + query if query else "")
+    streamed = response.is_streamed
+    capture.record(request.method, target, request.get_data(), time.time() - seconds, seconds,
+                   response.status_code, None if streamed else response.get_data(),
+                   json_response=response.mimetype == "application/json")
 
 # ---------------------------
 # API Endpoints
@@ -41,117 +220,41 @@ def get_sfc_state(sfc):
 
 @app.route("/sfc", methods=["POST"])
 def create_sfc():
-    """Crea un nuovo SFC"""
-    global sfc_counter
-    sfc_id = f"SFCMOCK{sfc_counter}"
-    sfc_counter += 1
-    sfcs[sfc_id] = {
-        "routing": None,
-        "operations": [],
-    }
-    return jsonify({"sfc_id": sfc_id})
+    """Crea un nuovo SFC (con {"sfc_id": ...} usa l'ID indicato: lo assegna il router degli shard)"""
+    return send(api.create_sfc(request_data()))
 
 @app.route("/routing", methods=["POST"])
 def create_routing_endpoint():
-    """Crea un nuovo routing"""
-    data = request.json
-    n = data.get("operations", random.randint(1, 15))
-    routing_id = f"ROUTING{len(routings)+1}"
-    routings[routing_id] = create_routing(n)
-    return jsonify({"routing_id": routing_id, "operations": routings[routing_id]})
+    """Crea un nuovo routing (con "routing_id" usa l'ID indicato: lo assegna il router degli shard)"""
+    return send(api.create_routing(request.json))
 
 @app.route("/sfc/<sfc_id>/assign_routing", methods=["POST"])
 def assign_routing(sfc_id):
     """Assegna un routing a uno SFC"""
-    data = request.json
-    routing_id = data.get("routing_id")
-    if sfc_id not in sfcs:
-        return jsonify({"error": "SFC not found"}), 404
-    if routing_id not in routings:
-        return jsonify({"error": "Routing not found"}), 404
-    sfcs[sfc_id]["routing"] = routing_id
-    sfcs[sfc_id]["operations"] = [op.copy() for op in routings[routing_id]]
-    if sfcs[sfc_id]["operations"]:
-        sfcs[sfc_id]["operations"][0]["state"] = "in work"
-    return jsonify({"sfc_id": sfc_id, "routing": routing_id, "operations": sfcs[sfc_id]["operations"]})
+    return send(api.assign_routing(sfc_id, request_data()))
 
 @app.route("/sfc/<sfc_id>/advance", methods=["POST"])
 def advance_operation(sfc_id):
     """Avanza l'SFC di una operazione"""
-    if sfc_id not in sfcs:
-        return jsonify({"error": "SFC not found"}), 404
-    operations = sfcs[sfc_id]["operations"]
-    for i, op in enumerate(operations):
-        if op["state"] == "in work":
-            op["state"] = "done"
-            if i+1 < len(operations):
-                operations[i+1]["state"] = "in work"
-            break
-    return jsonify({"sfc_id": sfc_id, "operations": operations, "sfc_state": get_sfc_state(sfc_id)})
+    return send(api.transition("advance", sfc_id, request_data()))
 
 @app.route("/sfc/<sfc_id>/rollback", methods=["POST"])
 def rollback_operation(sfc_id):
     """Rollback SFC a uno step specifico.
     Input JSON: {"step": n} dove n è l'indice dell'operazione a cui riportare lo SFC
     """
-    if sfc_id not in sfcs:
-        return jsonify({"error": "SFC not found"}), 404
-    data = request.json
-    target_step = data.get("step")
-    if target_step is None:
-        return jsonify({"error": "Step not provided"}), 400
-    operations = sfcs[sfc_id]["operations"]
-    # Controllo validità step
-    if not isinstance(target_step, int) or target_step < 1 or target_step > len(operations):
-        return jsonify({"error": "Invalid step"}), 400
-    # Aggiorna stati delle operazioni
-    for i, op in enumerate(operations):
-        if i < target_step - 1:
-            op["state"] = "done"
-        elif i == target_step - 1:
-            op["state"] = "in work"
-        else:
-            op["state"] = "blank"
-    return jsonify({
-        "sfc_id": sfc_id,
-        "operations": operations,
-        "sfc_state": get_sfc_state(sfc_id)
-    })
+    return send(api.transition("rollback", sfc_id, request_data()))
 
 
 @app.route("/sfc/<sfc_id>/force_advance", methods=["POST"])
 def force_advance(sfc_id):
     """Avanzamento forzato SFC a uno step specifico.
-    Le operazioni precedenti allo step target diventano 'bypassed' 
+    Le operazioni precedenti allo step target diventano 'bypassed'
     solo se erano 'blank' o 'in work'. Le operazioni già 'done' rimangono in 'done'.
     Lo step target diventa 'in work'. Le successive rimangono 'blank'.
     Input JSON: {"step": n}
     """
-    if sfc_id not in sfcs:
-        return jsonify({"error": "SFC not found"}), 404
-
-    data = request.json
-    target_step = data.get("step")
-    operations = sfcs[sfc_id]["operations"]
-
-    if not isinstance(target_step, int) or target_step < 1 or target_step > len(operations):
-        return jsonify({"error": "Invalid step"}), 400
-
-    for i, op in enumerate(operations):
-        if i < target_step - 1:
-            if op["state"] in ["blank", "in work"]:
-                op["state"] = "bypassed"
-            # se era done rimane done
-        elif i == target_step - 1:
-            op["state"] = "in work"
-        else:
-            op["state"] = "blank"
-
-    return jsonify({
-        "sfc_id": sfc_id,
-        "operations": operations,
-        "sfc_state": get_sfc_state(sfc_id)
-    })
+    return send(api.transition("force_advance", sfc_id, request_data()))
 
 @app.route("/sfc/<sfc_id>/rollback_single", methods=["POST"])
 def rollback_single_operation(sfc_id):
@@ -159,121 +262,244 @@ def rollback_single_operation(sfc_id):
     La corrente diventa 'blank', la precedente (che era 'done') diventa 'in work'.
     Non è possibile fare rollback se la corrente è la prima operazione.
     """
-    if sfc_id not in sfcs:
-        return jsonify({"error": "SFC not found"}), 404
-
-    operations = sfcs[sfc_id]["operations"]
-
-    # Trova l'operazione corrente in work
-    current_idx = None
-    for i, op in enumerate(operations):
-        if op["state"] == "in work":
-            current_idx = i
-            break
-
-    if current_idx is None:
-        return jsonify({"error": "No operation currently in work"}), 400
-
-    if current_idx == 0:
-        return jsonify({"error": "Cannot rollback the first operation"}), 400
-
-    # Imposta corrente a blank
-    operations[current_idx]["state"] = "blank"
-    # Imposta la precedente (che era done) a in work
-    operations[current_idx - 1]["state"] = "in work"
-
-    return jsonify({
-        "sfc_id": sfc_id,
-        "operations": operations,
-        "sfc_state": get_sfc_state(sfc_id)
-    })
+    return send(api.transition("rollback_single", sfc_id, request_data()))
 
 
 @app.route("/sfc/<sfc_id>/complete", methods=["POST"])
 def complete_operation(sfc_id):
     """Completa l'operazione corrente dello SFC"""
-    operations = sfcs[sfc_id]["operations"]
-    for i, op in enumerate(operations):
-        if op["state"] == "in work":
-            op["state"] = "done"
-            if i+1 < len(operations):
-                operations[i+1]["state"] = "in work"
-            break
-    return jsonify({"sfc_id": sfc_id, "operations": operations, "sfc_state": get_sfc_state(sfc_id)})
+    return send(api.transition("complete", sfc_id, request_data()))
+
+# ---------------------------
+# API bulk
+# ---------------------------
+@app.route("/bulk/sfc", methods=["POST"])
+def bulk_create_sfcs():
+    """Crea più SFC in una sola richiesta, assegnando opzionalmente un routing.
+    Input JSON: {"count": k, "routing_id": "ROUTING1"}
+    """
+    return send(api.bulk_create(request_data()))
+
+@app.route("/bulk/assign_routing", methods=["POST"])
+def bulk_assign_routing():
+    """Assegna lo stesso routing a una lista di SFC.
+    Input JSON: {"routing_id": "ROUTING1", "sfc_ids": ["SFCMOCK1", ...]}
+    """
+    return send(api.bulk_assign_routing(request_data()))
+
+@app.route("/bulk/<action>", methods=["POST"])
+def bulk_transition(action):
+    """Applica una transizione (advance, complete, force_advance, rollback, rollback_single) a una lista di SFC.
+    Input JSON: {"sfc_ids": ["SFCMOCK1", ...], "step": n}
+    oppure, con step diversi per SFC: {"items": [{"sfc_id": "SFCMOCK1", "step": n}, ...]}
+    oppure sugli SFC selezionati: {"routing": "ROUTING1", "sfc_state": "In Work", "step": n, "limit": k, "cursor": c}
+    (la risposta riporta next_cursor). Con "view": "compact" i risultati hanno sfc_state e step al posto delle operazioni
+    """
+    return send(api.bulk_transition(action, request_data()))
 
 @app.route("/sfc/<sfc_id>", methods=["GET"])
 def get_sfc(sfc_id):
-    """Stato completo dello SFC"""
-    if sfc_id not in sfcs:
-        return jsonify({"error": "SFC not found"}), 404
-    return jsonify({
-        "sfc_id": sfc_id,
-        "routing": sfcs[sfc_id]["routing"],
-        "operations": sfcs[sfc_id]["operations"],
-        "sfc_state": get_sfc_state(sfc_id)
-    })
+    """Stato completo dello SFC (JSON in cache finché lo SFC non cambia, con ETag e 304).
+    Con ?view=compact: routing, sfc_state, step in work e stati delle operazioni in run-length
+    """
+    return send(api.get_sfc(sfc_id, request.if_none_match, request.args))
 
 @app.route("/sfc/<sfc_id>/routing_state", methods=["GET"])
 def get_routing_state(sfc_id):
     """Stato del routing di uno SFC"""
-    if sfc_id not in sfcs:
-        return jsonify({"error": "SFC not found"}), 404
-    operations = sfcs[sfc_id]["operations"]
-    return jsonify({
-        "sfc_id": sfc_id,
-        "routing": sfcs[sfc_id]["routing"],
-        "operations": [{"id": op["id"], "description": op["description"], "state": op["state"]} for op in operations],
-        "sfc_state": get_sfc_state(sfc_id)
-    })
+    return send(api.get_sfc(sfc_id, request.if_none_match, request.args))
 
 # ---------------------------
 # API per ottenere tutti gli SFC
 # ---------------------------
 @app.route("/sfcs", methods=["GET"])
 def get_all_sfcs():
-    """Restituisce tutti gli SFC presenti nel sistema"""
-    all_sfcs = {}
-    for sfc_id, data in sfcs.items():
-        all_sfcs[sfc_id] = {
-            "routing": data["routing"],
-            "operations": data["operations"],
-            "sfc_state": get_sfc_state(sfc_id)
-        }
-    return jsonify(all_sfcs)
+    """Restituisce gli SFC presenti nel sistema.
+    Query string opzionale:
+    - sfc_state (o state), routing: filtri, risolti sugli indici secondari
+    - fields: campi da restituire (es. fields=routing,sfc_state; anche step e ops della vista compatta)
+    - view=compact: per ogni SFC routing, sfc_state, step in work e stati delle operazioni
+      in run-length ("done*3,in work,blank*4") al posto della lista delle operazioni
+    - limit, cursor: paginazione; la risposta diventa {"sfcs": {...}, "next_cursor": ...}
+    - format=ndjson: streaming di una riga JSON per SFC
+    """
+    return send(api.list_sfcs(request.args))
+
+@app.route("/routings/<routing_id>/sfcs", methods=["GET"])
+def get_routing_sfcs(routing_id):
+    """SFC a cui è assegnato il routing (stessi parametri di /sfcs)"""
+    return send(api.list_sfcs(request.args, routing_id))
+
+@app.route("/sfcs/summary", methods=["GET"])
+def get_sfcs_summary():
+    """Numero di SFC per stato e per routing, senza elencarli (?routing= per un solo routing)"""
+    return send(api.summary(request.args))
+
+@app.route("/routings/<routing_id>/summary", methods=["GET"])
+def get_routing_summary(routing_id):
+    """Numero di SFC del routing per stato"""
+    return send(api.summary(request.args, routing_id))
+
+@app.route("/sfc/<sfc_id>/history", methods=["GET"])
+def get_sfc_history(sfc_id):
+    """Ultime transizioni dello SFC (?since=&until= in secondi epoch, ?limit=)"""
+    return send(api.sfc_history(sfc_id, request.args))
+
+@app.route("/history", methods=["GET"])
+def get_history():
+    """Transizioni di tutti gli SFC in ordine di tempo (?since=&until=&limit=&cursor=)"""
+    return send(api.history_events(request.args))
+
+@app.route("/analytics", methods=["GET"])
+def get_analytics():
+    """WIP e tempo medio in work per operazione di ogni routing"""
+    return send(api.analytics_overview())
+
+@app.route("/analytics/routings/<routing_id>", methods=["GET"])
+def get_routing_analytics(routing_id):
+    """Conteggi per stato e tempi di ciclo (quantili) per operazione del routing"""
+    return send(api.analytics_routing(routing_id))
 
 # ---------------------------
 # API per ottenere tutti i routing
 # ---------------------------
 @app.route("/routings", methods=["GET"])
 def get_all_routings():
-    """Restituisce tutti i routing presenti nel sistema"""
-    all_routings = {}
-    for routing_id, operations in routings.items():
-        all_routings[routing_id] = operations
-    return jsonify(all_routings)
+    """Restituisce i routing presenti nel sistema.
+    Supporta limit/cursor e format=ndjson come /sfcs; con view=compact
+    restituisce solo il numero di operazioni di ogni routing.
+    """
+    return send(api.list_routings(request.args))
+
+# ---------------------------
+# Feed delle modifiche (Server-Sent Events)
+# ---------------------------
+@app.route("/events", methods=["GET"])
+def events():
+    """Stream SSE delle mutazioni degli SFC, man mano che avvengono.
+    Tipi di evento: sfc_created, routing_assigned, operation_changed, sfc_state_changed.
+    Query string opzionale:
+    - sfc_id, routing, sfc_state (o state): filtri (in AND); sfc_state seleziona gli SFC
+      che entrano o escono dallo stato
+    - types: tipi di evento da ricevere, separati da virgola
+    - queue, policy: dimensione della coda del client e politica di overflow
+      (drop_oldest, drop_newest, disconnect)
+    L'header Last-Event-ID (o ?last_event_id=) riprende dagli eventi persi durante una disconnessione.
+    Con il worker gthread ogni stream occupa un thread: oltre MES_HELD_THREADS stream aperti
+    risponde 503 con Retry-After (con gevent nessun limite).
+    """
+    if not hold_thread():
+        return send(busy_reply("Too many event streams"))
+    sub_id, error = api.subscribe(request.args, request.headers.get("Last-Event-ID"))
+    if error is not None:
+        release_thread()
+        return send(error)
+    return Response(HeldStream(sub_id), content_type=EVENT_STREAM, headers=SSE_HEADERS)
 
 # ---------------------------
-# Generate random data
+# Simulazione della produzione
 # ---------------------------
-def generate_mock_data(num_routings=3, num_sfcs=5):
-    global sfc_counter
-    for i in range(num_routings):
-        routing_id = f"ROUTING{i+1}"
-        routings[routing_id] = create_routing(random.randint(5, 10))
-    for i in range(num_sfcs):
-        sfc_id = f"SFCMOCK{sfc_counter}"
-        sfc_counter += 1
-        routing_id = random.choice(list(routings.keys()))
-        sfcs[sfc_id] = {
-            "routing": routing_id,
-            "operations": [op.copy() for op in routings[routing_id]]
-        }
-        sfcs[sfc_id]["operations"][0]["state"] = "in work"
-
-generate_mock_data()
+@app.route("/simulation", methods=["GET"])
+def simulation_status():
+    """Stato della simulazione: in corso, tempo simulato, SFC in coda, ritardo, contatori"""
+    return send(api.simulation_status())
+
+@app.route("/simulation/start", methods=["POST"])
+def simulation_start():
+    """Avvia la simulazione che avanza da sola gli SFC in lavorazione.
+    Input JSON opzionale: {"speed": 10, "cycle_time": "exp:60", "rollback_rate": 0.02,
+    "bypass_rate": 0.01, "arrival_rate": 0.5, "seed": 42} (vedi mes_simulation)
+    """
+    return send(api.simulation_start(request_data()))
+
+@app.route("/simulation/stop", methods=["POST"])
+def simulation_stop():
+    """Ferma la simulazione"""
+    return send(api.simulation_stop())
+
+@app.route("/simulation/speed", methods=["POST"])
+def simulation_speed():
+    """Cambia la velocità (secondi simulati per secondo reale) anche a simulazione in corso.
+    Input JSON: {"speed": 10}
+    """
+    return send(api.simulation_speed(request_data()))
+
+# ---------------------------
+# Fault injection
+# ---------------------------
+@app.route("/admin/faults", methods=["GET"])
+def get_faults():
+    """Profilo di fault del processo con i contatori di ogni regola"""
+    return send(api.faults_status())
+
+@app.route("/admin/faults", methods=["POST"])
+def set_faults():
+    """Sostituisce il profilo di fault. Input JSON: {"seed": 42, "rules": [{"endpoint":
+    "POST /sfc/<sfc_id>/*", "latency": "lognormal:40,0.5", "error_rate": 0.02, "error_status":
+    [500, 503], "timeout_rate": 0.01, "timeout": 30, "bandwidth": 65536}]} (vedi mes_faults);
+    {"rules": []} lo disattiva
+    """
+    return send(api.faults_configure(request.json))
+
+# ---------------------------
+# Metriche e profiler
+# ---------------------------
+@app.route("/metrics", methods=["GET"])
+def get_metrics():
+    """Metriche in formato Prometheus: latenze e dimensioni delle risposte per endpoint,
+    SFC per stato, routing, memoria dello store (per processo)
+    """
+    return Response(metrics.render(state.stats()), content_type=CONTENT_TYPE)
+
+@app.route("/debug/profile", methods=["GET"])
+def profile():
+    """Profiler a campionamento (solo con MES_PROFILER=1): campiona per ?seconds= (default 5)
+    gli stack dei thread che servono richieste ogni ?interval= ms (default 5).
+    Restituisce le funzioni più calde, oppure gli stack collassati con ?format=collapsed (flamegraph).
+    """
+    if not profiler_enabled():
+        return jsonify({"error": "Profiler disabled (set MES_PROFILER=1)"}), 404
+    try:
+        seconds = min(float(request.args.get("seconds", 5)), 60)
+        interval = max(float(request.args.get("interval", 5)), 1) / 1000
+    except ValueError:
+        return jsonify({"error": "Invalid seconds or interval"}), 400
+    stacks = sample_stacks(seconds, interval, threads=metrics.active)
+    if request.args.get("format") == "collapsed":
+        body = "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+        return Response(body, mimetype="text/plain")
+    return jsonify({
+        "samples": sum(stacks.values()),
+        "functions": [
+            {"function": name, "self": own, "total": total}
+            for name, own, total in hot_functions(stacks)
+        ],
+    })
+
+# ---------------------------
+# Startup: ripristino da disco (MES_DATA_DIR) o dati mock
+# ---------------------------
+persistence = None
+
+def init_state():
+    """Popola lo stato all'avvio del server, non all'import del modulo
+    (con gunicorn dal hook post_worker_init). Con il backend condiviso
+    se ne occupa il server di stato.
+    """
+    global persistence
+    if not is_shared() and persistence is None and not state.sfc_ids and not state.routing_ids:
+        persistence = bootstrap(state)
+        analytics.rebuild()
+        history.reset()
+        if simulation_enabled():
+            simulation.start()
 
 # ---------------------------
 # Run Server
 # ---------------------------
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=80, debug=True)
+    # Dev server di Flask; in produzione usare gunicorn (vedi gunicorn.conf.py)
+    # SIGTERM chiude il dev server in modo ordinato: gli hook atexit scrivono persistenza e cattura
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    init_state()
+    app.run(host="0.0.0.0", port=int(os.environ.get("PORT", 80)), debug=os.environ.get("MES_DEBUG") == "1")